@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -67,6 +68,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -129,6 +131,45 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The change version counters (intelligence/versions.py) must be shared by every worker:
+# set DOSSIER_REDIS_URL (e.g. redis://127.0.0.1:6379/1) wherever several processes serve requests.
+# Without it the cache is per process, and everything keyed on the counters (conditional GET,
+# dashboard snapshots, the cached question catalog) is bypassed unless DOSSIER_SINGLE_PROCESS=1
+# declares that one process serves every request (runserver).
+
+DOSSIER_REDIS_URL = os.environ.get('DOSSIER_REDIS_URL')
+
+if DOSSIER_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': DOSSIER_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'dossier-default',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+DOSSIER_SINGLE_PROCESS = os.environ.get('DOSSIER_SINGLE_PROCESS') == '1'
+DOSSIER_CACHE_ALIAS = 'default'             # Version counters (intelligence/versions.py)
+DASHBOARD_SNAPSHOT_CACHE_ALIAS = 'default'  # Dashboard snapshots (core/snapshots.py)
+DASHBOARD_SNAPSHOT_TIMEOUT = 60 * 5
+
+
+# Query budgets
+# core.middleware.QueryBudgetMiddleware logs a warning ('dossier.queries') when a view
+# issues more queries than its budget. Keys are URL names; unlisted views are only measured.
+
+QUERY_BUDGETS = {}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -0,0 +1,54 @@
+"""
+Conditional GET for the polled JSON APIs.
+
+versioned_get(version_keys) wraps a view's get(): the ETag hashes the user,
+the full request path (query string included) and the change versions
+(intelligence.versions) named by version_keys(request), and Last-Modified is
+the latest bump of those versions. Both come from the cache alone, so a poll
+whose If-None-Match still matches gets a 304 without running the view: no
+ORM work beyond the session lookup of the login check.
+
+Unless the versions are shared by every worker (versions_shared()), the view
+runs unconditionally: another worker's counter could still match an ETag
+whose data has changed.
+"""
+import datetime
+import hashlib
+from functools import wraps
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from intelligence.versions import get_last_modified, get_versions, versions_shared
+
+
+def versioned_get(version_keys):
+    """
+    @method_decorator(versioned_get(lambda request: [user_version_key(request.user.pk)]))
+    def get(self, request): ...
+    """
+    def decorator(view):
+        def keys(request):
+            if not hasattr(request, '_version_keys'):
+                request._version_keys = version_keys(request)
+            return request._version_keys
+
+        def etag(request, *args, **kwargs):
+            user = request.user
+            parts = [user.pk, getattr(user, 'role', ''), request.get_full_path(), *get_versions(keys(request))]
+            return hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+
+        def last_modified(request, *args, **kwargs):
+            stamp = get_last_modified(keys(request))
+            return datetime.datetime.fromtimestamp(stamp, tz=datetime.timezone.utc) if stamp else None
+
+        conditional = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = (conditional if versions_shared() else view)(request, *args, **kwargs)
+            # Revalidate on every poll rather than reuse a heuristically fresh copy
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
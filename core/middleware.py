@@ -1,5 +1,12 @@
 
+import heapq
+import logging
 import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
 
 class MobileDetectionMiddleware:
     def __init__(self, get_response):
@@ -11,3 +18,109 @@ class MobileDetectionMiddleware:
         request.is_mobile = bool(self.mobile_pattern.search(user_agent))
         response = self.get_response(request)
         return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Records the SQL issued while handling each request (count, total time and
+    the slowest statements) and aggregates it per resolved view name.
+
+    * DEBUG: adds X-Query-* response headers for the current request.
+    * QUERY_BUDGETS (settings, {view_name: max_queries}): logs a warning on
+      the 'dossier.queries' logger when a view goes over its budget.
+    * query_stats() returns the per-view aggregates of this process.
+    """
+    SLOWEST_KEPT = 5
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        view_name = _view_name(request)
+        _record(view_name, recorder, self.SLOWEST_KEPT)
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+        if budget is not None and recorder.count > budget:
+            query_logger.warning(
+                'Query budget exceeded for %s: %d queries (budget %d), %.1f ms SQL',
+                view_name, recorder.count, budget, recorder.total_ms
+            )
+
+        if settings.DEBUG:
+            response['X-Query-View'] = view_name
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.total_ms:.1f}'
+            slowest = recorder.slowest(1)
+            if slowest:
+                response['X-Query-Slowest-Ms'] = f'{slowest[0][0]:.1f}'
+        return response
+
+
+class QueryRecorder:
+    """connection.execute_wrapper callable timing every statement."""
+
+    def __init__(self):
+        self.queries = [] # (duration_ms, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(((time.perf_counter() - start) * 1000, sql))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(duration for duration, _ in self.queries)
+
+    def slowest(self, n):
+        return heapq.nlargest(n, self.queries, key=lambda q: q[0])
+
+
+query_logger = logging.getLogger('dossier.queries')
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name
+
+
+def _record(view_name, recorder, slowest_kept):
+    with _stats_lock:
+        entry = _stats.setdefault(view_name, {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'sql_ms': 0.0, 'slowest': [],
+        })
+        entry['requests'] += 1
+        entry['queries'] += recorder.count
+        entry['max_queries'] = max(entry['max_queries'], recorder.count)
+        entry['sql_ms'] += recorder.total_ms
+        entry['slowest'] = heapq.nlargest(
+            slowest_kept, entry['slowest'] + recorder.slowest(slowest_kept), key=lambda q: q[0]
+        )
+
+
+def query_stats():
+    """Per-view aggregates: {view_name: {requests, queries, max_queries, sql_ms, avg_queries, slowest}}."""
+    with _stats_lock:
+        result = {}
+        for view_name, entry in _stats.items():
+            result[view_name] = dict(entry, slowest=list(entry['slowest']), avg_queries=entry['queries'] / entry['requests'])
+        return result
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,157 @@
+"""
+Keyset (seek) pagination.
+
+Instead of OFFSET, each page continues strictly after the sort key of the last
+row of the previous page, so every page costs the same regardless of depth.
+The position is handed to clients as an opaque, URL-safe cursor.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+CURSOR_VALUE_TYPES = (int, float, str, bool, type(None))
+
+
+class Key:
+    """
+    One column of a keyset ordering. nullable=False (NOT NULL columns) leaves
+    out the NULLS FIRST / LAST clause, so an index on the columns can serve
+    the ordering.
+    """
+
+    def __init__(self, field, descending=False, nulls_last=False, parse=None, attr=None, nullable=True):
+        self.field = field
+        self.descending = descending
+        self.nulls_last = nulls_last
+        self.parse = parse
+        self.attr = attr or field
+        self.nullable = nullable
+
+    def order_by(self):
+        if not self.nullable:
+            return F(self.field).desc() if self.descending else F(self.field).asc()
+        nulls = {'nulls_last': True} if self.nulls_last else {'nulls_first': True}
+        if self.descending:
+            return F(self.field).desc(**nulls)
+        return F(self.field).asc(**nulls)
+
+    def equals(self, value):
+        if value is None:
+            return Q(**{f'{self.field}__isnull': True})
+        return Q(**{self.field: value})
+
+    def after(self, value):
+        """Rows whose value for this key sorts strictly after `value`."""
+        if value is None:
+            # Nothing sorts after trailing NULLs; everything non-NULL sorts after leading NULLs
+            return Q(pk__in=[]) if self.nulls_last else Q(**{f'{self.field}__isnull': False})
+        lookup = 'lt' if self.descending else 'gt'
+        q = Q(**{f'{self.field}__{lookup}': value})
+        if self.nulls_last:
+            q |= Q(**{f'{self.field}__isnull': True})
+        return q
+
+    def dump(self, obj):
+        value = getattr(obj, self.attr)
+        if value is None or isinstance(value, (int, float, str, bool)):
+            return value
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    def load(self, value):
+        if value is None or self.parse is None:
+            return value
+        return self.parse(value)
+
+
+def seek_filter(keys, values):
+    """Q selecting the rows strictly after `values` in the ordering defined by keys."""
+    condition = Q(pk__in=[])
+    prefix = Q()
+    for key, value in zip(keys, values):
+        condition |= prefix & key.after(value)
+        prefix &= key.equals(value)
+    first, value = keys[0], values[0]
+    if not first.nullable and value is not None:
+        # Redundant range on the leading key: lets an index seek to the position instead of scanning up to it
+        condition &= Q(**{f'{first.field}__{"lte" if first.descending else "gte"}': value})
+    return condition
+
+
+def encode_cursor(namespace, values):
+    raw = json.dumps([namespace, values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, namespace):
+    """Values stored in cursor, or None if it is malformed, tampered with or from another ordering."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        stored_namespace, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if stored_namespace != namespace or not isinstance(values, list):
+        return None
+    if not all(isinstance(value, CURSOR_VALUE_TYPES) for value in values):
+        return None
+    return values
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    paginator = KeysetPaginator(queryset, keys, per_page=30, namespace='last_contact')
+    page = paginator.page(request.GET.get('cursor'))
+    """
+
+    def __init__(self, queryset, keys, per_page=30, namespace=''):
+        self.queryset = queryset
+        self.keys = keys
+        self.per_page = per_page
+        self.namespace = namespace
+
+    def ordered(self):
+        return self.queryset.order_by(*[k.order_by() for k in self.keys])
+
+    def seek(self, cursor=None):
+        """The ordered queryset from the position after cursor (from the start if it is missing or invalid)."""
+        qs = self.ordered()
+        values = decode_cursor(cursor, self.namespace)
+        if values is not None and len(values) == len(self.keys):
+            try:
+                # Values the columns cannot take (a forged cursor) fail here, while the filter is built
+                qs = qs.filter(seek_filter(self.keys, [k.load(v) for k, v in zip(self.keys, values)]))
+            except (ValueError, TypeError, ValidationError):
+                pass
+        return qs
+
+    def cursor_after(self, obj):
+        return encode_cursor(self.namespace, [k.dump(obj) for k in self.keys])
+
+    def page(self, cursor=None):
+        rows = list(self.seek(cursor)[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.cursor_after(rows[-1])
+        return KeysetPage(rows, next_cursor)
@@ -0,0 +1,41 @@
+"""
+Per-user read snapshots.
+
+A snapshot is a picklable dict built by a view helper and stored in the cache
+alias configured by DASHBOARD_SNAPSHOT_CACHE_ALIAS. Keys embed the user's change
+version (intelligence.versions), so any write to that user's data makes the old
+snapshot unreachable; repeat loads in between cost only cache reads. That
+needs the versions of every worker to agree: unless versions_shared(), each
+load builds afresh, since a worker with an old counter would keep serving a
+stale snapshot until it times out.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from intelligence.versions import get_user_version, versions_shared
+
+
+def snapshot_cache():
+    return caches[getattr(settings, 'DASHBOARD_SNAPSHOT_CACHE_ALIAS', 'default')]
+
+
+def snapshot_key(name, user_id, *parts):
+    version = get_user_version(user_id)
+    suffix = ':'.join(str(p) for p in parts)
+    return f'snapshot:{name}:{user_id}:v{version}:{suffix}'
+
+
+def get_user_snapshot(name, user, builder, *parts, timeout=None):
+    """Return the cached snapshot `name` for user, building it with builder() on a miss."""
+    if not versions_shared():
+        return builder()
+    if timeout is None:
+        timeout = getattr(settings, 'DASHBOARD_SNAPSHOT_TIMEOUT', 300)
+
+    cache = snapshot_cache()
+    key = snapshot_key(name, user.pk, *parts)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = builder()
+        cache.set(key, snapshot, timeout)
+    return snapshot
@@ -0,0 +1,66 @@
+"""
+Test helpers.
+
+QueryBudgetTestMixin.assertConstantQueries() fails when the number of queries
+an endpoint issues grows with the amount of data (N+1 regressions):
+
+    class TargetListQueryTests(QueryBudgetTestMixin, TestCase):
+        def test_target_list(self):
+            self.assertConstantQueries(
+                grow=lambda n: make_targets(self.user, n),
+                request=lambda: self.client.get('/targets/'),
+                sizes=(1, 10),
+            )
+"""
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def reset_caches():
+    """Start from cold caches so every measurement takes the same path."""
+    from intelligence import catalog
+    for cache in caches.all():
+        cache.clear()
+    catalog._local['shared'] = (None, None)
+
+
+class QueryBudgetTestMixin:
+
+    def capture_queries(self, request):
+        reset_caches()
+        with CaptureQueriesContext(connection) as ctx:
+            response = request()
+        if hasattr(response, 'status_code'):
+            self.assertLess(response.status_code, 400, f'Request failed with {response.status_code}')
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def assertConstantQueries(self, grow, request, sizes=(1, 10), budget=None):
+        """
+        grow(n) adds n more rows of fixture data; request() hits the endpoint.
+        The query count must be identical at every cumulative fixture size
+        in `sizes` (and at most `budget`, if given).
+        """
+        counts = {}
+        runs = {}
+        current = 0
+        for size in sizes:
+            grow(size - current)
+            current = size
+            runs[size] = self.capture_queries(request)
+            counts[size] = len(runs[size])
+
+        smallest, largest = min(sizes), max(sizes)
+        if len(set(counts.values())) > 1:
+            extra = list(runs[largest])
+            for sql in runs[smallest]:
+                if sql in extra:
+                    extra.remove(sql)
+            self.fail(
+                'Query count grows with fixture size {}.\nQueries only in the larger run (first 5):\n{}'.format(
+                    counts, '\n'.join(extra[:5])
+                )
+            )
+        if budget is not None:
+            self.assertLessEqual(counts[largest], budget, f'Query budget exceeded: {counts[largest]} > {budget}')
+        return counts[largest]
@@ -1,3 +1,528 @@
-from django.test import TestCase
+import datetime
+import json
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.db import models
+from django.test import TestCase, override_settings
+
+from accounts.models import CustomUser
+from core.testing import QueryBudgetTestMixin
+from intelligence.models import Target, TargetGroup, TimelineItem, Tag, CustomAnniversary, Question, QuestionCategory, DailyTargetState, TargetStats
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Endpoints whose query count must not depend on the number of targets / logs."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.group = TargetGroup.objects.create(user=self.user, name='G', is_mon=True, is_wed=True)
+        self.tag = Tag.objects.create(user=self.user, name='tag')
+        self.client.force_login(self.user)
+
+    def add_targets(self, n):
+        today = datetime.date.today()
+        for i in range(n):
+            target = Target.objects.create(
+                user=self.user, nickname=f'target{Target.objects.count()}',
+                birth_year=1990, birth_month=today.month, birth_day=today.day,
+            )
+            target.groups.add(self.group)
+            CustomAnniversary.objects.create(target=target, label='anniv', date=today - datetime.timedelta(days=365))
+            for days in range(3):
+                item = TimelineItem.objects.create(
+                    target=target, date=today - datetime.timedelta(days=days), type='Event',
+                    content=f'log {days}', contact_made=days == 0,
+                )
+                item.tags.add(self.tag)
+
+    def test_dashboard(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/dashboard/'))
+
+    def test_target_list(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/targets/'))
+
+    def test_target_list_sorted_by_group(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/targets/?sort=group'))
+
+    def test_calendar(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/calendar/'))
+
+    def test_intelligence_log(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/'))
+
+    def add_scheduled_targets(self, n):
+        # Manually added for today, every other one with a log
+        today = datetime.date.today()
+        for i in range(n):
+            target = Target.objects.create(user=self.user, nickname=f'scheduled{Target.objects.count()}')
+            DailyTargetState.objects.create(target=target, date=today, is_manual_add=True)
+            if i % 2:
+                TimelineItem.objects.create(target=target, date=today, type='Note', content='log')
+
+    def test_refresh_list(self):
+        payload = json.dumps({'action': 'refresh_list', 'date': datetime.date.today().isoformat()})
+        self.assertConstantQueries(
+            self.add_scheduled_targets,
+            lambda: self.client.post('/intelligence/log/', payload, content_type='application/json'),
+        )
+        hidden = DailyTargetState.objects.filter(is_hidden=True)
+        self.assertEqual(hidden.count(), 6)
+        self.assertFalse(hidden.filter(target__timelineitem__isnull=False).exists())
+        self.assertTrue(all(hidden.values_list('is_manual_add', flat=True)))
+        self.assertEqual(len(self.client.get('/').context['todays_targets']), 4)
+
+    def test_timeline_api(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/api/timeline/?limit=100'))
+
+    def test_timeline_api_grouped(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/api/timeline/?limit=100&group_by_target=true'))
+
+    def test_tag_api(self):
+        self.assertConstantQueries(self.add_targets, lambda: self.client.get('/api/tags/'))
+
+    def add_answered_questions(self, n):
+        if not hasattr(self, 'target'):
+            self.target = Target.objects.create(user=self.user, nickname='answered')
+            self.category = QuestionCategory.objects.create(user=self.user, name='cat')
+        today = datetime.date.today()
+        for i in range(n):
+            question = Question.objects.create(user=self.user, category=self.category, title=f'q{Question.objects.count()}')
+            for days in range(2):
+                TimelineItem.objects.create(
+                    target=self.target, date=today - datetime.timedelta(days=days), type='Question',
+                    question=question, content=f'answer {days}',
+                )
+
+    def test_target_detail(self):
+        self.add_answered_questions(1)
+        self.assertConstantQueries(
+            self.add_answered_questions, lambda: self.client.get(f'/targets/detail/?target_id={self.target.pk}')
+        )
+
+    def grow_dossier(self, n):
+        self.add_answered_questions(n)
+        for i in range(n):
+            item = TimelineItem.objects.create(target=self.target, date=datetime.date.today(), type='Event', content=f'event {i}')
+            item.tags.add(Tag.objects.create(user=self.user, name=f'tag{Tag.objects.count()}'))
+
+    def test_dossier_sections(self):
+        for section in ['profile', 'qa', 'events', 'tags']:
+            with self.subTest(section=section):
+                self.assertConstantQueries(
+                    self.grow_dossier, lambda: self.client.get(f'/targets/{self.target.pk}/dossier/{section}/')
+                )
+
+
+@override_settings(DOSSIER_SINGLE_PROCESS=True)
+class SnapshotTests(TestCase):
+
+    def setUp(self):
+        from core.testing import reset_caches
+        reset_caches()
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.client.force_login(self.user)
+
+    def test_dashboard_follows_question_edits(self):
+        question = Question.objects.create(user=self.user, title='before')
+        target = Target.objects.create(user=self.user, nickname='a')
+        TimelineItem.objects.create(target=target, date=datetime.date.today(), type='Question', question=question, content='x')
+        self.assertEqual(self.client.get('/dashboard/').context['latest_answers'][0].question.title, 'before')
+        question.title = 'after'
+        question.save() # Bumps the catalog version only
+        self.assertEqual(self.client.get('/dashboard/').context['latest_answers'][0].question.title, 'after')
+
+    def test_process_local_versions_bypass_snapshots(self):
+        from core.snapshots import get_user_snapshot
+        builder = mock.Mock(return_value={'n': 1})
+        get_user_snapshot('test', self.user, builder)
+        get_user_snapshot('test', self.user, builder)
+        self.assertEqual(builder.call_count, 1)
+        with override_settings(DOSSIER_SINGLE_PROCESS=False):
+            get_user_snapshot('test', self.user, builder)
+            get_user_snapshot('test', self.user, builder)
+        self.assertEqual(builder.call_count, 3)
+
+
+class TargetListTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.client.force_login(self.user)
+
+    def test_target_without_stats_row(self):
+        target = Target.objects.create(user=self.user, nickname='a')
+        TargetStats.objects.filter(target=target).delete()
+        [listed] = self.client.get('/targets/').context['targets']
+        self.assertEqual((listed.total_points, listed.log_count), (0, 0))
+
+    def add_targets(self):
+        """25 targets with duplicate nicknames and tied or NULL sort keys."""
+        groups = [TargetGroup.objects.create(user=self.user, name=name) for name in 'AB']
+        base = datetime.datetime(2024, 5, 1, 12, tzinfo=datetime.timezone.utc)
+        for i in range(25):
+            target = Target.objects.create(
+                user=self.user, nickname=f't{i % 10}',
+                last_contact=None if i % 4 == 0 else base + datetime.timedelta(days=i % 3),
+                birth_month=None if i % 5 == 0 else i % 3 + 1, birth_day=i % 2 + 1,
+            )
+            if i % 3:
+                target.groups.add(*groups[i % 2:])
+
+    def walk(self, sort, per_page=7):
+        names, ids, url, pages = [], [], f'/targets/?sort={sort}', 0
+        with mock.patch('core.views.TARGET_LIST_PAGE_SIZE', per_page):
+            while url:
+                context = self.client.get(url).context
+                ids += [target.pk for target in context['targets']]
+                url, pages = context['next_page_url'], pages + 1
+        return ids, pages
+
+    def test_cursor_walks_every_sort_to_the_end(self):
+        self.add_targets()
+        targets = list(Target.objects.prefetch_related('groups'))
+        group_name = lambda t: min((g.name for g in t.groups.all()), default=None)
+        nulls_first = lambda value: (value is not None, value)
+        nulls_last = lambda value: (value is None, value)
+        tie = lambda t: (t.nickname, t.pk.hex)
+        expected = {
+            # Most recent contact first, never-contacted targets last
+            'last_contact': sorted(sorted(targets, key=tie), key=lambda t: nulls_last(t.last_contact and -t.last_contact.timestamp())),
+            'group': sorted(targets, key=lambda t: (nulls_first(group_name(t)), tie(t))),
+            'anniversary': sorted(targets, key=lambda t: (nulls_first(t.birth_month), nulls_first(t.birth_day), tie(t))),
+        }
+        for sort, ordered in expected.items():
+            ids, pages = self.walk(sort)
+            self.assertEqual(ids, [t.pk for t in ordered], sort)
+            self.assertEqual(len(set(ids)), 25, sort)
+            self.assertEqual(pages, 4, sort)
+
+    def test_malformed_cursors_restart(self):
+        import base64
+        self.add_targets()
+        first_page = [t.pk for t in self.client.get('/targets/?sort=anniversary').context['targets']]
+        forged = lambda payload: base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        for cursor in [
+            'not a cursor', '!!!', forged(['last_contact', [None, 't1', 'x']]), forged(['anniversary', [1, 1]]),
+            forged(['anniversary', ['x', 'y', 't1', 'z']]), forged(['anniversary', [1, 1, 't1', 'not-a-uuid']]),
+            forged(['anniversary', [[1], {}, 't1', 'z']]), forged({'a': 1}),
+        ]:
+            response = self.client.get('/targets/', {'sort': 'anniversary', 'cursor': cursor})
+            self.assertEqual(response.status_code, 200, cursor)
+            self.assertEqual([t.pk for t in response.context['targets']], first_page, cursor)
+
+
+class CandidateAPITests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.client.force_login(self.user)
+        today = datetime.date.today()
+        for i in range(35):
+            target = Target.objects.create(
+                user=self.user, nickname=f'c{i:02d}', last_name_kana='たなか' if i % 5 == 0 else 'おたなか',
+            )
+            if i % 3:
+                TimelineItem.objects.create(
+                    target=target, date=today - datetime.timedelta(days=i), type='Contact', contact_made=True,
+                )
+        # Already on today's list: never a candidate
+        self.listed = Target.objects.get(nickname='c00')
+        DailyTargetState.objects.create(target=self.listed, date=today, is_manual_add=True)
+
+    def fetch_all(self, **params):
+        names, cursor = [], None
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            data = self.client.get('/api/candidates/', query).json()
+            names += [c['nickname'] for c in data['candidates']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return names
+
+    def test_pages_in_last_contact_order(self):
+        expected = list(
+            Target.objects.exclude(pk=self.listed.pk).order_by(
+                models.F('stats__real_last_contact').asc(nulls_first=True), 'nickname'
+            ).values_list('nickname', flat=True)
+        )
+        names = self.fetch_all()
+        self.assertEqual(names, expected)
+        self.assertEqual(len(names), 34)
+
+    def test_kana_prefix_search(self):
+        names = self.fetch_all(q='ﾀﾅｶ')
+        self.assertEqual(sorted(names), [f'c{i:02d}' for i in range(5, 35, 5)])
+
+
+class TimelineAPITests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.client.force_login(self.user)
+        self.target = Target.objects.create(user=self.user, nickname='a')
+
+    def walk(self, params):
+        ids, cursor = [], ''
+        while True:
+            data = self.client.get('/api/timeline/', {**params, 'cursor': cursor}).json()
+            ids += [entry['id'] for entry in data['data']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids
+
+    def test_cursor_walks_every_item_once(self):
+        today = datetime.date.today()
+        # Created in an order unrelated to date, several per date, some backdated
+        for days in [0, 3, 1, 3, 0, 5, 1, 3, 2, 0]:
+            TimelineItem.objects.create(target=self.target, date=today - datetime.timedelta(days=days), type='Note', content='cafe')
+        expected = list(TimelineItem.objects.order_by('-date', '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk({'limit': 3}), expected)
+        self.assertEqual(self.walk({'limit': 3, 'target_id': self.target.pk}), expected)
+        self.assertCountEqual(self.walk({'limit': 3, 'search': 'cafe', 'sort': 'relevance'}), expected)
+
+    def test_relevance_sort(self):
+        question = Question.objects.create(user=self.user, title='カフェの好み')
+        once = TimelineItem.objects.create(target=self.target, date=datetime.date(2024, 5, 3), type='Note', content='<i>カフェ</i>で休憩')
+        thrice = TimelineItem.objects.create(target=self.target, date=datetime.date(2024, 5, 1), type='Note', content='カフェ カフェ カフェ')
+        titled = TimelineItem.objects.create(target=self.target, date=datetime.date(2024, 5, 2), type='Question', question=question, content='紅茶')
+        TimelineItem.objects.create(target=self.target, date=datetime.date(2024, 5, 4), type='Note', content='ランチ')
+
+        data = self.client.get('/api/timeline/', {'search': 'カフェ', 'sort': 'relevance'}).json()['data']
+        # Most matches first; question-title matches have no rank and come last
+        self.assertEqual([entry['id'] for entry in data], [thrice.pk, once.pk, titled.pk])
+        self.assertGreater(data[0]['search_rank'], data[1]['search_rank'])
+        self.assertEqual(data[2]['search_rank'], 0)
+        self.assertEqual(data[2]['snippet'], '')
+        self.assertEqual(data[1]['snippet'], '&lt;i&gt;<mark>カフェ</mark>&lt;/i&gt;で休憩')
+
+        data = self.client.get('/api/timeline/', {'search': 'カフェ'}).json()['data']
+        self.assertEqual([entry['id'] for entry in data], [once.pk, titled.pk, thrice.pk])
+
+    def test_group_by_target(self):
+        today = datetime.date.today()
+        targets = [self.target] + [Target.objects.create(user=self.user, nickname=f't{i}') for i in range(4)]
+        for i, days in enumerate([4, 0, 2, 2, 7, 1, 0, 3, 5, 6, 1]):
+            TimelineItem.objects.create(target=targets[i % 5], date=today - datetime.timedelta(days=days), type='Note')
+
+        latest = {}
+        for item in TimelineItem.objects.order_by('-date', '-created_at', '-id'):
+            latest.setdefault(item.target_id, []).append(item.pk)
+        expected = [item_id for items in latest.values() for item_id in items[:2]]
+        ids, cursor, pages = [], '', 0
+        while cursor is not None:
+            data = self.client.get('/api/timeline/', {'group_by_target': 'true', 'per_target': 2, 'limit': 2, 'cursor': cursor}).json()
+            ids += [entry['id'] for entry in data['data']]
+            cursor, pages = data['next_cursor'], pages + 1
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+        data = self.client.get('/api/timeline/', {'group_by_target': 'true', 'limit': 10}).json()
+        self.assertEqual([entry['id'] for entry in data['data']], [items[0] for items in latest.values()])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_stream_resumes_from_cursor(self):
+        for days in [2, 0, 1, 0, 3]:
+            item = TimelineItem.objects.create(target=self.target, date=datetime.date(2024, 5, 1) - datetime.timedelta(days=days), type='Note')
+            item.tags.add(Tag.objects.create(user=self.user, name=f't{item.pk}'))
+
+        def stream(params):
+            response = self.client.get('/api/timeline/stream/', params)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        with mock.patch('core.views.TIMELINE_STREAM_CHUNK_SIZE', 2):
+            rows = stream({})
+            self.assertEqual([row['id'] for row in rows], self.walk({'limit': 2}))
+            self.assertEqual([row['tags'][0]['name'] for row in rows], [f't{row["id"]}' for row in rows])
+            resumed = stream({'cursor': rows[1]['cursor'], 'fields': 'id'})
+        self.assertEqual([row['id'] for row in resumed], [row['id'] for row in rows[2:]])
+        self.assertEqual(set(resumed[0]), {'id', 'cursor'})
+
+    def test_malformed_filters(self):
+        for params, error in [
+            ({'target_id': 'abc'}, 'Invalid target_id'),
+            ({'group_id': 'abc'}, 'Invalid group_id'),
+            ({'tags[]': ['1', 'x']}, 'Invalid tags[]'),
+        ]:
+            for path in ['/api/timeline/', '/api/timeline/stream/']:
+                response = self.client.get(path, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'success': False, 'error': error})
+        self.assertEqual(self.client.get('/api/timeline/stream/', {'target_id': str(uuid.uuid4())}).status_code, 404)
+
+    def test_sparse_fields(self):
+        item = TimelineItem.objects.create(target=self.target, date=datetime.date(2024, 5, 1), type='Note', content='x')
+        item.tags.add(Tag.objects.create(user=self.user, name='t'))
+        with self.assertNumQueries(3): # Session, user, items
+            data = self.client.get('/api/timeline/', {'fields': 'description,id,date,type,unknown'}).json()
+        self.assertEqual(data['data'], [{'id': item.pk, 'date': '2024-05-01', 'type': 'Note', 'description': 'x'}])
+        entry = self.client.get('/api/timeline/').json()['data'][0]
+        self.assertEqual(entry['tags'], [{'id': item.tags.get().pk, 'name': 't'}])
+        self.assertEqual(entry['target']['nickname'], 'a')
+
+    def test_limit_is_capped(self):
+        from core.views import TIMELINE_DEFAULT_LIMIT, TIMELINE_MAX_LIMIT
+        TimelineItem.objects.bulk_create([
+            TimelineItem(target=self.target, date=datetime.date.today(), type='Note') for _ in range(TIMELINE_MAX_LIMIT + 1)
+        ])
+        for limit, size in [('100000', TIMELINE_MAX_LIMIT), ('x', TIMELINE_DEFAULT_LIMIT), ('0', 1)]:
+            data = self.client.get('/api/timeline/', {'limit': limit}).json()
+            self.assertEqual(len(data['data']), size)
+            self.assertIsNotNone(data['next_cursor'])
+
+
+@override_settings(DOSSIER_SINGLE_PROCESS=True)
+class ConditionalGetTests(TestCase):
+    """Polled JSON APIs answer 304 from the change versions alone while nothing they show has changed."""
+
+    def setUp(self):
+        from core.testing import reset_caches
+        reset_caches()
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.client.force_login(self.user)
+        self.a = Target.objects.create(user=self.user, nickname='a')
+        self.b = Target.objects.create(user=self.user, nickname='b')
+        self.tag = Tag.objects.create(user=self.user, name='t')
+        TimelineItem.objects.create(target=self.a, date=datetime.date.today(), type='Note', content='x').tags.add(self.tag)
+
+    def assertNotModified(self, path, etag):
+        with self.assertNumQueries(2): # Session and user only
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(DOSSIER_SINGLE_PROCESS=False)
+    def test_process_local_versions(self):
+        # Per-process counters could match an ETag in one worker after another changed the data
+        response = self.client.get('/api/timeline/', HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_timeline(self):
+        target_path, feed_path = f'/api/timeline/?target_id={self.a.pk}', '/api/timeline/'
+        response = self.client.get(target_path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        target_etag, feed_etag = response['ETag'], self.client.get(feed_path)['ETag']
+        self.assertNotEqual(target_etag, feed_etag)
+        self.assertNotModified(target_path, target_etag)
+
+        # Another target: only the feed changes
+        TimelineItem.objects.create(target=self.b, date=datetime.date.today(), type='Note')
+        self.assertNotModified(target_path, target_etag)
+        self.assertNotEqual(self.client.get(feed_path, HTTP_IF_NONE_MATCH=feed_etag).status_code, 304)
+
+        # Tag names show in every timeline
+        self.tag.name = 'renamed'
+        self.tag.save()
+        response = self.client.get(target_path, HTTP_IF_NONE_MATCH=target_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['tags'][0]['name'], 'renamed')
+
+        target_etag = response['ETag']
+        self.client.post('/intelligence/log/', json.dumps({
+            'target_id': str(self.a.pk), 'date': datetime.date.today().isoformat(), 'description': 'y #new',
+        }), content_type='application/json')
+        self.assertEqual(self.client.get(target_path, HTTP_IF_NONE_MATCH=target_etag).status_code, 200)
+
+    def test_tags_and_questions(self):
+        question = Question.objects.create(user=self.user, title='q')
+        for path in ['/api/tags/', f'/api/questions/?target_id={self.a.pk}']:
+            with self.subTest(path=path):
+                etag = self.client.get(path)['ETag']
+                self.assertNotModified(path, etag)
+                TimelineItem.objects.create(target=self.a, date=datetime.date.today(), type='Question', question=question, content='a')
+                self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class LogBatchTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.client.force_login(self.user)
+        self.a = Target.objects.create(user=self.user, nickname='a')
+        self.b = Target.objects.create(user=self.user, nickname='b')
+        self.tag = Tag.objects.create(user=self.user, name='met')
+        self.question = Question.objects.create(user=self.user, title='q')
+        self.today = datetime.date.today().isoformat()
+
+    def post(self, operations):
+        return self.client.post('/intelligence/log/batch/', json.dumps({'operations': operations}), content_type='application/json')
+
+    def test_create_update_delete(self):
+        old = TimelineItem.objects.create(target=self.a, date=datetime.date.today(), type='Note', content='old')
+        gone = TimelineItem.objects.create(target=self.b, date=datetime.date.today(), type='Note', content='gone')
+        response = self.post([
+            {'target_id': str(self.a.pk), 'date': self.today, 'description': 'lunch #food', 'contact_made': True, 'tags': [self.tag.pk]},
+            {'target_id': str(self.b.pk), 'date': self.today, 'description': 'dinner #food #late'},
+            {'target_id': str(self.a.pk), 'date': self.today, 'event_type': 'QUESTION', 'question_id': self.question.pk, 'description': 'yes'},
+            {'action': 'update', 'item_id': old.pk, 'description': 'edited #late'},
+            {'action': 'delete', 'item_id': gone.pk},
+        ])
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual([r['success'] for r in data['results']], [True] * 5)
+        self.assertTrue(all(r['has_entry_today'] for r in data['results']))
+
+        lunch = TimelineItem.objects.get(pk=data['results'][0]['item_id'])
+        self.assertEqual(set(lunch.tags.values_list('name', flat=True)), {'food', 'met'})
+        self.assertEqual(Tag.objects.filter(user=self.user, name='food').count(), 1)
+        self.assertEqual(set(TimelineItem.objects.get(pk=old.pk).tags.values_list('name', flat=True)), {'late'})
+        self.assertFalse(TimelineItem.objects.filter(pk=gone.pk).exists())
+
+        # Derived data matches a full rebuild
+        from intelligence.answers import current_answers, rebuild_answer_index
+        from intelligence.stats import rebuild_all_stats
+        self.assertEqual(current_answers(self.a)[self.question.pk].content, 'yes')
+        stats = lambda: list(TargetStats.objects.order_by('target_id').values_list(
+            'target_id', 'log_count', 'contact_count', 'total_points', 'answered_question_count',
+            'latest_message', 'latest_item_date', 'real_last_contact',
+        ))
+        maintained = stats()
+        rebuild_all_stats()
+        rebuild_answer_index()
+        self.assertEqual(maintained, stats())
+        self.assertEqual(current_answers(self.a)[self.question.pk].content, 'yes')
+
+    def test_single_post_tags(self):
+        response = self.client.post('/intelligence/log/', json.dumps({
+            'target_id': str(self.a.pk), 'date': self.today, 'description': 'lunch #food #met #food',
+            'tags': [self.tag.pk, 'bad'],
+        }), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        item = TimelineItem.objects.get(target=self.a)
+        self.assertEqual(set(item.tags.values_list('name', flat=True)), {'food', 'met'})
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_multipart_images(self):
+        import tempfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from intelligence.synthetic import PIXEL_PNG
+
+        operations = [{'target_id': str(self.a.pk), 'description': 'photo'}, {'target_id': str(self.b.pk), 'description': 'none'}]
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post('/intelligence/log/batch/', {
+                'operations': json.dumps(operations),
+                'images_0': SimpleUploadedFile('x.png', PIXEL_PNG, 'image/png'),
+            })
+            results = response.json()['results']
+            photo, none = (TimelineItem.objects.get(pk=r['item_id']) for r in results)
+            self.assertEqual(photo.images.count(), 1)
+            self.assertTrue(photo.images.get().image.storage.exists(photo.images.get().image.name))
+            self.assertEqual(none.images.count(), 0)
+
+    def test_invalid_batch_writes_nothing(self):
+        other = Target.objects.create(user=CustomUser.objects.create_user(username='other'), nickname='x')
+        response = self.post([
+            {'target_id': str(self.a.pk), 'description': 'ok'},
+            {'target_id': str(other.pk), 'description': 'not mine'},
+            {'action': 'delete'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [r.get('error') for r in response.json()['results']],
+            ['Not applied', 'Target not found', 'Item ID required'],
+        )
+        self.assertFalse(TimelineItem.objects.exists())
@@ -0,0 +1,181 @@
+"""
+Timeline API rows.
+
+Every field of a timeline entry is declared once in FIELDS with its getter
+and the relations it reads. A TimelineSerializer is built per request for the
+requested fields (?fields=id,date,...): prepare() adds exactly the
+select_related / prefetch_related those fields need, so a page costs the same
+number of queries however many items it holds, and rows() builds each entry
+from the getters bound up front.
+
+latest_per_target() is the grouped feed (?group_by_target=true): the latest
+items of each target, paginated over targets. ndjson_lines() streams a whole
+feed one JSON line per item.
+"""
+import datetime
+import json
+from operator import attrgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Window
+from django.db.models.functions import FirstValue, RowNumber
+from django.utils.dateparse import parse_datetime
+
+from core.pagination import Key, decode_cursor, encode_cursor, seek_filter
+
+
+def _date(item):
+    return item.date.strftime('%Y-%m-%d')
+
+
+def _created_at(item):
+    return item.created_at.strftime('%Y-%m-%d %H:%M:%S') if item.created_at else ''
+
+
+def _question_title(item):
+    return (item.question.title if item.question else item.question_text) or ''
+
+
+def _question_category(item):
+    question = item.question
+    return (question.category.name if question and question.category else item.question_category) or ''
+
+
+def _tags(item):
+    return [{'id': tag.id, 'name': tag.name} for tag in item.tags.all()]
+
+
+def _images(item):
+    return [image.image.url for image in item.images.all()]
+
+
+def _target(item):
+    target = item.target
+    return {
+        'id': target.id,
+        'nickname': target.nickname,
+        'avatar': target.avatar.url if target.avatar else None,
+        'first_name': target.first_name,
+        'last_name': target.last_name,
+    }
+
+
+# name: (getter, select_related, prefetch_related)
+FIELDS = {
+    'id': (attrgetter('id'), (), ()),
+    'date': (_date, (), ()),
+    'created_at': (_created_at, (), ()),
+    'type': (attrgetter('type'), (), ()),
+    'question_id': (attrgetter('question_id'), (), ()),
+    'description': (attrgetter('content'), (), ()), # Model has 'content', mapped to 'description' for frontend
+    'question_title': (_question_title, ('question',), ()),
+    'question_category': (_question_category, ('question__category',), ()),
+    'contact_made': (attrgetter('contact_made'), (), ()),
+    'tags': (_tags, (), ('tags',)),
+    'images': (_images, (), ('images',)),
+    'target': (_target, ('target',), ()),
+}
+
+
+def parse_fields(value):
+    """Known field names from a comma-separated ?fields= value (in FIELDS order), or every field."""
+    requested = {name.strip() for name in (value or '').split(',')}
+    fields = [name for name in FIELDS if name in requested]
+    return fields or list(FIELDS)
+
+
+class TimelineSerializer:
+    """
+    serializer = TimelineSerializer(parse_fields(request.GET.get('fields')))
+    items = list(serializer.prepare(queryset)[:20])
+    data = serializer.rows(items)
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or FIELDS)
+        self.getters = [(name, FIELDS[name][0]) for name in self.fields]
+
+    def prepare(self, queryset):
+        select = {name for field in self.fields for name in FIELDS[field][1]}
+        prefetch = {name for field in self.fields for name in FIELDS[field][2]}
+        if 'question__category' in select:
+            select.discard('question')
+        if select:
+            queryset = queryset.select_related(*sorted(select))
+        if prefetch:
+            queryset = queryset.prefetch_related(*sorted(prefetch))
+        return queryset
+
+    def row(self, item):
+        return {name: getter(item) for name, getter in self.getters}
+
+    def rows(self, items, search_hits=None):
+        """
+        One dict per item. With search_hits ({item_id: (rank, snippet)} from
+        fulltext.snippets) every row also gets search_rank and snippet.
+        """
+        rows = [self.row(item) for item in items]
+        if search_hits is not None:
+            for item, row in zip(items, rows):
+                # Relevance (higher is better) and the best matching fragment, HTML-escaped with <mark> highlights
+                row['search_rank'], row['snippet'] = search_hits.get(item.id, (0, ''))
+        return rows
+
+
+# Sort key of a target's latest item (annotated on every row of the target by latest_per_target)
+HEAD_KEYS = [
+    Key('head_date', descending=True, parse=datetime.date.fromisoformat, nullable=False),
+    Key('head_created_at', descending=True, parse=parse_datetime, nullable=False),
+    Key('head_id', descending=True, nullable=False),
+]
+
+
+def latest_per_target(queryset, per_target=1, targets=20, cursor=None):
+    """
+    (items, next_cursor): the latest per_target items of each target, for one
+    page of targets ordered by their latest item (newest first). The items of
+    a target are contiguous, newest first.
+
+    One query: ROW_NUMBER() ranks the items of each target and FIRST_VALUE()
+    gives every row the sort key of its target's latest item, which orders the
+    targets and is what the cursor seeks past.
+    """
+    newest_first = [F('date').desc(), F('created_at').desc(), F('id').desc()]
+    window = {'partition_by': [F('target_id')], 'order_by': newest_first}
+    keys = HEAD_KEYS
+    rows = queryset.annotate(
+        target_rank=Window(RowNumber(), **window),
+        head_date=Window(FirstValue('date'), **window),
+        head_created_at=Window(FirstValue('created_at'), **window),
+        head_id=Window(FirstValue('id'), **window),
+    ).filter(target_rank__lte=per_target)
+
+    values = decode_cursor(cursor, 'timeline_targets')
+    if values is not None and len(values) == len(keys):
+        try:
+            rows = rows.filter(seek_filter(keys, [key.load(value) for key, value in zip(keys, values)]))
+        except (ValueError, TypeError):
+            pass
+
+    # Enough rows for `targets` full groups, plus one to tell whether another target follows
+    rows = list(rows.order_by(*[key.order_by() for key in keys], 'target_rank')[:targets * per_target + 1])
+    items, seen = [], set()
+    for item in rows:
+        if item.target_id not in seen and len(seen) == targets:
+            return items, encode_cursor('timeline_targets', [key.dump(items[-1]) for key in keys])
+        seen.add(item.target_id)
+        items.append(item)
+    return items, None
+
+
+def ndjson_lines(serializer, paginator, cursor=None, chunk_size=500):
+    """
+    One JSON line per item of the paginator's ordering after cursor, each with
+    the cursor that resumes after it. iterator(chunk_size) reads chunk_size
+    rows at a time and runs the serializer's prefetches per chunk, so memory
+    stays bounded by the chunk however long the feed is.
+    """
+    for item in paginator.seek(cursor).iterator(chunk_size=chunk_size):
+        row = serializer.row(item)
+        row['cursor'] = paginator.cursor_after(item)
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
@@ -11,6 +11,7 @@ urlpatterns = [
     path('targets/', views.target_list, name='target_list'),
     path('targets/add/', views.TargetCreateView.as_view(), name='target_add'),
     path('targets/detail/', views.TargetDetailView.as_view(), name='target_detail'), # Query param style
+    path('targets/<uuid:pk>/dossier/<slug:section>/', views.TargetDossierSectionView.as_view(), name='target_dossier_section'),
     path('targets/<uuid:pk>/edit/', views.TargetUpdateView.as_view(), name='target_edit'), # Edit route
     path('targets/<uuid:pk>/export_csv/', views.TargetExportView.as_view(), name='target_export_csv'),
     path('targets/<uuid:pk>/delete/', views.TargetDeleteView.as_view(), name='target_delete'), # Delete route
@@ -19,6 +20,8 @@ urlpatterns = [
     path('api/groups/<int:pk>/delete/', views.TargetGroupDeleteView.as_view(), name='group_delete'),
     path('api/target/state-toggle/', views.TargetStateToggleView.as_view(), name='target_state_toggle'),
     path('intelligence/log/', views.IntelligenceLogView.as_view(), name='intelligence_log'),
+    path('intelligence/log/batch/', views.IntelligenceLogBatchView.as_view(), name='intelligence_log_batch'),
+    path('api/candidates/', views.CandidateListAPIView.as_view(), name='candidate_list_api'),
     
     # Question Management
     path('questions/', views.QuestionListView.as_view(), name='question_list'),
@@ -34,6 +37,7 @@ urlpatterns = [
     
     # Timeline
     path('api/timeline/', views.TimelineListAPIView.as_view(), name='timeline_list'),
+    path('api/timeline/stream/', views.TimelineStreamView.as_view(), name='timeline_stream'),
     path('api/tags/', views.TagListAPIView.as_view(), name='tag_list_api'),
     path('api/questions/', views.QuestionListAPIView.as_view(), name='api_questions'),
     path('help/', views.HelpView.as_view(), name='help'),
@@ -10,6 +10,14 @@ from core.mixins import MobileTemplateMixin
 
 
 
+from core.conditional import versioned_get
+
+
+
+from django.utils.decorators import method_decorator
+
+
+
 from django.urls import reverse_lazy
 
 
@@ -68,45 +76,102 @@ import csv
 
 import urllib.parse
 
+# Targets per infinite-scroll page of the target list
+TARGET_LIST_PAGE_SIZE = 30
 
 
+def build_dashboard_snapshot(user, today):
+    import datetime
+    from django.db.models import Count
+    from intelligence.models import Tag
+    from intelligence.anniversaries import occurrences_between
 
+    # [MODIFIED] 2. Latest Logs (Events) - Limit 10
+    latest_logs = list(TimelineItem.objects.filter(
+        target__user=user
+    ).exclude(type='Question').select_related('target').prefetch_related('images').order_by('-date', '-created_at')[:10])
 
+    # [MODIFIED] 3. Latest Answers - Limit 10
+    latest_answers = list(TimelineItem.objects.filter(
+        target__user=user, type='Question'
+    ).select_related('target', 'question').order_by('-date', '-created_at')[:10])
 
+    # 4. Anniversaries (Range: Today to Today+14) - single indexed query
+    upcoming_anniv_list = []
+    for occ in occurrences_between(user, today, today + datetime.timedelta(days=14)):
+        days_left = (occ.date - today).days
+        upcoming_anniv_list.append({
+            'date': occ.date,
+            'name': 'Birthday' if occ.kind == 'birthday' else occ.label,
+            'target': occ.target,
+            'days_left': days_left,
+            'is_today': days_left == 0
+        })
 
-@login_required
+    # Filters Support (Groups, Tags)
+    groups = list(TargetGroup.objects.filter(user=user))
+    top_tags = list(Tag.objects.filter(
+        timelineitem__target__user=user
+    ).annotate(c=Count('timelineitem')).order_by('-c')[:20])
 
+    return {
+        'latest_logs': latest_logs,
+        'latest_answers': latest_answers,
+        'upcoming_anniversaries': upcoming_anniv_list,
+        'groups': groups,
+        'tags': top_tags,
+    }
 
 
+@login_required
 def dashboard(request):
+    import datetime
+    from core.snapshots import get_user_snapshot
 
+    today = datetime.date.today()
+    user = request.user
 
+    # [MODIFIED] 1. Question of the Day for "Today's Topic" (stable per user per day)
+    from intelligence.catalog import question_of_the_day
+    random_question = question_of_the_day(user, today)
 
-    import datetime
+    # 2-4 + Filters: Cached per user, invalidated by the user's change version
+    # and the catalog versions (question titles of recent logs)
+    from intelligence.versions import get_catalog_versions
+    snapshot = get_user_snapshot(
+        'dashboard', user, lambda: build_dashboard_snapshot(user, today), today.isoformat(), *get_catalog_versions(user.pk)
+    )
 
+    context = {
+        'random_question': random_question,
+        **snapshot,
+    }
 
+    if getattr(request, 'is_mobile', False):
+        return render(request, 'mobile/home_mobile.html', context)
 
-    from django.db.models import Count, Sum, Q, F
+    return render(request, 'dashboard.html', context)
 
 
 
-    from django.utils import timezone
 
 
 
-    from intelligence.models import QuestionRank, Tag
 
+@login_required
 
 
 
+@login_required
 
 
 
-    today = datetime.date.today()
+def target_list(request):
 
 
 
-    user = request.user
+    from django.db.models import F
+    from django.db.models.functions import Coalesce
 
 
 
@@ -114,403 +179,657 @@ def dashboard(request):
 
 
 
-    # [MODIFIED] 1. Random Question for "Today's Topic"
+    sort_by = request.GET.get('sort', 'last_contact')
 
 
 
-    random_question = Question.objects.filter(
+    search_query = request.GET.get('q')
 
 
 
-        Q(user=user) | Q(is_shared=True) | Q(user__role='MASTER')
+    group_filter = request.GET.get('group')
 
 
 
-    ).distinct().order_by('?').first()
+    
 
 
 
+    # Base Query
 
 
 
+    targets = Target.objects.filter(user=request.user).prefetch_related('groups')
 
-    # [MODIFIED] 2. Latest Logs (Events) - Limit 10
 
 
 
-    latest_logs = TimelineItem.objects.filter(
 
 
 
-        target__user=user
+    # Search Filter (normalized kana/width/case-insensitive name index)
+    if search_query:
+        from intelligence.search import matching_target_ids
+        matching_ids = matching_target_ids(request.user, search_query)
+        if matching_ids is not None:
+            targets = targets.filter(pk__in=matching_ids)
 
 
 
-    ).exclude(type='Question').select_related('target').prefetch_related('images').order_by('-date', '-created_at')[:10]
 
 
 
 
+    # Group Filter
 
 
 
-    # [MODIFIED] 3. Latest Answers - Limit 10
+    if group_filter:
 
 
 
-    latest_answers = TimelineItem.objects.filter(
+        targets = targets.filter(groups__id=group_filter)
 
 
 
-        target__user=user, type='Question'
 
 
 
-    ).select_related('target', 'question').order_by('-date', '-created_at')[:10]
 
+    # Annotations (Read from TargetStats: no fan-out join over timeline items)
+    targets = targets.annotate(
+        total_points=Coalesce(F('stats__total_points'), 0),
+        log_count=Coalesce(F('stats__log_count'), 0),
+        latest_msg_content=F('stats__latest_message')
+    )
 
 
 
 
 
 
-    # 4. Anniversaries (Range: Today to Today+14)
 
+    # Sorting (keyset pagination: every key list ends with a unique column)
+    from django.db.models import OuterRef, Subquery
+    from django.utils.dateparse import parse_datetime
+    from core.pagination import Key, KeysetPaginator
+    if sort_by == 'group':
+        # First group name per target: ordering over the M2M join would repeat targets
+        first_group = TargetGroup.objects.filter(target=OuterRef('pk')).order_by('name').values('name')[:1]
+        targets = targets.annotate(first_group_name=Subquery(first_group))
+        keys = [Key('first_group_name'), Key('nickname'), Key('id')]
+    elif sort_by == 'anniversary':
+        keys = [Key('birth_month'), Key('birth_day'), Key('nickname'), Key('id')]
+    else: # last_contact
+        sort_by = 'last_contact'
+        keys = [Key('last_contact', descending=True, nulls_last=True, parse=parse_datetime), Key('nickname'), Key('id')]
+
+    page = KeysetPaginator(targets, keys, per_page=TARGET_LIST_PAGE_SIZE, namespace=sort_by).page(request.GET.get('cursor'))
+    next_page_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_page_url = f"{request.path}?{params.urlencode()}"
+
+    is_mobile = getattr(request, 'is_mobile', False)
+
+    # Infinite scroll: later pages only render the cards plus the next sentinel
+    if request.htmx and request.GET.get('cursor'):
+        template_name = 'mobile/_target_list_page_mobile.html' if is_mobile else '_target_list_page.html'
+        return render(request, template_name, {
+            'targets': page,
+            'next_page_url': next_page_url,
+        })
 
+    # Get Groups for Filter UI
+    groups = TargetGroup.objects.filter(user=request.user)
 
-    start_date = today
+    # Template Selection
+    if request.htmx:
+        template_name = '_target_list_partial.html'
+    elif is_mobile:
+        template_name = 'mobile/target_list_mobile.html'
+    else:
+        template_name = 'target_list.html'
 
+    return render(request, template_name, {
+        'targets': page,
+        'next_page_url': next_page_url,
+        'current_sort': sort_by,
+        'groups': groups
+    })
 
 
-    end_date = today + datetime.timedelta(days=14)
 
 
 
-    
 
 
+# FormSet for Anniversaries
 
-    upcoming_anniv_list = []
 
 
+AnniversaryFormSet = inlineformset_factory(
 
-    
 
 
+    Target, CustomAnniversary, form=CustomAnniversaryForm,
 
-    date_curs = start_date
 
 
+    extra=0, can_delete=True
 
-    while date_curs <= end_date:
 
 
+)
 
-        # Birthdays
 
 
 
-        b_targets = Target.objects.filter(
 
 
 
-            user=user, birth_month=date_curs.month, birth_day=date_curs.day
+# Events per page of the dossier's event log
+DOSSIER_EVENTS_PAGE_SIZE = 20
 
+# Targets per page of the "add to today's list" candidate picker
+CANDIDATE_PAGE_SIZE = 30
 
+# Timeline API page size (?limit=, capped)
+TIMELINE_DEFAULT_LIMIT = 20
+TIMELINE_MAX_LIMIT = 100
 
-        )
+# Items per target of the grouped timeline (?group_by_target=true&per_target=, capped)
+TIMELINE_MAX_PER_TARGET = 10
 
+# Rows fetched (and prefetched for) at a time by the NDJSON timeline stream
+TIMELINE_STREAM_CHUNK_SIZE = 500
 
+# Question titles mirrored into the base profile
+BASE_PROFILE_TITLES = {
+    '職業': 'occupation', 'ご職業': 'occupation',
+    '現在住所': 'address', '住所': 'address', 'お住まい': 'address',
+    '家族構成': 'family_structure', '家族': 'family_structure',
+    '趣味': 'hobbies', 'ご趣味': 'hobbies',
+    '弱点': 'weakness', '苦手': 'weakness', '苦手なもの': 'weakness',
+    '得意分野': 'skills', '得意': 'skills', '特技': 'skills'
+}
 
-        for t in b_targets:
 
+def target_age(target):
+    if not (target.birth_year and target.birth_month and target.birth_day):
+        return None
+    import datetime
+    today = datetime.date.today()
+    return today.year - target.birth_year - ((today.month, today.day) < (target.birth_month, target.birth_day))
+
+
+def _dossier_answers(user, target):
+    """
+    Q&A tree of the dossier: visible questions grouped by category with the
+    current answer of each (cached catalog + pointer table, two queries at most).
+    """
+    from collections import defaultdict
+    from intelligence.answers import current_answers
+    from intelligence.catalog import get_catalog
+
+    cat_to_qs = defaultdict(list)
+    for q in get_catalog(user).visible_questions():
+        cat_to_qs[q.category].append(q)
+    answers = current_answers(target)
+
+    base_answers = {key: None for key in ['occupation', 'address', 'family_structure', 'hobbies', 'weakness', 'skills']}
+    answered_base_qs_count = 0
+
+    def process_q_list(category_obj, q_list):
+        nonlocal answered_base_qs_count
+        data = {'category': category_obj, 'questions': [], 'answered_count': 0, 'total_count': len(q_list), 'progress': 0}
+        for q in q_list:
+            answer_item = answers.get(q.id)
+            if answer_item:
+                data['answered_count'] += 1
+                # Base profile reflection: linked by title, strictly
+                key = BASE_PROFILE_TITLES.get(q.title.strip())
+                if key:
+                    base_answers[key] = answer_item.content
+                    answered_base_qs_count += 1
+            data['questions'].append({
+                'question': q,
+                'answer': answer_item.content if answer_item else None,
+                'answer_date': answer_item.date if answer_item else None,
+                'is_answered': bool(answer_item),
+            })
+        if q_list:
+            data['progress'] = round((data['answered_count'] / len(q_list)) * 100)
+        return data
+
+    # Categories ordered like QuestionListView (order, created_at), uncategorized last
+    categories = sorted([c for c in cat_to_qs if c is not None], key=lambda c: (c.order, c.created_at))
+    qa_data = [process_q_list(cat, cat_to_qs[cat]) for cat in categories]
+    if None in cat_to_qs:
+        qa_data.append(process_q_list(None, cat_to_qs[None]))
+    return qa_data, base_answers, answered_base_qs_count
+
+
+def build_dossier_qa(user, target):
+    qa_data, _, _ = _dossier_answers(user, target)
+    total_q_count = sum(c['total_count'] for c in qa_data)
+    total_answered_count = sum(c['answered_count'] for c in qa_data)
+    return {
+        'qa_data': qa_data,
+        'total_q_count': total_q_count,
+        'total_answered_count': total_answered_count,
+        'global_progress': round((total_answered_count / total_q_count) * 100) if total_q_count else 0,
+    }
 
 
-            days_left = (date_curs - today).days
+def build_dossier_profile(user, target):
+    qa_data, base_answers, answered_base_qs_count = _dossier_answers(user, target)
+    custom_anniversaries = list(target.customanniversary_set.all())
+
+    # Base profile progress (14 items: 3 Bio + 1 Anniversary + 10 Questions)
+    answered_base_items = answered_base_qs_count
+    if target.birth_year:
+        answered_base_items += 3 # Birthday, Age, Eto
+    if custom_anniversaries:
+        answered_base_items += 1
+    base_progress = min(round((answered_base_items / 14) * 100), 100)
+    # HSL color for base progress (Red-to-Green: 0 to 120 deg)
+    h = int(base_progress * 1.2)
+
+    return {
+        # Category bars exclude "基本情報"
+        'qa_data_progress': [c for c in qa_data if c['category'] is None or c['category'].name != "基本情報"],
+        'base_answers': base_answers,
+        'base_progress': base_progress,
+        'base_color': f"hsl({h}, 70%, 45%)",
+        'base_shadow': f"0 0 10px hsl({h}, 70%, 45%, 0.3)",
+        'custom_anniversaries': custom_anniversaries,
+    }
 
 
+def build_dossier_tags(target):
+    from django.db.models import Count
+    from intelligence.models import Tag
+    # Tags used by THIS target's items, most used first
+    return {
+        'all_tags': list(Tag.objects.filter(timelineitem__target=target).annotate(
+            use_count=Count('timelineitem')
+        ).order_by('-use_count', 'name')),
+    }
 
-            upcoming_anniv_list.append({
 
+def build_dossier_events(target, cursor, query='', tag_id=''):
+    """One page of the target's events (newest first), optionally filtered by text, '#tag' or tag id."""
+    import datetime
+    from django.utils.dateparse import parse_datetime
+    from core.pagination import Key, KeysetPaginator, decode_cursor
+
+    events = TimelineItem.objects.filter(target=target).exclude(type='Question').prefetch_related('images', 'tags')
+    if query.startswith('#'):
+        if query[1:]:
+            events = events.filter(tags__name__icontains=query[1:]).distinct()
+    elif query:
+        events = events.filter(content__icontains=query)
+    if tag_id.isdigit():
+        events = events.filter(tags__id=tag_id)
+
+    keys = [
+        Key('date', descending=True, parse=datetime.date.fromisoformat, nullable=False),
+        Key('created_at', descending=True, parse=parse_datetime, nullable=False),
+        Key('id', descending=True, nullable=False),
+    ]
+    page = KeysetPaginator(events, keys, per_page=DOSSIER_EVENTS_PAGE_SIZE, namespace='dossier_events').page(cursor)
+
+    # Date dividers continue across pages: compare with the last date of the previous page
+    previous = decode_cursor(cursor, 'dossier_events')
+    previous_date = previous[0] if previous else None
+    items = list(page)
+    for item in items:
+        item.starts_date = item.date.isoformat() != previous_date
+        previous_date = item.date.isoformat()
+    return {
+        'events': items,
+        'next_cursor': page.next_cursor,
+        'is_first_page': not cursor,
+        'search_query': query,
+    }
 
 
-                'date': date_curs,
 
+class TargetDetailView(LoginRequiredMixin, MobileTemplateMixin, DetailView):
 
 
-                'name': 'Birthday',
 
+    model = Target
 
 
-                'target': t,
 
+    template_name = 'target_detail.html'
 
 
-                'days_left': days_left,
 
+    mobile_template_name = 'mobile/target_detail_mobile.html'
 
 
-                'is_today': days_left == 0
 
+    context_object_name = 'target'
 
 
-            })
 
 
 
-            
 
 
+    def get_object(self):
+        # Allow fetching by ?target_id= or standard PK if provided (though URL will likely be clean)
+        pk = self.request.GET.get('target_id')
+        if not pk:
+            # Fallback to URL kwarg if present
+            return super().get_object()
+        return get_object_or_404(Target.objects.select_related('stats'), pk=pk, user=self.request.user)
 
-        # Custom
+    def get_context_data(self, **kwargs):
+        # First paint: profile header only. Base profile, Q&A, events and tags
+        # are fragments loaded on demand (TargetDossierSectionView).
+        context = super().get_context_data(**kwargs)
+        target = self.object
+        context['age'] = target_age(target)
+
+        # Stats (Denormalized, see intelligence/stats.py)
+        from intelligence.stats import ensure_stats
+        stats = ensure_stats(target)
+        context['log_count'] = stats.log_count
+        context['contact_count'] = stats.contact_count
+        context['total_points'] = stats.total_points
+        context['total_answers'] = stats.answered_question_count
+        return context
 
 
+class TargetDossierSectionView(LoginRequiredMixin, View):
+    """
+    One lazily loaded fragment of the target dossier (hx-get from target_detail):
+    profile (base profile & category progress), qa, events (keyset paginated,
+    filterable) or tags. Each section is cached per target under its own
+    snapshot key (see core/snapshots.py).
+    """
+    SECTIONS = ('profile', 'qa', 'events', 'tags')
 
-        c_annivs = CustomAnniversary.objects.filter(
+    def get(self, request, pk, section):
+        import hashlib
+        from django.http import Http404
+        from core.snapshots import get_user_snapshot
+        from intelligence.versions import get_catalog_versions
 
+        if section not in self.SECTIONS:
+            raise Http404
+        target = get_object_or_404(Target, pk=pk, user=request.user)
+        user = request.user
 
+        if section == 'profile':
+            context = get_user_snapshot(
+                'dossier_profile', user, lambda: build_dossier_profile(user, target), target.pk, *get_catalog_versions(user.pk)
+            )
+        elif section == 'qa':
+            context = get_user_snapshot(
+                'dossier_qa', user, lambda: build_dossier_qa(user, target), target.pk, *get_catalog_versions(user.pk)
+            )
+        elif section == 'tags':
+            context = get_user_snapshot('dossier_tags', user, lambda: build_dossier_tags(target), target.pk)
+        else:
+            cursor = request.GET.get('cursor', '')
+            query = request.GET.get('q', '').strip()
+            tag_id = request.GET.get('tag', '')
+            # Free text in the key is hashed (memcached keys cannot contain spaces)
+            page_key = hashlib.md5(f'{cursor}\n{query}\n{tag_id}'.encode()).hexdigest()
+            context = get_user_snapshot(
+                'dossier_events', user, lambda: build_dossier_events(target, cursor, query, tag_id), target.pk, page_key,
+            )
+            if context['next_cursor']:
+                params = request.GET.copy()
+                params['cursor'] = context['next_cursor']
+                context = {**context, 'next_page_url': f"{request.path}?{params.urlencode()}"}
 
-            target__user=user, date__month=date_curs.month, date__day=date_curs.day
+        template_name = f'_dossier_{section}.html'
+        if getattr(request, 'is_mobile', False):
+            template_name = f'mobile/_dossier_{section}_mobile.html'
+        return render(request, template_name, {'target': target, **context})
 
 
 
-        ).select_related('target')
 
 
 
-        for ca in c_annivs:
 
+class TargetCreateView(LoginRequiredMixin, CreateView):
 
 
-            days_left = (date_curs - today).days
 
+    model = Target
 
 
-            upcoming_anniv_list.append({
 
+    form_class = TargetForm
 
 
-                'date': date_curs,
 
+    template_name = 'target_form.html'
 
 
-                'name': ca.label,
 
+    success_url = reverse_lazy('target_list')
 
 
-                'target': ca.target,
 
 
 
-                'days_left': days_left,
 
 
+    def get_form_kwargs(self):
 
-                'is_today': days_left == 0
 
 
+        kwargs = super().get_form_kwargs()
 
-            })
 
 
+        kwargs['user'] = self.request.user
 
-            
 
 
+        return kwargs
 
-        date_curs += datetime.timedelta(days=1)
 
 
 
-        
 
 
 
-    upcoming_anniv_list.sort(key=lambda x: x['date'])
+    def get_context_data(self, **kwargs):
 
 
 
+        context = super().get_context_data(**kwargs)
 
 
 
+        if self.request.POST:
 
-    # Filters Support (Groups, Tags)
 
 
+            context['anniversaries'] = AnniversaryFormSet(self.request.POST)
 
-    groups = TargetGroup.objects.filter(user=user)
 
 
+        else:
 
-    top_tags = Tag.objects.filter(
 
 
+            context['anniversaries'] = AnniversaryFormSet()
 
-        timelineitem__target__user=user
 
 
+        context['group_form'] = TargetGroupForm() # For the modal
 
-    ).annotate(c=Count('timelineitem')).order_by('-c')[:20]
 
 
+        from django.db.models import Count
 
 
 
+        context['user_groups'] = TargetGroup.objects.filter(user=self.request.user).annotate(target_count=Count('target'))
 
 
-    context = {
 
+        return context
 
 
-        'random_question': random_question,
 
 
 
-        'latest_logs': latest_logs,
 
 
+    def form_valid(self, form):
 
-        'latest_answers': latest_answers,
 
 
+        context = self.get_context_data()
 
-        'upcoming_anniversaries': upcoming_anniv_list,
 
 
+        anniversaries = context['anniversaries']
 
-        'groups': groups,
 
 
+        with transaction.atomic():
 
-        'tags': top_tags,
 
 
+            form.instance.user = self.request.user
 
-    }
 
 
+            self.object = form.save()
 
-    
 
 
+            if anniversaries.is_valid():
 
-    if getattr(request, 'is_mobile', False):
 
 
+                anniversaries.instance = self.object
 
-        return render(request, 'mobile/home_mobile.html', context)
 
 
+                anniversaries.save()
 
-        
 
 
+        return super().form_valid(form)
 
-    return render(request, 'dashboard.html', context)
 
 
 
 
 
 
+class TargetUpdateView(LoginRequiredMixin, UpdateView):
 
-@login_required
 
 
+    model = Target
 
-@login_required
 
 
+    form_class = TargetForm
 
-def target_list(request):
 
 
+    template_name = 'target_form.html'
 
-    from django.db.models import Count, Sum, Q, Subquery, OuterRef
 
 
+    success_url = reverse_lazy('target_list')
 
-    
 
 
 
-    sort_by = request.GET.get('sort', 'last_contact')
 
 
 
-    search_query = request.GET.get('q')
+    def get_queryset(self):
 
 
 
-    group_filter = request.GET.get('group')
+        return Target.objects.filter(user=self.request.user)
 
 
 
-    
 
 
 
-    # Base Query
 
+    def get_form_kwargs(self):
 
 
-    targets = Target.objects.filter(user=request.user).prefetch_related('groups')
 
+        kwargs = super().get_form_kwargs()
 
 
 
+        kwargs['user'] = self.request.user
 
 
 
-    # Search Filter
+        return kwargs
 
 
 
-    if search_query:
 
 
 
-        targets = targets.filter(
 
+    def get_context_data(self, **kwargs):
 
 
-            Q(nickname__icontains=search_query) |
 
+        context = super().get_context_data(**kwargs)
 
 
-            Q(first_name__icontains=search_query) |
 
+        if self.request.POST:
 
 
-            Q(last_name__icontains=search_query) |
 
+            context['anniversaries'] = AnniversaryFormSet(self.request.POST, instance=self.object)
 
 
-            Q(first_name_kana__icontains=search_query) |
 
+        else:
 
 
-            Q(last_name_kana__icontains=search_query)
 
+            context['anniversaries'] = AnniversaryFormSet(instance=self.object)
 
 
-        )
 
+        context['group_form'] = TargetGroupForm()
 
 
 
+        from django.db.models import Count
 
 
 
-    # Group Filter
+        context['user_groups'] = TargetGroup.objects.filter(user=self.request.user).annotate(target_count=Count('target'))
 
 
 
-    if group_filter:
+        context['is_edit'] = True
 
 
 
-        targets = targets.filter(groups__id=group_filter)
+        return context
 
 
 
@@ -518,347 +837,362 @@ def target_list(request):
 
 
 
-    # Annotations
+    def form_valid(self, form):
 
 
 
-    # Latest Message Subquery
+        context = self.get_context_data()
 
 
 
-    latest_msg = TimelineItem.objects.filter(
+        anniversaries = context['anniversaries']
 
 
 
-        target=OuterRef('pk')
+        with transaction.atomic():
 
 
 
-    ).order_by('-date', '-created_at').values('content')[:1]
+            self.object = form.save()
 
 
 
+            if anniversaries.is_valid():
 
 
 
+                anniversaries.instance = self.object
 
-    targets = targets.annotate(
 
 
+                anniversaries.save()
 
-        total_points=Sum('timelineitem__question__rank__points', filter=Q(timelineitem__type='Question')),
 
 
+        return super().form_valid(form)
 
-        log_count=Count('timelineitem'),
 
 
 
-        latest_msg_content=Subquery(latest_msg)
 
 
 
-    )
+class TargetDeleteView(LoginRequiredMixin, DeleteView):
 
 
 
+    model = Target
 
 
 
+    success_url = reverse_lazy('target_list')
 
-    # Sorting
 
 
+    template_name = 'target_confirm_delete.html' 
 
-    if sort_by == 'group':
 
 
+    
 
-        targets = targets.order_by('groups__name', 'nickname')
 
 
+    def get_queryset(self):
 
-    elif sort_by == 'anniversary':
 
 
+        return Target.objects.filter(user=self.request.user)
 
-        targets = targets.order_by('birth_month', 'birth_day', 'nickname')
 
 
 
-    else: # last_contact
 
 
 
-        from django.db.models import F
+class TargetGroupCreateView(LoginRequiredMixin, View):
 
 
 
-        targets = targets.order_by(F('last_contact').desc(nulls_last=True), 'nickname')
+    def post(self, request, *args, **kwargs):
 
 
 
+        try:
 
 
 
+            data = json.loads(request.body)
 
-    # Get Groups for Filter UI
 
 
+            name = data.get('name')
 
-    groups = TargetGroup.objects.filter(user=request.user)
 
 
+            description = data.get('description', '')
 
 
 
+            if not name:
 
 
-    # Template Selection
 
+                return JsonResponse({'success': False, 'error': 'Group name is required'})
 
 
-    if request.htmx:
 
+            
 
 
-        template_name = '_target_list_partial.html'
 
+            # Check existing group for THIS user
 
 
-    elif getattr(request, 'is_mobile', False):
 
+            group, created = TargetGroup.objects.get_or_create(
 
 
-        template_name = 'mobile/target_list_mobile.html'
 
+                name=name, 
 
 
-    else:
 
+                user=request.user, 
 
 
-        template_name = 'target_list.html'
 
+                defaults={
 
 
 
+                    'description': description,
 
 
 
-    return render(request, template_name, {
+                    'is_mon': data.get('is_mon', False),
 
 
 
-        'targets': targets, 
+                    'is_tue': data.get('is_tue', False),
 
 
 
-        'current_sort': sort_by,
+                    'is_wed': data.get('is_wed', False),
 
 
 
-        'groups': groups
+                    'is_thu': data.get('is_thu', False),
 
 
 
-    })
+                    'is_fri': data.get('is_fri', False),
 
 
 
+                    'is_sat': data.get('is_sat', False),
 
 
 
+                    'is_sun': data.get('is_sun', False),
 
-# FormSet for Anniversaries
 
 
+                }
 
-AnniversaryFormSet = inlineformset_factory(
 
 
+            )
 
-    Target, CustomAnniversary, form=CustomAnniversaryForm,
 
 
+            
 
-    extra=0, can_delete=True
 
 
+            return JsonResponse({'success': True, 'id': group.id, 'name': group.name})
 
-)
 
 
+        except Exception as e:
 
 
 
+            return JsonResponse({'success': False, 'error': str(e)})
 
 
-class TargetDetailView(LoginRequiredMixin, MobileTemplateMixin, DetailView):
 
 
 
-    model = Target
 
 
+class TargetGroupUpdateView(LoginRequiredMixin, View):
 
-    template_name = 'target_detail.html'
 
 
+    def post(self, request, pk, *args, **kwargs):
 
-    mobile_template_name = 'mobile/target_detail_mobile.html'
 
 
+        try:
 
-    context_object_name = 'target'
 
 
+            group = TargetGroup.objects.get(pk=pk, user=request.user)
 
 
 
+            data = json.loads(request.body)
 
 
-    def get_object(self):
 
+            group.name = data.get('name', group.name)
 
 
-        # Allow fetching by ?target_id= or standard PK if provided (though URL will likely be clean)
 
+            group.description = data.get('description', group.description)
 
 
-        pk = self.request.GET.get('target_id')
 
+            # Update frequency fields ?? User didn't explicitly ask but good to have
 
 
-        if not pk:
 
+            if 'is_mon' in data: group.is_mon = data.get('is_mon')
 
 
-            # Fallback to URL kwarg if present
 
+            if 'is_tue' in data: group.is_tue = data.get('is_tue')
 
 
-            return super().get_object()
 
+            if 'is_wed' in data: group.is_wed = data.get('is_wed')
 
 
-        
 
+            if 'is_thu' in data: group.is_thu = data.get('is_thu')
 
 
-        return get_object_or_404(Target, pk=pk, user=self.request.user)
 
+            if 'is_fri' in data: group.is_fri = data.get('is_fri')
 
 
 
+            if 'is_sat' in data: group.is_sat = data.get('is_sat')
 
 
 
-    def get_context_data(self, **kwargs):
+            if 'is_sun' in data: group.is_sun = data.get('is_sun')
 
 
 
-        context = super().get_context_data(**kwargs)
+            group.save()
 
 
 
-        target = self.object
+            return JsonResponse({'success': True})
 
 
 
-        
+        except TargetGroup.DoesNotExist:
+
 
 
+            return JsonResponse({'success': False, 'error': 'Group not found'})
 
-        # Calculate Age
 
 
+        except Exception as e:
 
-        from datetime import date
 
 
+            return JsonResponse({'success': False, 'error': str(e)})
 
-        context['age'] = None
 
 
 
-        if target.birth_year and target.birth_month and target.birth_day:
 
 
 
-            today = date.today()
+class TargetGroupDeleteView(LoginRequiredMixin, View):
 
 
 
-            context['age'] = today.year - target.birth_year - (
+    def post(self, request, pk, *args, **kwargs):
 
 
 
-                (today.month, today.day) < (target.birth_month, target.birth_day)
+        try:
 
 
 
-            )
+            group = TargetGroup.objects.get(pk=pk, user=request.user)
 
 
 
-        
+            group.delete()
+
 
 
+            return JsonResponse({'success': True})
 
-        # 1. Stats
 
 
+        except TargetGroup.DoesNotExist:
 
-        # Total Log Count
 
 
+            return JsonResponse({'success': False, 'error': 'Group not found'})
 
-        context['log_count'] = TimelineItem.objects.filter(target=target).count()
 
 
+        except Exception as e:
 
-        # Contact Count
 
 
+            return JsonResponse({'success': False, 'error': str(e)})
 
-        context['contact_count'] = TimelineItem.objects.filter(target=target, contact_made=True).count()
 
 
 
-        
+class IntelligenceLogView(LoginRequiredMixin, View):
+    template_name = 'intelligence_log.html'
 
+    @staticmethod
+    def get_daily_target_ids_logic(user, date):
+        # {target_id: {'sources': {'group', 'anniversary', 'manual'}, 'anniv_label': str}} from the DailyRoster store
+        from intelligence.roster import roster_on
+        return roster_on(user, date)
 
+    def get_daily_target_ids(self, user, date):
+        return self.get_daily_target_ids_logic(user, date)
 
-        # Calculate Total Points & Answers
 
 
 
-        from django.db.models import Sum, Count, Q
 
 
 
-        points_data = TimelineItem.objects.filter(
+    def get(self, request, *args, **kwargs):
 
 
 
-            target=target, type='Question'
+        import datetime
 
 
 
-        ).aggregate(
+        from django.db.models import Q
 
 
 
-            total_points=Sum('question__rank__points'),
+        
 
 
 
-            total_answers=Count('question', distinct=True)
+        is_mobile = getattr(request, 'is_mobile', False)
 
 
 
-        )
+        target_id_param = request.GET.get('target_id')
 
 
 
@@ -866,2695 +1200,616 @@ class TargetDetailView(LoginRequiredMixin, MobileTemplateMixin, DetailView):
 
 
 
-        context['total_points'] = points_data['total_points'] or 0
+        # 1. Date Handling
 
 
 
-        context['total_answers'] = points_data['total_answers'] or 0
+        date_str = request.GET.get('date')
 
 
 
-        
+        if date_str:
 
 
 
-        # 2. Q&A and Progress Calculation (Robust Question-First Approach)
+            try:
 
 
 
-        from intelligence.models import Question, QuestionCategory
+                current_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
 
 
 
-        from accounts.models import CustomUser
+            except ValueError:
 
 
 
-        
+                current_date = datetime.date.today()
 
 
 
-        # 2.1 Fetch all visible questions once
+        else:
 
 
 
-        visible_qs = Question.objects.filter(
+            current_date = datetime.date.today()
 
 
 
-            Q(user=self.request.user) | Q(is_shared=True) | Q(user__role='MASTER')
 
 
 
-        ).distinct().select_related('category', 'user').order_by('category__order', 'category__created_at', 'order', 'title')
 
+        # [MOBILE OPTIMIZATION] Timeline View - Short Circuit
 
 
 
+        if is_mobile and target_id_param:
 
 
 
-        # 2.2 Prepare grouping
+            target = get_object_or_404(Target, pk=target_id_param, user=request.user)
 
 
 
-        from collections import defaultdict
+            
 
 
 
-        cat_to_qs = defaultdict(list)
+            # Auto-Add Logic (Ensure it's marked as active for today)
 
 
 
-        all_visible_cats = set()
+            state, _ = DailyTargetState.objects.get_or_create(
 
 
 
-        
+                target=target, date=current_date,
 
 
 
-        for q in visible_qs:
+                defaults={'is_manual_add': True, 'is_hidden': False}
 
 
 
-            cat_to_qs[q.category].append(q)
+            )
 
 
 
-            if q.category:
+            if not state.is_manual_add and state.is_hidden:
 
 
 
-                all_visible_cats.add(q.category)
+                    state.is_hidden = False
 
 
 
+                    state.save()
 
 
 
+            elif not state.is_manual_add:
 
-        # 2.3 Mapping Title to Key for Base Profile
 
 
+                    state.is_manual_add = True
 
-        base_title_map = {
 
 
+                    state.save()
 
-            '職業': 'occupation', 'ご職業': 'occupation',
 
 
+            
 
-            '現在住所': 'address', '住所': 'address', 'お住まい': 'address',
 
 
+            # [SSR] Fetch and Group Timeline Items
 
-            '家族構成': 'family_structure', '家族': 'family_structure',
 
 
+            # Note: TimelineItem is shared if target is shared.
 
-            '趣味': 'hobbies', 'ご趣味': 'hobbies',
 
 
+            raw_items = TimelineItem.objects.filter(target=target).prefetch_related('images').order_by('date', 'created_at')
 
-            '弱点': 'weakness', '苦手': 'weakness', '苦手なもの': 'weakness',
 
 
+            
 
-            '得意分野': 'skills', '得意': 'skills', '特技': 'skills'
 
 
+            grouped_timeline = []
 
-        }
 
 
+            current_group = None
 
-        base_answers = {
 
 
+            for item in raw_items:
 
-            'occupation': None, 'address': None, 'family_structure': None, 
 
 
+                date_str = item.date.strftime('%Y-%m-%d')
 
-            'hobbies': None, 'weakness': None, 'skills': None
 
 
+                if current_group and current_group['date_str'] == date_str:
 
-        }
 
 
+                    current_group['items'].append(item)
 
-        answered_base_qs_count = 0
 
 
+                    if item.contact_made: current_group['has_contact'] = True
 
 
 
+                else:
 
 
-        # 2.4 Process Categories
 
+                    if current_group: grouped_timeline.append(current_group)
 
 
-        # Sort categories based on the same logic as QuestionListView: Order/CreatedAt
 
+                    current_group = {
 
 
-        sorted_cats = sorted(list(all_visible_cats), key=lambda x: (x.order, x.created_at))
 
+                        'date': item.date,
 
 
-        
 
+                        'date_str': date_str,
 
 
-        qa_data = [] # List of {category, questions: [{question, answer, is_answered}], answered_count, total_count, progress}
 
+                        'items': [item],
 
 
-        total_q_count = 0
 
+                        'has_contact': item.contact_made
 
 
-        total_answered_count = 0
 
+                    }
 
 
 
+            if current_group: grouped_timeline.append(current_group)
 
 
 
-        def process_q_list(category_obj, q_list):
 
 
 
-            nonlocal total_q_count, total_answered_count, answered_base_qs_count
 
+            timeline_items = grouped_timeline # Pass as 'timeline_items' but structure changed
 
 
-            q_count = len(q_list)
 
+ 
 
 
-            data = {
 
+            
 
 
-                'category': category_obj,
 
+            return render(request, 'mobile/intelligence_timeline_mobile.html', {
 
 
-                'questions': [],
 
+                'target': target,
 
 
-                'answered_count': 0,
 
+                'today_date': current_date, # This is actually specific date from param if set
 
 
-                'total_count': q_count,
 
+                'timeline_items': timeline_items,
 
 
-                'progress': 0
 
+            })
 
 
-            }
 
 
 
-            total_q_count += q_count
 
 
+        weekday = current_date.weekday() # 0=Mon
 
-            
 
 
+        weekday_map = ['is_mon', 'is_tue', 'is_wed', 'is_thu', 'is_fri', 'is_sat', 'is_sun']
 
-            for q in q_list:
 
 
+        current_weekday_field = weekday_map[weekday]
 
-                answer_item = TimelineItem.objects.filter(
 
 
 
-                    target=target, type='Question', question=q
 
 
 
-                ).order_by('-date', '-created_at').first()
+        # 1.5 Auto-Add Logic (From Target List LOG button)
 
 
 
-                
+        target_id_param = request.GET.get('target_id')
 
 
 
-                is_answered = bool(answer_item)
+        if target_id_param:
 
 
 
-                if is_answered:
+            try:
 
 
 
-                    data['answered_count'] += 1
+                auto_target = Target.objects.get(pk=target_id_param, user=request.user)
 
 
 
-                    total_answered_count += 1
+                # Ensure it's in today's list
 
 
 
-                    
+                state, _ = DailyTargetState.objects.get_or_create(
 
 
 
-                    # [REQUIREMENT 2] BASE PROFILE REFLECTION
+                    target=auto_target, date=current_date,
 
 
 
-                    # Link by Title, strictly. If title matches, show it.
+                    defaults={'is_manual_add': True, 'is_hidden': False}
 
 
 
-                    clean_title = q.title.strip()
+                )
 
 
 
-                    if clean_title in base_title_map:
+                if not state.is_manual_add and state.is_hidden: # If it was hidden, unhide it
 
 
 
-                        key = base_title_map[clean_title]
+                     state.is_hidden = False
 
 
 
-                        base_answers[key] = answer_item.content
+                     state.save()
 
 
 
-                        answered_base_qs_count += 1
+                elif not state.is_manual_add: # Ensure it is marked as manual add if not already
 
 
 
-                
+                     state.is_manual_add = True
 
 
 
-                data['questions'].append({
+                     state.save()
 
 
 
-                    'question': q,
+            except Target.DoesNotExist:
 
 
 
-                    'answer': answer_item.content if is_answered else None,
+                pass
 
 
 
-                    'answer_date': answer_item.date if is_answered else None,
+        
 
 
 
-                    'is_answered': is_answered
+        # Get IDs with Metadata
+        final_info = self.get_daily_target_ids(request.user, current_date)
+        final_ids = final_info.keys()
+        
+        # Fetch Objects & Annotate for UI (last contact from TargetStats)
+        from django.db.models import F, Count
+        from intelligence.anniversaries import nearest_anniversaries
+        targets = list(Target.objects.filter(id__in=final_ids).prefetch_related(
+            'groups', 'customanniversary_set'
+        ).annotate(
+            real_last_contact=F('stats__real_last_contact')
+        ).order_by('nickname'))
+
+        # Today's log counts for the whole roster in one grouped query
+        log_counts = dict(
+            TimelineItem.objects.filter(target__in=targets, date=current_date)
+            .order_by().values('target_id').annotate(n=Count('id')).values_list('target_id', 'n')
+        )
+        nearest = nearest_anniversaries(targets, current_date)
 
+        target_list = []
+        for t in targets:
+            log_count = log_counts.get(t.id, 0)
 
+            anniv_display = None
+            if t.id in nearest:
+                anniv_date, anniv_label, anniv_kind = nearest[t.id]
+                days_until = (anniv_date - current_date).days
 
-                })
+                color_class = "text-text-sub" # Default gray
+                if days_until == 0:
+                    color_class = "text-accent-red font-bold"
+                elif days_until <= 10:
+                    color_class = "text-yellow-500"
 
+                anniv_display = {
+                    'label': anniv_label,
+                    'date_str': anniv_date.strftime('%Y/%m/%d'),
+                    'color_class': color_class,
+                    'icon': "fa-birthday-cake" if anniv_kind == 'birthday' else "fa-medal",
+                    'is_today': days_until == 0
+                }
 
+            info = final_info.get(t.id, {'sources': set()})
+            target_list.append({
+                'obj': t,
+                'has_entry': log_count > 0,
+                'log_count': log_count,
+                'age': t.age,
+                'last_contact_date': t.real_last_contact,
+                'nearest_anniversary': anniv_display,
+                # New Metadata
+                'is_manual': 'manual' in info['sources'],
+                'is_group': 'group' in info['sources'],
+                'is_anniversary': 'anniversary' in info['sources'],
+                'anniversary_label': info.get('anniv_label', '')
+            })
 
-            
 
 
 
-            if q_count > 0:
 
 
 
-                data['progress'] = round((data['answered_count'] / q_count) * 100)
+        # Questions & Categories (Owned OR Shared OR MASTER, plus categories used by the questions) from the cached catalog
+        from intelligence.catalog import get_catalog
+        catalog = get_catalog(request.user)
+        questions = catalog.visible_questions()
+        categories = catalog.visible_categories(questions)
 
 
 
-            return data
 
 
 
 
+        from django.db.models import Count
 
 
 
-        # Add categorized groups
+        from intelligence.models import Tag
 
 
 
-        for cat in sorted_cats:
+        # Filter tags used by THIS user's targets
 
 
 
-            qa_data.append(process_q_list(cat, cat_to_qs[cat]))
+        top_tags = Tag.objects.filter(
 
 
 
-        
+            timelineitem__target__user=request.user
 
 
 
-        # Add uncategorized group (if exists)
+        ).annotate(count=Count('timelineitem')).order_by('-count')[:10]
 
 
 
-        if None in cat_to_qs:
 
 
 
-            qa_data.append(process_q_list(None, cat_to_qs[None]))
 
+        context = {
+            'todays_targets': target_list,
+            'any_manual': any(it['is_manual'] for it in target_list),
+            'any_system': any(not it['is_manual'] for it in target_list),
+            'questions': questions,
+            'categories': categories, # Add categories to context
+            'tags': top_tags,
+            'today_date': current_date,
+            'weekday_jp': ['月','火','水','木','金','土','日'][weekday]
+        }
 
 
-            
 
+        if is_mobile:
 
 
-        # Sort category progress: Exclude "基本情報" for the category bar display
 
+            return render(request, 'mobile/intelligence_select_mobile.html', context)
 
 
-        context['qa_data_progress'] = [c for c in qa_data if c['category'] is None or c['category'].name != "基本情報"]
 
+        
 
 
-        context['qa_data'] = qa_data # Keep full list for the Q&A tab
 
+        return render(request, self.template_name, context)
 
 
-        
 
 
 
-        # Calculate Base Profile Progress (14 items: 3 Bio + 1 Anniversary + 10 Questions)
 
 
+    def post(self, request, *args, **kwargs):
 
-        answered_base_items = 0
 
 
+        import datetime
 
-        if target.birth_year:
 
 
+        import re
 
-            answered_base_items += 3 # Birthday, Age, Eto
 
 
+        from django.utils import timezone
 
-        if target.customanniversary_set.exists():
 
 
+        from intelligence.models import TimelineImage
 
-            answered_base_items += 1
 
 
+        
 
-        answered_base_items += answered_base_qs_count
 
 
+        try:
 
-        
 
 
+            # 1. Parse Data (Support JSON & Multipart)
 
-        context['base_answers'] = base_answers
 
 
+            images = []
 
-        context['base_progress'] = min(round((answered_base_items / 14) * 100), 100)
 
 
+            if request.content_type == 'application/json':
 
-        
 
 
+                data = json.loads(request.body)
 
-        # Calculate HSL color for Base Progress (Red-to-Green: 0 to 120 deg)
 
 
+            else:
 
-        h = int(context['base_progress'] * 1.2)
 
 
+                data = request.POST
 
-        context['base_color'] = f"hsl({h}, 70%, 45%)"
 
 
+                images = request.FILES.getlist('images')
 
-        context['base_shadow'] = f"0 0 10px hsl({h}, 70%, 45%, 0.3)"
 
 
 
-        
 
 
 
-        # Global Progress (ensure counts for display)
+            # Action: 'create' (default), 'update' or 'delete'
 
 
 
-        context['total_q_count'] = total_q_count
+            action = data.get('action', 'create')
 
 
 
-        context['total_answered_count'] = total_answered_count
+            
 
 
 
-        if total_q_count > 0:
+            if action == 'delete':
 
 
 
-            context['global_progress'] = round((total_answered_count / total_q_count) * 100)
+                item_id = data.get('item_id')
 
 
 
-        else:
+                if not item_id: return JsonResponse({'success': False, 'error': 'Item ID required'})
 
 
 
-            context['global_progress'] = 0
+                
 
 
 
+                item = get_object_or_404(TimelineItem, pk=item_id, target__user=request.user)
 
 
 
+                target = item.target
 
-        # 3. Events / Event Log (Include Questions, Sort by Date DESC)
 
 
+                date = item.date
 
-        # Fetch more than 20 to support basic log browsing
 
 
+                item.delete()
 
-        context['events'] = TimelineItem.objects.filter(
 
 
+                
 
-            target=target
 
 
+                # Check if any entry remains for this date
 
-        ).exclude(type='Question').prefetch_related('images', 'tags').order_by('-date', '-created_at')[:100]
 
 
+                has_entry_today = TimelineItem.objects.filter(target=target, date=date).exists()
 
-        
 
 
+                return JsonResponse({'success': True, 'has_entry_today': has_entry_today, 'target_id': target.id})
 
-        # 4. Tags (Top tags for this specific target)
 
 
 
-        from django.db.models import Count
 
 
 
-        from intelligence.models import Tag
+            elif action == 'refresh_list':
 
 
 
-        # Get all tags used by THIS target's items, sorted by count
+                # Remove (Hide) displayed targets with 0 logs from the selection list for this date
 
 
 
-        context['all_tags'] = Tag.objects.filter(
+                date_str = data.get('date')
 
 
 
-            timelineitem__target=target
+                try:
 
 
 
-        ).annotate(use_count=Count('timelineitem')).order_by('-use_count')
+                    date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
 
 
 
-        
+                except (ValueError, TypeError):
 
 
 
-        # 5. Anniversaries
+                    return JsonResponse({'success': False, 'error': 'Invalid date'})
 
 
 
-        context['custom_anniversaries'] = target.customanniversary_set.all()
 
 
 
-        
-
-
-
-        return context
-
-
-
-
-
-
-
-class TargetCreateView(LoginRequiredMixin, CreateView):
-
-
-
-    model = Target
-
-
-
-    form_class = TargetForm
-
-
-
-    template_name = 'target_form.html'
-
-
-
-    success_url = reverse_lazy('target_list')
-
-
-
-
-
-
-
-    def get_form_kwargs(self):
-
-
-
-        kwargs = super().get_form_kwargs()
-
-
-
-        kwargs['user'] = self.request.user
-
-
-
-        return kwargs
-
-
-
-
-
-
-
-    def get_context_data(self, **kwargs):
-
-
-
-        context = super().get_context_data(**kwargs)
-
-
-
-        if self.request.POST:
-
-
-
-            context['anniversaries'] = AnniversaryFormSet(self.request.POST)
-
-
-
-        else:
-
-
-
-            context['anniversaries'] = AnniversaryFormSet()
-
-
-
-        context['group_form'] = TargetGroupForm() # For the modal
-
-
-
-        from django.db.models import Count
-
-
-
-        context['user_groups'] = TargetGroup.objects.filter(user=self.request.user).annotate(target_count=Count('target'))
-
-
-
-        return context
-
-
-
-
-
-
-
-    def form_valid(self, form):
-
-
-
-        context = self.get_context_data()
-
-
-
-        anniversaries = context['anniversaries']
-
-
-
-        with transaction.atomic():
-
-
-
-            form.instance.user = self.request.user
-
-
-
-            self.object = form.save()
-
-
-
-            if anniversaries.is_valid():
-
-
-
-                anniversaries.instance = self.object
-
-
-
-                anniversaries.save()
-
-
-
-        return super().form_valid(form)
-
-
-
-
-
-
-
-class TargetUpdateView(LoginRequiredMixin, UpdateView):
-
-
-
-    model = Target
-
-
-
-    form_class = TargetForm
-
-
-
-    template_name = 'target_form.html'
-
-
-
-    success_url = reverse_lazy('target_list')
-
-
-
-
-
-
-
-    def get_queryset(self):
-
-
-
-        return Target.objects.filter(user=self.request.user)
-
-
-
-
-
-
-
-    def get_form_kwargs(self):
-
-
-
-        kwargs = super().get_form_kwargs()
-
-
-
-        kwargs['user'] = self.request.user
-
-
-
-        return kwargs
-
-
-
-
-
-
-
-    def get_context_data(self, **kwargs):
-
-
-
-        context = super().get_context_data(**kwargs)
-
-
-
-        if self.request.POST:
-
-
-
-            context['anniversaries'] = AnniversaryFormSet(self.request.POST, instance=self.object)
-
-
-
-        else:
-
-
-
-            context['anniversaries'] = AnniversaryFormSet(instance=self.object)
-
-
-
-        context['group_form'] = TargetGroupForm()
-
-
-
-        from django.db.models import Count
-
-
-
-        context['user_groups'] = TargetGroup.objects.filter(user=self.request.user).annotate(target_count=Count('target'))
-
-
-
-        context['is_edit'] = True
-
-
-
-        return context
-
-
-
-
-
-
-
-    def form_valid(self, form):
-
-
-
-        context = self.get_context_data()
-
-
-
-        anniversaries = context['anniversaries']
-
-
-
-        with transaction.atomic():
-
-
-
-            self.object = form.save()
-
-
-
-            if anniversaries.is_valid():
-
-
-
-                anniversaries.instance = self.object
-
-
-
-                anniversaries.save()
-
-
-
-        return super().form_valid(form)
-
-
-
-
-
-
-
-class TargetDeleteView(LoginRequiredMixin, DeleteView):
-
-
-
-    model = Target
-
-
-
-    success_url = reverse_lazy('target_list')
-
-
-
-    template_name = 'target_confirm_delete.html' 
-
-
-
-    
-
-
-
-    def get_queryset(self):
-
-
-
-        return Target.objects.filter(user=self.request.user)
-
-
-
-
-
-
-
-class TargetGroupCreateView(LoginRequiredMixin, View):
-
-
-
-    def post(self, request, *args, **kwargs):
-
-
-
-        try:
-
-
-
-            data = json.loads(request.body)
-
-
-
-            name = data.get('name')
-
-
-
-            description = data.get('description', '')
-
-
-
-            if not name:
-
-
-
-                return JsonResponse({'success': False, 'error': 'Group name is required'})
-
-
-
-            
-
-
-
-            # Check existing group for THIS user
-
-
-
-            group, created = TargetGroup.objects.get_or_create(
-
-
-
-                name=name, 
-
-
-
-                user=request.user, 
-
-
-
-                defaults={
-
-
-
-                    'description': description,
-
-
-
-                    'is_mon': data.get('is_mon', False),
-
-
-
-                    'is_tue': data.get('is_tue', False),
-
-
-
-                    'is_wed': data.get('is_wed', False),
-
-
-
-                    'is_thu': data.get('is_thu', False),
-
-
-
-                    'is_fri': data.get('is_fri', False),
-
-
-
-                    'is_sat': data.get('is_sat', False),
-
-
-
-                    'is_sun': data.get('is_sun', False),
-
-
-
-                }
-
-
-
-            )
-
-
-
-            
-
-
-
-            return JsonResponse({'success': True, 'id': group.id, 'name': group.name})
-
-
-
-        except Exception as e:
-
-
-
-            return JsonResponse({'success': False, 'error': str(e)})
-
-
-
-
-
-
-
-class TargetGroupUpdateView(LoginRequiredMixin, View):
-
-
-
-    def post(self, request, pk, *args, **kwargs):
-
-
-
-        try:
-
-
-
-            group = TargetGroup.objects.get(pk=pk, user=request.user)
-
-
-
-            data = json.loads(request.body)
-
-
-
-            group.name = data.get('name', group.name)
-
-
-
-            group.description = data.get('description', group.description)
-
-
-
-            # Update frequency fields ?? User didn't explicitly ask but good to have
-
-
-
-            if 'is_mon' in data: group.is_mon = data.get('is_mon')
-
-
-
-            if 'is_tue' in data: group.is_tue = data.get('is_tue')
-
-
-
-            if 'is_wed' in data: group.is_wed = data.get('is_wed')
-
-
-
-            if 'is_thu' in data: group.is_thu = data.get('is_thu')
-
-
-
-            if 'is_fri' in data: group.is_fri = data.get('is_fri')
-
-
-
-            if 'is_sat' in data: group.is_sat = data.get('is_sat')
-
-
-
-            if 'is_sun' in data: group.is_sun = data.get('is_sun')
-
-
-
-            group.save()
-
-
-
-            return JsonResponse({'success': True})
-
-
-
-        except TargetGroup.DoesNotExist:
-
-
-
-            return JsonResponse({'success': False, 'error': 'Group not found'})
-
-
-
-        except Exception as e:
-
-
-
-            return JsonResponse({'success': False, 'error': str(e)})
-
-
-
-
-
-
-
-class TargetGroupDeleteView(LoginRequiredMixin, View):
-
-
-
-    def post(self, request, pk, *args, **kwargs):
-
-
-
-        try:
-
-
-
-            group = TargetGroup.objects.get(pk=pk, user=request.user)
-
-
-
-            group.delete()
-
-
-
-            return JsonResponse({'success': True})
-
-
-
-        except TargetGroup.DoesNotExist:
-
-
-
-            return JsonResponse({'success': False, 'error': 'Group not found'})
-
-
-
-        except Exception as e:
-
-
-
-            return JsonResponse({'success': False, 'error': str(e)})
-
-
-
-
-class IntelligenceLogView(LoginRequiredMixin, View):
-    template_name = 'intelligence_log.html'
-
-    @staticmethod
-    def get_daily_target_ids_logic(user, date):
-        from intelligence.models import Target, DailyTargetState, CustomAnniversary, TargetGroup
-        import datetime
-        from django.db.models import Q
-
-        weekday = date.weekday()
-        weekday_map = ['is_mon', 'is_tue', 'is_wed', 'is_thu', 'is_fri', 'is_sat', 'is_sun']
-        current_weekday_field = weekday_map[weekday]
-        
-        # 1. Base Logic (Groups)
-        base_targets = Target.objects.filter(
-            user=user,
-            groups__in=TargetGroup.objects.filter(**{current_weekday_field: True})
-        ).distinct()
-        
-        # 2. Anniversary Logic
-        birthday_targets = Target.objects.filter(
-            user=user,
-            birth_month=date.month,
-            birth_day=date.day
-        )
-        
-        custom_annivs = CustomAnniversary.objects.filter(
-            target__user=user,
-            date__month=date.month,
-            date__day=date.day
-        )
-        
-        # 3. Manual State
-        daily_states = DailyTargetState.objects.filter(target__user=user, date=date)
-        manual_add_ids = set(daily_states.filter(is_manual_add=True).values_list('target_id', flat=True))
-        hidden_ids = set(daily_states.filter(is_hidden=True).values_list('target_id', flat=True))
-        
-        # Build Result Map: ID -> List of Sources
-        target_info = {} # target_id -> { 'sources': set(), 'anniv_label': str }
-        
-        for t in base_targets:
-            if t.id not in target_info: target_info[t.id] = {'sources': set()}
-            target_info[t.id]['sources'].add('group')
-            
-        for t in birthday_targets:
-            if t.id not in target_info: target_info[t.id] = {'sources': set()}
-            target_info[t.id]['sources'].add('anniversary')
-            target_info[t.id]['anniv_label'] = "誕生日"
-            
-        for ca in custom_annivs:
-            if ca.target_id not in target_info: target_info[ca.target_id] = {'sources': set()}
-            target_info[ca.target_id]['sources'].add('anniversary')
-            target_info[ca.target_id]['anniv_label'] = ca.label
-
-        for tid in manual_add_ids:
-            if tid not in target_info: target_info[tid] = {'sources': set()}
-            target_info[tid]['sources'].add('manual')
-
-        # Filter Hidden
-        final_info = {tid: info for tid, info in target_info.items() if tid not in hidden_ids}
-        
-        return final_info
-
-    def get_daily_target_ids(self, user, date):
-        return self.get_daily_target_ids_logic(user, date)
-
-
-
-
-
-
-
-    def get(self, request, *args, **kwargs):
-
-
-
-        import datetime
-
-
-
-        from django.db.models import Q
-
-
-
-        
-
-
-
-        is_mobile = getattr(request, 'is_mobile', False)
-
-
-
-        target_id_param = request.GET.get('target_id')
-
-
-
-        
-
-
-
-        # 1. Date Handling
-
-
-
-        date_str = request.GET.get('date')
-
-
-
-        if date_str:
-
-
-
-            try:
-
-
-
-                current_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-
-
-
-            except ValueError:
-
-
-
-                current_date = datetime.date.today()
-
-
-
-        else:
-
-
-
-            current_date = datetime.date.today()
-
-
-
-
-
-
-
-        # [MOBILE OPTIMIZATION] Timeline View - Short Circuit
-
-
-
-        if is_mobile and target_id_param:
-
-
-
-            target = get_object_or_404(Target, pk=target_id_param, user=request.user)
-
-
-
-            
-
-
-
-            # Auto-Add Logic (Ensure it's marked as active for today)
-
-
-
-            state, _ = DailyTargetState.objects.get_or_create(
-
-
-
-                target=target, date=current_date,
-
-
-
-                defaults={'is_manual_add': True, 'is_hidden': False}
-
-
-
-            )
-
-
-
-            if not state.is_manual_add and state.is_hidden:
-
-
-
-                    state.is_hidden = False
-
-
-
-                    state.save()
-
-
-
-            elif not state.is_manual_add:
-
-
-
-                    state.is_manual_add = True
-
-
-
-                    state.save()
-
-
-
-            
-
-
-
-            # [SSR] Fetch and Group Timeline Items
-
-
-
-            # Note: TimelineItem is shared if target is shared.
-
-
-
-            raw_items = TimelineItem.objects.filter(target=target).prefetch_related('images').order_by('date', 'created_at')
-
-
-
-            
-
-
-
-            grouped_timeline = []
-
-
-
-            current_group = None
-
-
-
-            for item in raw_items:
-
-
-
-                date_str = item.date.strftime('%Y-%m-%d')
-
-
-
-                if current_group and current_group['date_str'] == date_str:
-
-
-
-                    current_group['items'].append(item)
-
-
-
-                    if item.contact_made: current_group['has_contact'] = True
-
-
-
-                else:
-
-
-
-                    if current_group: grouped_timeline.append(current_group)
-
-
-
-                    current_group = {
-
-
-
-                        'date': item.date,
-
-
-
-                        'date_str': date_str,
-
-
-
-                        'items': [item],
-
-
-
-                        'has_contact': item.contact_made
-
-
-
-                    }
-
-
-
-            if current_group: grouped_timeline.append(current_group)
-
-
-
-
-
-
-
-            timeline_items = grouped_timeline # Pass as 'timeline_items' but structure changed
-
-
-
- 
-
-
-
-            
-
-
-
-            return render(request, 'mobile/intelligence_timeline_mobile.html', {
-
-
-
-                'target': target,
-
-
-
-                'today_date': current_date, # This is actually specific date from param if set
-
-
-
-                'timeline_items': timeline_items,
-
-
-
-            })
-
-
-
-
-
-
-
-        weekday = current_date.weekday() # 0=Mon
-
-
-
-        weekday_map = ['is_mon', 'is_tue', 'is_wed', 'is_thu', 'is_fri', 'is_sat', 'is_sun']
-
-
-
-        current_weekday_field = weekday_map[weekday]
-
-
-
-
-
-
-
-        # 1.5 Auto-Add Logic (From Target List LOG button)
-
-
-
-        target_id_param = request.GET.get('target_id')
-
-
-
-        if target_id_param:
-
-
-
-            try:
-
-
-
-                auto_target = Target.objects.get(pk=target_id_param, user=request.user)
-
-
-
-                # Ensure it's in today's list
-
-
-
-                state, _ = DailyTargetState.objects.get_or_create(
-
-
-
-                    target=auto_target, date=current_date,
-
-
-
-                    defaults={'is_manual_add': True, 'is_hidden': False}
-
-
-
-                )
-
-
-
-                if not state.is_manual_add and state.is_hidden: # If it was hidden, unhide it
-
-
-
-                     state.is_hidden = False
-
-
-
-                     state.save()
-
-
-
-                elif not state.is_manual_add: # Ensure it is marked as manual add if not already
-
-
-
-                     state.is_manual_add = True
-
-
-
-                     state.save()
-
-
-
-            except Target.DoesNotExist:
-
-
-
-                pass
-
-
-
-        
-
-
-
-        # Get IDs with Metadata
-        final_info = self.get_daily_target_ids(request.user, current_date)
-        final_ids = final_info.keys()
-        
-        # Fetch Objects & Annotate for UI
-        from django.db.models import Max
-        targets = Target.objects.filter(id__in=final_ids).prefetch_related('groups').annotate(
-            real_last_contact=Max('timelineitem__date', filter=Q(timelineitem__contact_made=True))
-        ).order_by('nickname')
-
-
-
-        
-
-
-
-        target_list = []
-
-
-
-        
-
-
-
-        # Helper for Anniversary
-
-
-
-        def get_next_date(month, day, reference_date):
-
-
-
-            try:
-
-
-
-                this_year = datetime.date(reference_date.year, month, day)
-
-
-
-            except ValueError: # Leap year case
-
-
-
-                this_year = datetime.date(reference_date.year, 3, 1)
-
-
-
-            
-
-
-
-            if this_year >= reference_date:
-
-
-
-                return this_year
-
-
-
-            
-
-
-
-            try:
-
-
-
-                next_year = datetime.date(reference_date.year + 1, month, day)
-
-
-
-            except ValueError:
-
-
-
-                next_year = datetime.date(reference_date.year + 1, 3, 1)
-
-
-
-            return next_year
-
-
-
-
-
-
-
-        for t in targets:
-
-
-
-            has_entry = TimelineItem.objects.filter(target=t, date=current_date).exists()
-
-
-
-            log_count = TimelineItem.objects.filter(target=t, date=current_date).count()
-
-
-
-            age = t.age
-
-
-
-
-
-
-
-            # 1. Birthday
-
-
-
-            next_bday = None
-
-
-
-            if t.birth_month and t.birth_day:
-
-
-
-                next_bday = get_next_date(t.birth_month, t.birth_day, current_date)
-
-
-
-            
-
-
-
-            # 2. Custom Anniversaries
-
-
-
-            # We need to fetch ALL custom anniversaries for this target to find the next one
-
-
-
-            # Optimization: Fetch all custom annivs for displayed targets in bulk outside loop would be better, 
-
-
-
-            # but for now inside loop is safer logic-wise, though slower. 
-
-
-
-            # Given list size is usually small (~5-20), it's acceptable.
-
-
-
-            # actually better to fetch related outside.
-
-
-
-            # Use pre-fetched custom annivs?
-
-
-
-            
-
-
-
-            # Simplified: Just fetch here for correctness first.
-
-
-
-            t_custom_annivs = CustomAnniversary.objects.filter(target=t)
-
-
-
-            next_custom = None
-
-
-
-            next_custom_label = ""
-
-
-
-            
-
-
-
-            for ca in t_custom_annivs:
-
-
-
-                nd = get_next_date(ca.date.month, ca.date.day, current_date)
-
-
-
-                if next_custom is None or nd < next_custom:
-
-
-
-                    next_custom = nd
-
-
-
-                    next_custom_label = ca.label
-
-
-
-            
-
-
-
-            # Compare Birthday vs Custom
-
-
-
-            final_anniv_date = None
-
-
-
-            final_anniv_label = ""
-
-
-
-            final_anniv_type = "" # 'birthday' or 'custom'
-
-
-
-            
-
-
-
-            if next_bday and next_custom:
-
-
-
-                if next_bday <= next_custom:
-
-
-
-                    final_anniv_date = next_bday
-
-
-
-                    final_anniv_label = "誕生日"
-
-
-
-                else:
-
-
-
-                    final_anniv_date = next_custom
-
-
-
-                    final_anniv_label = next_custom_label
-
-
-
-                    final_anniv_type = 'custom'
-
-
-
-            elif next_bday:
-
-
-
-                final_anniv_date = next_bday
-
-
-
-                final_anniv_label = "誕生日"
-
-
-
-                final_anniv_type = 'birthday'
-
-
-
-            elif next_custom:
-
-
-
-                final_anniv_date = next_custom
-
-
-
-                final_anniv_label = next_custom_label
-
-
-
-                final_anniv_type = 'custom'
-
-
-
-            
-
-
-
-            anniv_display = None
-
-
-
-            if final_anniv_date:
-
-
-
-                days_until = (final_anniv_date - current_date).days
-
-
-
-                color_class = "text-text-sub" # Default gray
-
-
-
-                if days_until == 0:
-
-
-
-                    color_class = "text-accent-red font-bold"
-
-
-
-                elif days_until <= 10:
-
-
-
-                    color_class = "text-yellow-500"
-
-
-
-                
-
-
-
-                icon = "fa-birthday-cake" if final_anniv_type == 'birthday' else "fa-medal" # generic icon
-
-
-
-                
-
-
-
-                anniv_display = {
-
-
-
-                    'label': final_anniv_label,
-
-
-
-                    'date_str': final_anniv_date.strftime('%Y/%m/%d'),
-
-
-
-                    'color_class': color_class,
-
-
-
-                    'icon': icon,
-
-
-
-                    'is_today': days_until == 0
-
-
-
-                }
-
-
-
-
-
-
-
-            info = final_info.get(t.id, {'sources': set()})
-            
-            target_list.append({
-                'obj': t,
-                'has_entry': has_entry,
-                'log_count': log_count,
-                'age': age,
-                'last_contact_date': t.real_last_contact,
-                'nearest_anniversary': anniv_display,
-                # New Metadata
-                'is_manual': 'manual' in info['sources'],
-                'is_group': 'group' in info['sources'],
-                'is_anniversary': 'anniversary' in info['sources'],
-                'anniversary_label': info.get('anniv_label', '')
-            })
-
-
-
-
-
-
-
-        # Questions & Tags (Owned OR Shared)
-
-
-
-        questions = Question.objects.filter(
-
-
-
-            Q(user=request.user) | Q(is_shared=True) | Q(user__role='MASTER')
-
-
-
-        ).distinct().select_related('category', 'rank').order_by('category__order', 'category__created_at', 'order', 'title')
-
-
-
-        
-
-
-
-        # Get IDs of categories used by these questions
-
-
-
-        category_ids = questions.values_list('category_id', flat=True).distinct()
-
-
-
-
-
-
-
-        # Fetch Categories (User's OR Shared OR MASTER OR Used by Questions)
-
-
-
-        categories = QuestionCategory.objects.filter(
-
-
-
-            Q(user=request.user) | Q(is_shared=True) | Q(user__role='MASTER') | Q(id__in=category_ids)
-
-
-
-        ).distinct().order_by('order', 'created_at')
-
-
-
-
-
-
-
-        from django.db.models import Count
-
-
-
-        from intelligence.models import Tag
-
-
-
-        # Filter tags used by THIS user's targets
-
-
-
-        top_tags = Tag.objects.filter(
-
-
-
-            timelineitem__target__user=request.user
-
-
-
-        ).annotate(count=Count('timelineitem')).order_by('-count')[:10]
-
-
-
-
-
-
-
-        context = {
-            'todays_targets': target_list,
-            'any_manual': any(it['is_manual'] for it in target_list),
-            'any_system': any(not it['is_manual'] for it in target_list),
-            'questions': questions,
-            'categories': categories, # Add categories to context
-            'tags': top_tags,
-            'today_date': current_date,
-            'weekday_jp': ['月','火','水','木','金','土','日'][weekday]
-        }
-
-
-
-        if is_mobile:
-
-
-
-            return render(request, 'mobile/intelligence_select_mobile.html', context)
-
-
-
-        
-
-
-
-        return render(request, self.template_name, context)
-
-
-
-
-
-
-
-    def post(self, request, *args, **kwargs):
-
-
-
-        import datetime
-
-
-
-        import re
-
-
-
-        from django.utils import timezone
-
-
-
-        from intelligence.models import TimelineImage
-
-
-
-        
-
-
-
-        try:
-
-
-
-            # 1. Parse Data (Support JSON & Multipart)
-
-
-
-            images = []
-
-
-
-            if request.content_type == 'application/json':
-
-
-
-                data = json.loads(request.body)
-
-
-
-            else:
-
-
-
-                data = request.POST
-
-
-
-                images = request.FILES.getlist('images')
-
-
-
-
-
-
-
-            # Action: 'create' (default), 'update' or 'delete'
-
-
-
-            action = data.get('action', 'create')
-
-
-
-            
-
-
-
-            if action == 'delete':
-
-
-
-                item_id = data.get('item_id')
-
-
-
-                if not item_id: return JsonResponse({'success': False, 'error': 'Item ID required'})
-
-
-
-                
-
-
-
-                item = get_object_or_404(TimelineItem, pk=item_id, target__user=request.user)
-
-
-
-                target = item.target
-
-
-
-                date = item.date
-
-
-
-                item.delete()
-
-
-
-                
-
-
-
-                # Check if any entry remains for this date
-
-
-
-                has_entry_today = TimelineItem.objects.filter(target=target, date=date).exists()
-
-
-
-                return JsonResponse({'success': True, 'has_entry_today': has_entry_today, 'target_id': target.id})
-
-
-
-
-
-
-
-            elif action == 'refresh_list':
-
-
-
-                # Remove (Hide) displayed targets with 0 logs from the selection list for this date
-
-
-
-                date_str = data.get('date')
-
-
-
-                try:
-
-
-
-                    date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-
-
-
-                except (ValueError, TypeError):
-
-
-
-                    return JsonResponse({'success': False, 'error': 'Invalid date'})
-
-
-
-
-
-
-
-                displayed_ids = self.get_daily_target_ids(request.user, date)
-
-
-
-                
-
-
-
-                # Check logs
-
-
-
-                hidden_count = 0
-
-
-
-                for tid in displayed_ids:
-
-
-
-                    has_log = TimelineItem.objects.filter(target_id=tid, date=date).exists()
-
-
-
-                    if not has_log:
-
-
-
-                        DailyTargetState.objects.update_or_create(
-
-
-
-                            target_id=tid,
-
-
-
-                            date=date,
-
-
-
-                            defaults={'is_hidden': True}
-
-
-
-                        )
-
-
-
-                        hidden_count += 1
-
-
-
-                
-
-
-
-                return JsonResponse({'success': True, 'hidden_count': hidden_count})
-
-
-
-
-
-
-
-            elif action == 'manual_add':
-
-
-
-                target_id = data.get('target_id')
-
-
-
-                date_str = data.get('date')
-
-
-
-                try:
-
-
-
-                    date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-
-
-
-                except (ValueError, TypeError):
-
-
-
-                    return JsonResponse({'success': False, 'error': 'Invalid date'})
-
-
-
-
-
-
-
-                if not target_id: return JsonResponse({'success': False, 'error': 'Target ID required'})
-
-
-
-                
-
-
-
-                DailyTargetState.objects.update_or_create(
-
-
-
-                    target_id=target_id,
-
-
-
-                    date=date,
-
-
-
-                    defaults={'is_manual_add': True, 'is_hidden': False}
-
-
-
-                )
-
-
-
-                return JsonResponse({'success': True})
-
-
-
-
-
-
-
-            elif action == 'get_candidates':
-
-
-
-                # Return JSON list of targets NOT in current selection, sorted by last contact asc
-
-
-
-                date_str = data.get('date')
-
-
-
-                try:
-
-
-
-                    date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-
-
-
-                except (ValueError, TypeError):
-
-
-
-                    return JsonResponse({'success': False, 'error': 'Invalid date'})
-
-
-
-                
-
-
-
-                current_ids = self.get_daily_target_ids(request.user, date)
-
-
-
-                
-
-
-
-                from django.db.models import Max, Q
-
-
-
-                # Candidates: Owned OR MASTER-owned
-
-
-
-                candidates = Target.objects.filter(
-
-
-
-                    Q(user=request.user)
-
-
-
-                ).exclude(id__in=current_ids).annotate(
-
-
-
-                    real_last_contact=Max('timelineitem__date', filter=Q(timelineitem__contact_made=True))
-
-
-
-                ).order_by('real_last_contact', 'nickname').distinct()
-
-
-
-                
-
-
-
-                # Manual serialization for simple list
-
-
-
-                candidate_list = []
-
-
-
-                for c in candidates:
-
-
-
-                    candidate_list.append({
-
-
-
-                        'id': c.id,
-
-
-
-                        'nickname': c.nickname,
-
-
-
-                        'name_kanji': f"{c.last_name} {c.first_name}".strip(),
-
-
-
-                        'name_kana': f"{c.last_name_kana} {c.first_name_kana}".strip(),
-
-
-
-                        'avatar_url': c.avatar.url if c.avatar else None,
-
-
-
-                        'last_contact': c.real_last_contact.strftime('%Y/%m/%d') if c.real_last_contact else 'No Contact'
-
-
-
-                    })
-
-
-
-                
-
-
-
-                return JsonResponse({'success': True, 'candidates': candidate_list})
-
-
-
-
-
-
-
-            elif action == 'update':
-
-
-
-                item_id = data.get('item_id')
-
-
-
-                item = get_object_or_404(TimelineItem, pk=item_id, target__user=request.user)
-
-
-
-                
-
-
-
-                # Update fields
-
-
-
-                if 'description' in data: item.content = data.get('description')
-
-
-
-                content = item.content # for tag processing
-
-
-
-                
-
-
-
-                if 'date' in data and data['date']:
-
-
-
-                    try:
-
-
-
-                        item.date = datetime.datetime.strptime(data['date'], '%Y-%m-%d').date()
-
-
-
-                    except ValueError: pass
-
-
-
-                    
-
-
-
-                if 'contact_made' in data: item.contact_made = data.get('contact_made') == 'true' if isinstance(data.get('contact_made'), str) else data.get('contact_made', False)
-
-
-
-                
-
-
-
-                # Bump created_at to now? Or just save.
-
-
-
-                # item.created_at = timezone.now() # User might not want timestamp bump on edit.
-
-
-
-                
-
-
-
-                item.save()
-
-
-
-                item.tags.clear()
-
-
-
-                # Tag logic continues below if shared?
-
-
-
-                # Actually tag logic is usually separate.
-
-
-
-                # Returning success for update here to keep it simple as tags are separate?
-
-
-
-                # The original code likely fell through to tag processing.
-
-
-
-                # Let's check if there is tag processing after this block.
-
-
-
-                # Assuming tag processing is below line 750 (end of create).
-
-
-
-                # But 'item' needs to be defined.
-
-
-
-                pass 
-
-
-
-
-
-
-
-            else: # Create
-
-
-
-                target_id = data.get('target_id')
-
-
-
-                date_str = data.get('date')
-
-
-
-                frontend_type = data.get('event_type', 'NOTE') 
-
-
-
-                content = data.get('description', '')
-
-
-
-                if not content: content = data.get('content', '')
-
-
-
-                if content in ['null', 'undefined', 'None']: content = ''
-
-
-
-                # Handle boolean string from FormData
-
-
-
-                contact_made_raw = data.get('contact_made')
-
-
-
-                contact_made = contact_made_raw == 'true' if isinstance(contact_made_raw, str) else bool(contact_made_raw)
-
-
-
-                
-
-
-
-                if not target_id: return JsonResponse({'success': False, 'error': 'No target specified'})
-
-
-
-                
-
-
-
-                target = get_object_or_404(Target, pk=target_id, user=request.user)
-
-
-
-                
-
-
-
-                if date_str:
-
-
-
-                    try:
-
-
-
-                        date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-
-
-
-                    except ValueError: date_obj = datetime.date.today()
-
-
-
-                else: date_obj = datetime.date.today()
-
-
-
-                
-
-
-
-                if frontend_type == 'QUESTION': item_type = 'Question'
-
-
-
-                else: item_type = 'Event' if not images else 'Note' # Default note if images only
-
-
-
-                    
-
-
-
-                item = TimelineItem(
-
-
-
-                    target=target,
-
-
-
-                    date=date_obj,
-
-
-
-                    contact_made=contact_made,
-
-
-
-                    type=item_type,
-
-
-
-                    content=content
-
 
-
-                )
+                displayed_ids = self.get_daily_target_ids(request.user, date)
 
 
 
@@ -3562,51 +1817,66 @@ class IntelligenceLogView(LoginRequiredMixin, View):
 
 
 
-                if frontend_type == 'QUESTION':
+                # Targets without logs in one query, then a single upsert hides them. Both run in one
+                # transaction with the displayed targets locked (where the backend supports it), so a
+                # log saved in between cannot leave its target hidden.
+                from django.db.models import Exists, OuterRef
+                from intelligence.roster import invalidate_date
+                with transaction.atomic():
+                    hide_ids = list(
+                        Target.objects.select_for_update()
+                        .filter(pk__in=list(displayed_ids), user=request.user)
+                        .exclude(Exists(TimelineItem.objects.filter(target=OuterRef('pk'), date=date)))
+                        .order_by().values_list('pk', flat=True)
+                    )
+                    DailyTargetState.objects.bulk_create(
+                        [DailyTargetState(target_id=tid, date=date, is_hidden=True) for tid in hide_ids],
+                        update_conflicts=True, unique_fields=['target', 'date'], update_fields=['is_hidden'],
+                    )
+                    # bulk_create skips the DailyTargetState receivers
+                    invalidate_date(request.user.pk, date)
 
+                return JsonResponse({'success': True, 'hidden_count': len(hide_ids)})
 
 
-                    q_id = data.get('question_id')
 
 
 
-                    if q_id:
 
 
+            elif action == 'manual_add':
 
-                        from intelligence.models import Question
 
 
+                target_id = data.get('target_id')
 
-                        try:
 
 
+                date_str = data.get('date')
 
-                            q = Question.objects.get(pk=q_id)
 
 
+                try:
 
-                            item.question = q
 
 
+                    date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
 
-                            item.question_text = q.title
 
 
+                except (ValueError, TypeError):
 
-                            item.question_category = q.category.name if q.category else ''
 
 
+                    return JsonResponse({'success': False, 'error': 'Invalid date'})
 
-                        except Question.DoesNotExist: pass
 
 
 
-                    item.question_answer = content
 
 
 
-                    item.content = content 
+                if not target_id: return JsonResponse({'success': False, 'error': 'Target ID required'})
 
 
 
@@ -3614,271 +1884,187 @@ class IntelligenceLogView(LoginRequiredMixin, View):
 
 
 
-                item.save()
-
-
-
-
-
-
-
-                # Handle Images (Max 4)
-
-
-
-                if images:
-
-
-
-                    for img in images[:4]:
-
-
-
-                        TimelineImage.objects.create(item=item, image=img)
-
-
-
-            
-
-
-
-            # --- Common Logic for Create & Update: Tags ---
-
-
-
-            tag_ids = data.get('tags', []) # List? FormData uses tags list?
-
-
-
-            # FormData sending array: usually same key multiple times data.getlist('tags')?
-
-
-
-            # Existing code: `tag_ids = data.get('tags', [])` implies JSON list.
-
-
-
-            # If FormData, we might need request.POST.getlist('tags')?
-
-
-
-            # Let's support both.
-
-
-
-            if hasattr(request.POST, 'getlist') and 'tags' in request.POST:
-
-
-
-                 tag_ids = request.POST.getlist('tags')
-
-
-
-            from intelligence.models import Tag
-
-
-
-            # 2. Extract Hashtags from Content (Legacy/Text-based)
-
-
-
-            hashtags = re.findall(r'#(\w+)', content)
-
-
-
-            for tag_name in hashtags:
-
-
-
-                tag, _ = Tag.objects.get_or_create(user=request.user, name=tag_name)
-
-
-
-                item.tags.add(tag)
-
-
-
-
-
+                DailyTargetState.objects.update_or_create(
 
 
-            # 3. Handle Explicit Tag IDs (New UI)
 
+                    target_id=target_id,
 
 
-            explicit_tags = data.get('tags', []) # Expecting list of IDs
 
+                    date=date,
 
 
-            if explicit_tags:
 
+                    defaults={'is_manual_add': True, 'is_hidden': False}
 
 
-                 # If explicit_tags is string (from FormData), split/parse
 
+                )
 
 
-                 if isinstance(explicit_tags, str):
 
+                return JsonResponse({'success': True})
 
 
-                     try:
 
 
 
-                         explicit_tags = json.loads(explicit_tags)
 
 
+            elif action == 'update':
 
-                     except:
 
 
+                item_id = data.get('item_id')
 
-                         explicit_tags = [] # Or split by comma if comma-separated
 
 
+                item = get_object_or_404(TimelineItem, pk=item_id, target__user=request.user)
 
-                 
 
 
+                
 
-                 if isinstance(explicit_tags, list):
 
 
+                # Update fields
 
-                     for tag_id in explicit_tags:
 
 
+                if 'description' in data: item.content = data.get('description')
 
-                         try:
 
 
+                content = item.content # for tag processing
 
-                             tag = Tag.objects.get(id=tag_id, user=request.user)
 
 
+                
 
-                             item.tags.add(tag)
 
 
+                if 'date' in data and data['date']:
 
-                         except Tag.DoesNotExist:
 
 
+                    try:
 
-                             pass
 
 
+                        item.date = datetime.datetime.strptime(data['date'], '%Y-%m-%d').date()
 
-            
 
 
+                    except ValueError: pass
 
-            if item.contact_made:
 
 
+                    
 
-                item.target.last_contact = timezone.now()
 
 
+                if 'contact_made' in data: item.contact_made = data.get('contact_made') == 'true' if isinstance(data.get('contact_made'), str) else data.get('contact_made', False)
 
-                item.target.save()
 
 
+                
 
 
 
+                # Bump created_at to now? Or just save.
 
 
-            # Check has_entry_today
 
+                # item.created_at = timezone.now() # User might not want timestamp bump on edit.
 
 
-            has_entry_today = TimelineItem.objects.filter(target=item.target, date=item.date).exists()
 
+                
 
 
 
+                item.save()
 
 
 
-            return JsonResponse({'success': True, 'has_entry_today': has_entry_today, 'target_id': item.target.id})
+                item.tags.clear()
 
 
 
-            
+                # Tag logic continues below if shared?
 
 
 
-        except Exception as e:
+                # Actually tag logic is usually separate.
 
 
 
-            import traceback
+                # Returning success for update here to keep it simple as tags are separate?
 
 
 
-            traceback.print_exc()
+                # The original code likely fell through to tag processing.
 
 
 
-            return JsonResponse({'success': False, 'error': str(e)})
+                # Let's check if there is tag processing after this block.
 
 
 
+                # Assuming tag processing is below line 750 (end of create).
 
 
 
+                # But 'item' needs to be defined.
 
-class TargetStateToggleView(LoginRequiredMixin, View):
 
 
+                pass 
 
-    def post(self, request, *args, **kwargs):
 
 
 
-        import datetime
 
 
 
-        from django.db import IntegrityError
+            else: # Create
 
 
 
-        
+                target_id = data.get('target_id')
 
 
 
-        try:
+                date_str = data.get('date')
 
 
 
-            data = json.loads(request.body)
+                frontend_type = data.get('event_type', 'NOTE') 
 
 
 
-            target_id = data.get('target_id')
+                content = data.get('description', '')
 
 
 
-            date_str = data.get('date')
+                if not content: content = data.get('content', '')
 
 
 
-            action = data.get('action') # 'add' or 'hide'
+                if content in ['null', 'undefined', 'None']: content = ''
 
 
 
-            
+                # Handle boolean string from FormData
 
 
 
-            if not target_id or not action:
+                contact_made_raw = data.get('contact_made')
 
 
 
-                return JsonResponse({'success': False, 'error': 'Missing parameters'})
+                contact_made = contact_made_raw == 'true' if isinstance(contact_made_raw, str) else bool(contact_made_raw)
 
 
 
@@ -3886,39 +2072,7 @@ class TargetStateToggleView(LoginRequiredMixin, View):
 
 
 
-            target = get_object_or_404(Target, pk=target_id, user=request.user)
-
-
-
-            
-
-
-
-            if date_str:
-
-
-
-                try:
-
-
-
-                    date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-
-
-
-                except ValueError:
-
-
-
-                    date_obj = datetime.date.today()
-
-
-
-            else:
-
-
-
-                date_obj = datetime.date.today()
+                if not target_id: return JsonResponse({'success': False, 'error': 'No target specified'})
 
 
 
@@ -3926,263 +2080,247 @@ class TargetStateToggleView(LoginRequiredMixin, View):
 
 
 
-            # Get or Create State
-
-
-
-            state, created = DailyTargetState.objects.get_or_create(
-
-
-
-                target=target,
-
-
-
-                date=date_obj,
-
-
-
-                defaults={'is_manual_add': False, 'is_hidden': False}
-
-
-
-            )
-
-
-
-            
-
-
-
-            if action == 'add':
-
-
+                target = get_object_or_404(Target, pk=target_id, user=request.user)
 
-                state.is_manual_add = True
 
 
+                
 
-                state.is_hidden = False
 
 
+                if date_str:
 
-            elif action == 'hide':
 
 
+                    try:
 
-                state.is_hidden = True
 
 
+                        date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
 
-            
 
 
+                    except ValueError: date_obj = datetime.date.today()
 
-            state.save()
 
 
+                else: date_obj = datetime.date.today()
 
-            return JsonResponse({'success': True})
 
 
+                
 
-            
 
 
+                if frontend_type == 'QUESTION': item_type = 'Question'
 
-        except Exception as e:
 
 
+                else: item_type = 'Event' if not images else 'Note' # Default note if images only
 
-            return JsonResponse({'success': False, 'error': str(e)})
 
 
+                    
 
 
 
+                item = TimelineItem(
 
 
-# --- QUESTION MANAGEMENT ---
 
+                    target=target,
 
 
-from intelligence.models import Question, QuestionCategory, QuestionRank
 
+                    date=date_obj,
 
 
-from intelligence.forms import QuestionForm, QuestionCategoryForm, QuestionRankForm
 
+                    contact_made=contact_made,
 
 
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 
+                    type=item_type,
 
 
-from django.urls import reverse_lazy
 
+                    content=content
 
 
 
+                )
 
 
 
-class QuestionListView(LoginRequiredMixin, MobileTemplateMixin, ListView):
+                
 
 
 
-    model = Question
+                if frontend_type == 'QUESTION':
 
 
 
-    template_name = 'question_list.html'
+                    q_id = data.get('question_id')
 
 
 
-    mobile_template_name = 'mobile/question_list_mobile.html'
+                    if q_id:
 
 
 
-    context_object_name = 'questions'
+                        from intelligence.models import Question
 
 
 
+                        try:
 
 
 
+                            q = Question.objects.get(pk=q_id)
 
-    def get_template_names(self):
 
 
+                            item.question = q
 
-        # HTMX: Return partial template for smooth updates
 
 
+                            item.question_text = q.title
 
-        if self.request.htmx:
 
 
+                            item.question_category = q.category.name if q.category else ''
 
-            return ['_question_list_partial.html']
 
 
+                        except Question.DoesNotExist: pass
 
-        # Delegate to Mixin for Mobile check
 
 
+                    item.question_answer = content
 
-        return super().get_template_names()
 
 
+                    item.content = content 
 
 
 
+                
 
 
-    def get_queryset(self):
 
+                item.save()
 
 
-        from django.db.models import Q, Count
 
 
 
-        
 
 
+                # Handle Images (Max 4)
 
-        # Base Query: My Own OR Shared OR MASTER Questions
 
 
+                if images:
 
-        qs = Question.objects.filter(
 
 
+                    for img in images[:4]:
 
-            Q(user=self.request.user) | Q(is_shared=True) | Q(user__role='MASTER')
 
 
+                        TimelineImage.objects.create(item=item, image=img)
 
-        ).distinct().annotate(
 
 
+            
 
-            answer_count=Count('timelineitem', filter=Q(timelineitem__target__user=self.request.user))
 
 
+            # --- Common Logic for Create & Update: Tags ---
 
-        ).order_by('category', 'order', 'created_at')
 
 
+            tag_ids = data.get('tags', []) # List? FormData uses tags list?
 
-        
 
 
+            # FormData sending array: usually same key multiple times data.getlist('tags')?
 
-        # Search
 
 
+            # Existing code: `tag_ids = data.get('tags', [])` implies JSON list.
 
-        q = self.request.GET.get('q')
 
 
+            # If FormData, we might need request.POST.getlist('tags')?
 
-        if q:
 
 
+            # Let's support both.
 
-            qs = qs.filter(
 
 
+            if hasattr(request.POST, 'getlist') and 'tags' in request.POST:
 
-                Q(title__icontains=q) | 
 
 
+                 tag_ids = request.POST.getlist('tags')
 
-                Q(description__icontains=q) | 
 
 
+            from intelligence.tags import attach_tags, hashtags, resolve_tags, user_tags
 
-                Q(example__icontains=q)
+            # 2. Extract Hashtags from Content (Legacy/Text-based)
+            tags = list(resolve_tags(request.user, hashtags(content)).values())
 
+            # 3. Handle Explicit Tag IDs (New UI)
+            explicit_tags = data.get('tags', []) # Expecting list of IDs
+            # If explicit_tags is string (from FormData), split/parse
+            if isinstance(explicit_tags, str):
+                try:
+                    explicit_tags = json.loads(explicit_tags)
+                except ValueError:
+                    explicit_tags = []
+            if isinstance(explicit_tags, list):
+                tags += user_tags(request.user, explicit_tags).values()
 
+            attach_tags(request.user.pk, [(item.pk, tag.pk) for tag in tags], [item.target_id])
 
-            )
 
 
+            
 
 
 
+            if item.contact_made:
 
 
-        # Filters
 
+                item.target.last_contact = timezone.now()
 
 
-        cat_id = self.request.GET.get('category')
 
+                item.target.save()
 
 
-        if cat_id:
 
 
 
-            qs = qs.filter(category_id=cat_id)
 
 
+            # Check has_entry_today
 
-            
 
 
+            has_entry_today = TimelineItem.objects.filter(target=item.target, date=item.date).exists()
 
-        rank_id = self.request.GET.get('rank')
 
 
 
-        if rank_id:
 
 
 
-            qs = qs.filter(rank_id=rank_id)
+            return JsonResponse({'success': True, 'has_entry_today': has_entry_today, 'target_id': item.target.id})
 
 
 
@@ -4190,1215 +2328,1302 @@ class QuestionListView(LoginRequiredMixin, MobileTemplateMixin, ListView):
 
 
 
-        # shared param: '1' -> Only Shared, '0' -> Only Individual
-
+        except Exception as e:
 
 
-        is_shared = self.request.GET.get('shared')
 
+            import traceback
 
 
-        if is_shared == '1':
 
+            traceback.print_exc()
 
 
-            qs = qs.filter(is_shared=True)
 
+            return JsonResponse({'success': False, 'error': str(e)})
 
 
-        elif is_shared == '0':
 
 
 
-            qs = qs.filter(is_shared=False)
 
 
+class IntelligenceLogBatchView(LoginRequiredMixin, View):
+    """
+    Several Intelligence Log entries in one request:
+    {"operations": [{"action": "create" | "update" | "delete", ...same fields as IntelligenceLogView.post}, ...]}
+    Multipart requests send the JSON list in an "operations" field and the images of
+    operation i as "images_<i>". Either every operation is applied or none is.
+    """
 
-            
+    def post(self, request, *args, **kwargs):
+        from intelligence.batch import apply_operations, MAX_OPERATIONS
 
+        try:
+            if request.content_type == 'application/json':
+                operations = json.loads(request.body).get('operations')
+                files = None
+            else:
+                operations = json.loads(request.POST.get('operations') or 'null')
+                files = request.FILES
+        except (ValueError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+        if not isinstance(operations, list) or not operations:
+            return JsonResponse({'success': False, 'error': 'No operations'}, status=400)
+        if len(operations) > MAX_OPERATIONS:
+            return JsonResponse({'success': False, 'error': f'Too many operations (max {MAX_OPERATIONS})'}, status=400)
+
+        success, results = apply_operations(request.user, operations, files)
+        return JsonResponse({'success': success, 'results': results}, status=200 if success else 400)
+
+
+def build_candidate_page(user, date, query='', cursor=None):
+    """
+    One page of the user's targets that are not on the roster of `date`, least
+    recently contacted first (TargetStats.real_last_contact, never contacted
+    first). `query` keeps the targets with a name starting with it (kana/width/case-insensitive).
+    """
+    import datetime
+    from django.db.models import F
+    from core.pagination import Key, KeysetPaginator
+    from intelligence.roster import roster_on
+    from intelligence.search import matching_target_ids
 
+    candidates = Target.objects.filter(user=user).exclude(id__in=list(roster_on(user, date))).annotate(
+        real_last_contact=F('stats__real_last_contact')
+    )
+    matching_ids = matching_target_ids(user, query, prefix=True)
+    if matching_ids is not None:
+        candidates = candidates.filter(id__in=matching_ids)
+
+    keys = [
+        Key('stats__real_last_contact', attr='real_last_contact', parse=datetime.date.fromisoformat),
+        Key('nickname'),
+        Key('id'),
+    ]
+    page = KeysetPaginator(candidates, keys, per_page=CANDIDATE_PAGE_SIZE, namespace='candidates').page(cursor)
+    return {
+        'candidates': [{
+            'id': c.id,
+            'nickname': c.nickname,
+            'name_kanji': f"{c.last_name} {c.first_name}".strip(),
+            'name_kana': f"{c.last_name_kana} {c.first_name_kana}".strip(),
+            'avatar_url': c.avatar.url if c.avatar else None,
+            'last_contact': c.real_last_contact.strftime('%Y/%m/%d') if c.real_last_contact else 'No Contact'
+        } for c in page],
+        'next_cursor': page.next_cursor,
+    }
 
-        return qs
 
+class CandidateListAPIView(LoginRequiredMixin, View):
+    """Candidate picker: ?date=YYYY-MM-DD&q=<name prefix>&cursor=<next_cursor>"""
 
+    def get(self, request, *args, **kwargs):
+        import datetime
+        try:
+            date = datetime.datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            date = datetime.date.today()
 
+        page = build_candidate_page(request.user, date, request.GET.get('q', ''), request.GET.get('cursor'))
+        return JsonResponse({'success': True, **page})
 
 
+class TargetStateToggleView(LoginRequiredMixin, View):
 
 
-    def get_context_data(self, **kwargs):
 
+    def post(self, request, *args, **kwargs):
 
 
-        context = super().get_context_data(**kwargs)
 
+        import datetime
 
 
-        user = self.request.user
 
+        from django.db import IntegrityError
 
 
 
+        
 
 
 
-        # 1. Fetch Categories properly sorted
+        try:
 
 
 
-        # User's Private Categories: Created At ASC
+            data = json.loads(request.body)
 
 
 
-        private_cats = list(QuestionCategory.objects.filter(user=user, is_shared=False).exclude(user__role='MASTER').order_by('created_at'))
+            target_id = data.get('target_id')
 
 
 
-        # Shared Categories (Shared flag OR MASTER creation)
+            date_str = data.get('date')
 
 
 
-        shared_cats = list(QuestionCategory.objects.filter(Q(is_shared=True) | Q(user__role='MASTER')).distinct().order_by('order', 'created_at'))
+            action = data.get('action') # 'add' or 'hide'
 
 
 
-        
+            
 
 
 
-        # Combined List: Private (Top) -> Shared (Bottom)
+            if not target_id or not action:
 
 
 
-        all_cats = private_cats + shared_cats
+                return JsonResponse({'success': False, 'error': 'Missing parameters'})
 
 
 
-        
+                
 
 
 
-        # 2. Bucket questions
+            target = get_object_or_404(Target, pk=target_id, user=request.user)
 
 
 
-        # self.object_list contains the filtered questions
+            
 
 
 
-        qs = self.object_list
+            if date_str:
 
 
 
-        from collections import defaultdict
+                try:
 
 
 
-        q_dict = defaultdict(list)
+                    date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
 
 
 
-        uncategorized = []
+                except ValueError:
 
 
 
-        
+                    date_obj = datetime.date.today()
 
 
 
-        for q in qs:
+            else:
 
 
 
-            if q.category_id:
+                date_obj = datetime.date.today()
 
 
 
-                q_dict[q.category_id].append(q)
+                
 
 
 
-            else:
+            # Get or Create State
 
 
 
-                uncategorized.append(q)
+            state, created = DailyTargetState.objects.get_or_create(
 
 
 
-                
+                target=target,
 
 
 
-        # 3. Build structure
+                date=date_obj,
 
 
 
-        structured_list = []
+                defaults={'is_manual_add': False, 'is_hidden': False}
 
 
 
-        for cat in all_cats:
+            )
 
 
 
-            # We add a .questions_list attribute to the category object for the template
+            
 
 
 
-            cat.questions_list = q_dict[cat.id] 
+            if action == 'add':
 
 
 
-            structured_list.append(cat)
+                state.is_manual_add = True
 
 
 
-            
+                state.is_hidden = False
 
 
 
-        # 4. Uncategorized (Append to end if exists)
+            elif action == 'hide':
 
 
 
-        if uncategorized:
+                state.is_hidden = True
 
 
 
-            # Create a dummy object to mimic category interface
+            
 
 
 
-            class DummyCat:
+            state.save()
 
 
 
-                name = "Unclassified"
+            return JsonResponse({'success': True})
 
 
 
-                id = None
+            
 
 
 
-                questions_list = uncategorized
+        except Exception as e:
 
 
 
-                is_shared = False
+            return JsonResponse({'success': False, 'error': str(e)})
 
 
 
-                description = "" # Add description to avoid template errors
 
 
 
-            structured_list.append(DummyCat())
 
+# --- QUESTION MANAGEMENT ---
 
 
-            
 
+from intelligence.models import Question, QuestionCategory, QuestionRank
 
 
-        context['structured_categories'] = structured_list
 
+from intelligence.forms import QuestionForm, QuestionCategoryForm, QuestionRankForm
 
 
-        context['ranks'] = QuestionRank.objects.filter(user=self.request.user)
 
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 
 
-        
 
+from django.urls import reverse_lazy
 
 
-        # Add all targets for the LOG modal
 
 
 
-        from intelligence.models import Target
 
 
+class QuestionListView(LoginRequiredMixin, MobileTemplateMixin, ListView):
 
-        context['all_targets'] = Target.objects.filter(user=self.request.user).order_by('nickname')
 
 
+    model = Question
 
-        return context
 
 
+    template_name = 'question_list.html'
 
 
 
+    mobile_template_name = 'mobile/question_list_mobile.html'
 
 
-class QuestionCreateView(LoginRequiredMixin, CreateView):
 
+    context_object_name = 'questions'
 
 
-    model = Question
 
 
 
-    form_class = QuestionForm
 
 
+    def get_template_names(self):
 
-    template_name = 'question_form.html'
 
 
+        # HTMX: Return partial template for smooth updates
 
-    success_url = reverse_lazy('question_list')
 
 
+        if self.request.htmx:
 
 
 
+            return ['_question_list_partial.html']
 
 
-    def get_form_kwargs(self):
 
+        # Delegate to Mixin for Mobile check
 
 
-        kwargs = super().get_form_kwargs()
 
+        return super().get_template_names()
 
 
-        kwargs['user'] = self.request.user
 
 
 
-        return kwargs
 
 
+    def get_queryset(self):
 
 
 
+        from django.db.models import Q, Count
 
 
-    def dispatch(self, request, *args, **kwargs):
 
+        
 
 
-        if getattr(request.user, 'role', '') != 'MASTER':
 
+        # Base Query: My Own OR Shared OR MASTER Questions (IDs from the cached catalog)
+        from intelligence.catalog import visible_question_ids
+        qs = Question.objects.filter(pk__in=visible_question_ids(self.request.user)).annotate(
 
 
-             from django.core.exceptions import PermissionDenied
 
+            answer_count=Count('timelineitem', filter=Q(timelineitem__target__user=self.request.user))
 
 
-             raise PermissionDenied("Only MASTER can create questions.")
 
+        ).order_by('category', 'order', 'created_at')
 
 
-        return super().dispatch(request, *args, **kwargs)
 
+        
 
 
 
+        # Search
 
 
 
-    def form_valid(self, form):
+        q = self.request.GET.get('q')
 
 
 
-        form.instance.user = self.request.user
+        if q:
 
 
 
-        return super().form_valid(form)
+            qs = qs.filter(
 
 
 
+                Q(title__icontains=q) | 
 
 
 
+                Q(description__icontains=q) | 
 
-class QuestionUpdateView(LoginRequiredMixin, UpdateView):
 
 
+                Q(example__icontains=q)
 
-    model = Question
 
 
+            )
 
-    form_class = QuestionForm
 
 
 
-    template_name = 'question_form.html'
 
 
 
-    success_url = reverse_lazy('question_list')
+        # Filters
 
 
 
+        cat_id = self.request.GET.get('category')
 
 
 
+        if cat_id:
 
-    def get_queryset(self):
 
 
+            qs = qs.filter(category_id=cat_id)
 
-        # Only MASTER can edit questions (Shared or MASTER-owned)
 
 
+            
 
-        if hasattr(self.request.user, 'role') and self.request.user.role == 'MASTER':
 
 
+        rank_id = self.request.GET.get('rank')
 
-            return Question.objects.filter(Q(user=self.request.user) | Q(is_shared=True))
 
 
+        if rank_id:
 
-        return Question.objects.none() # Non-MASTER cannot edit any question
 
 
+            qs = qs.filter(rank_id=rank_id)
 
 
 
+            
 
 
-    def dispatch(self, request, *args, **kwargs):
 
+        # shared param: '1' -> Only Shared, '0' -> Only Individual
 
 
-        # Double check for shared edit permission
 
+        is_shared = self.request.GET.get('shared')
 
 
-        if request.user.is_authenticated:
 
+        if is_shared == '1':
 
 
-            try:
 
+            qs = qs.filter(is_shared=True)
 
 
-                obj = self.get_object() 
 
+        elif is_shared == '0':
 
 
-                if obj.is_shared and getattr(request.user, 'role', '') != 'MASTER':
 
+            qs = qs.filter(is_shared=False)
 
 
-                     from django.core.exceptions import PermissionDenied
 
+            
 
 
-                     raise PermissionDenied("You do not have permission to edit shared questions.")
 
+        return qs
 
 
-            except:
 
 
 
-                pass # get_object will fail safely later if 404
 
 
+    def get_context_data(self, **kwargs):
 
-        return super().dispatch(request, *args, **kwargs)
 
 
+        context = super().get_context_data(**kwargs)
 
 
 
+        user = self.request.user
 
 
-    def get_form_kwargs(self):
 
 
 
-        kwargs = super().get_form_kwargs()
 
 
+        # 1. Fetch Categories properly sorted (copies: questions_list is set on them below)
+        import copy
+        from intelligence.catalog import get_catalog
+        catalog = get_catalog(user)
 
-        kwargs['user'] = self.request.user
+        # User's Private Categories: Created At ASC
+        private_cats = [copy.copy(c) for c in catalog.private_categories()]
 
+        # Shared Categories (Shared flag OR MASTER creation): Order, Created At ASC
+        shared_cats = [copy.copy(c) for c in catalog.shared_categories()]
 
 
-        return kwargs
 
+        
 
 
 
+        # Combined List: Private (Top) -> Shared (Bottom)
 
 
 
-class QuestionDeleteView(LoginRequiredMixin, DeleteView):
+        all_cats = private_cats + shared_cats
 
 
 
-    model = Question
+        
 
 
 
-    success_url = reverse_lazy('question_list')
+        # 2. Bucket questions
 
 
 
-    template_name = 'question_confirm_delete.html' 
+        # self.object_list contains the filtered questions
 
 
 
-    
+        qs = self.object_list
 
 
 
-    def dispatch(self, request, *args, **kwargs):
+        from collections import defaultdict
 
 
 
-        if getattr(request.user, 'role', '') != 'MASTER':
+        q_dict = defaultdict(list)
 
 
 
-             from django.core.exceptions import PermissionDenied
+        uncategorized = []
 
 
 
-             raise PermissionDenied("Only MASTER can delete questions.")
+        
 
 
 
-        return super().dispatch(request, *args, **kwargs)
+        for q in qs:
 
 
 
+            if q.category_id:
 
 
 
+                q_dict[q.category_id].append(q)
 
-    def get_queryset(self):
 
 
+            else:
 
-        return Question.objects.filter(user=self.request.user)
 
 
+                uncategorized.append(q)
 
 
 
+                
 
 
-from django.views.generic import TemplateView
 
+        # 3. Build structure
 
 
 
+        structured_list = []
 
 
 
-class QuestionDetailView(LoginRequiredMixin, MobileTemplateMixin, TemplateView):
+        for cat in all_cats:
 
 
 
-    template_name = 'question_detail.html'
+            # We add a .questions_list attribute to the category object for the template
 
 
 
-    mobile_template_name = 'mobile/question_detail_mobile.html'
+            cat.questions_list = q_dict[cat.id] 
 
 
 
-    
+            structured_list.append(cat)
 
 
 
-    def get(self, request, pk=None):
+            
 
 
 
-        from django.db.models import Q, Count, Max, Prefetch
+        # 4. Uncategorized (Append to end if exists)
 
 
 
-        import json
+        if uncategorized:
 
 
 
-        
+            # Create a dummy object to mimic category interface
 
 
 
-        # Get question if pk provided or from query param
+            class DummyCat:
 
 
 
-        question_id = pk or request.GET.get('question_id')
+                name = "Unclassified"
 
 
 
-        question = None
+                id = None
 
 
 
-        answer_data = []
+                questions_list = uncategorized
 
 
 
-        
+                is_shared = False
 
 
 
-        if question_id:
+                description = "" # Add description to avoid template errors
 
 
 
-            try:
+            structured_list.append(DummyCat())
 
 
 
-                question = Question.objects.filter(
+            
 
 
 
-                    Q(user=request.user) | Q(is_shared=True) | Q(user__role='MASTER')
+        context['structured_categories'] = structured_list
 
 
 
-                ).distinct().prefetch_related('category', 'rank').get(pk=question_id)
+        context['ranks'] = catalog.user_ranks()
 
 
 
-                
+        
 
 
 
-                # Get latest answer per target with count
+        # Add all targets for the LOG modal
 
 
 
-                answers_qs = TimelineItem.objects.filter(
+        from intelligence.models import Target
 
 
 
-                    question=question,
+        context['all_targets'] = Target.objects.filter(user=self.request.user).order_by('nickname')
 
 
 
-                    target__user=request.user
+        return context
 
 
 
-                ).select_related('target').prefetch_related('tags').order_by('target', '-date')
 
 
 
-                
 
+class QuestionCreateView(LoginRequiredMixin, CreateView):
 
 
-                # Apply filters
 
+    model = Question
 
 
-                group_id = request.GET.get('group')
 
+    form_class = QuestionForm
 
 
-                if group_id:
 
+    template_name = 'question_form.html'
 
 
-                    answers_qs = answers_qs.filter(target__groups__id=group_id)
 
+    success_url = reverse_lazy('question_list')
 
 
-                
 
 
 
-                # Get latest answer per target with count
 
 
+    def get_form_kwargs(self):
 
-                from collections import defaultdict
 
 
+        kwargs = super().get_form_kwargs()
 
-                target_answers = defaultdict(list)
 
 
+        kwargs['user'] = self.request.user
 
-                for answer in answers_qs:
 
 
+        return kwargs
 
-                    target_answers[answer.target].append(answer)
 
 
 
-                
 
 
 
-                # Build answer data
+    def dispatch(self, request, *args, **kwargs):
 
 
 
-                for target, answers in target_answers.items():
+        if getattr(request.user, 'role', '') != 'MASTER':
 
 
 
-                    answer_data.append({
+             from django.core.exceptions import PermissionDenied
 
 
 
-                        'target': target,
+             raise PermissionDenied("Only MASTER can create questions.")
 
 
 
-                        'latest_answer': answers[0],
+        return super().dispatch(request, *args, **kwargs)
 
 
 
-                        'all_answers': answers,
 
 
 
-                        'answer_count': len(answers)
 
+    def form_valid(self, form):
 
 
-                    })
 
+        form.instance.user = self.request.user
 
 
-                
 
+        return super().form_valid(form)
 
 
-                # Apply sorting
 
 
 
-                sort_by = request.GET.get('sort', 'date')
 
 
+class QuestionUpdateView(LoginRequiredMixin, UpdateView):
 
-                if sort_by == 'date':
 
 
+    model = Question
 
-                    answer_data.sort(key=lambda x: x['latest_answer'].date, reverse=True)
 
 
+    form_class = QuestionForm
 
-                elif sort_by == 'choice':
 
 
+    template_name = 'question_form.html'
 
-                    answer_data.sort(key=lambda x: x['latest_answer'].question_answer or '')
 
 
+    success_url = reverse_lazy('question_list')
 
-                elif sort_by == 'count':
 
 
 
-                    answer_data.sort(key=lambda x: x['answer_count'], reverse=True)
 
 
 
-            except Question.DoesNotExist:
+    def get_queryset(self):
 
 
 
-                pass
+        # Only MASTER can edit questions (Shared or MASTER-owned)
 
 
 
-        
+        if hasattr(self.request.user, 'role') and self.request.user.role == 'MASTER':
 
 
 
-        # Get all questions for dropdown with category info
+            return Question.objects.filter(Q(user=self.request.user) | Q(is_shared=True))
 
 
 
-        questions = Question.objects.filter(
+        return Question.objects.none() # Non-MASTER cannot edit any question
 
 
 
-            Q(user=request.user) | Q(is_shared=True) | Q(user__role='MASTER')
 
 
 
-        ).distinct().select_related('category').order_by('category', 'order', 'title')
 
+    def dispatch(self, request, *args, **kwargs):
 
 
-        
 
+        # Double check for shared edit permission
 
 
-        # Prepare questions data for JavaScript
 
+        if request.user.is_authenticated:
 
 
-        questions_json = json.dumps([{
 
+            try:
 
 
-            'id': q.id,
 
+                obj = self.get_object() 
 
 
-            'title': q.title,
 
+                if obj.is_shared and getattr(request.user, 'role', '') != 'MASTER':
 
 
-            'category_id': q.category.id if q.category else None
 
+                     from django.core.exceptions import PermissionDenied
 
 
-        } for q in questions])
 
+                     raise PermissionDenied("You do not have permission to edit shared questions.")
 
 
-        
 
+            except:
 
 
-        # Get categories for filter (Owned OR Shared OR MASTER)
 
+                pass # get_object will fail safely later if 404
 
 
-        categories = QuestionCategory.objects.filter(
 
+        return super().dispatch(request, *args, **kwargs)
 
 
-            Q(user=request.user) | Q(is_shared=True) | Q(user__role='MASTER')
 
 
 
-        ).distinct().order_by('order', 'created_at')
 
 
+    def get_form_kwargs(self):
 
-        
 
 
+        kwargs = super().get_form_kwargs()
 
-        # Get groups for filter
 
 
+        kwargs['user'] = self.request.user
 
-        from intelligence.models import TargetGroup
 
 
+        return kwargs
 
-        groups = TargetGroup.objects.filter(user=request.user)
 
 
 
 
 
 
+class QuestionDeleteView(LoginRequiredMixin, DeleteView):
 
-        # Get all targets for Add Modal
 
 
+    model = Question
 
-        from intelligence.models import Target
 
 
+    success_url = reverse_lazy('question_list')
 
-        all_targets = Target.objects.filter(user=request.user).order_by('nickname')
 
 
+    template_name = 'question_confirm_delete.html' 
 
-        
 
 
+    
 
-        context = {
 
 
+    def dispatch(self, request, *args, **kwargs):
 
-            'question': question,
 
 
+        if getattr(request.user, 'role', '') != 'MASTER':
 
-            'answer_data': answer_data,
 
 
+             from django.core.exceptions import PermissionDenied
 
-            'questions': questions_json,
 
 
+             raise PermissionDenied("Only MASTER can delete questions.")
 
-            'categories': categories,
 
 
+        return super().dispatch(request, *args, **kwargs)
 
-            'groups': groups,
 
 
 
-            'all_targets': all_targets,
 
 
 
-            'total_answers': sum(x['answer_count'] for x in answer_data) if answer_data else 0,
+    def get_queryset(self):
 
 
 
-            'total_targets': len(answer_data)
+        return Question.objects.filter(user=self.request.user)
 
 
 
-        }
 
 
 
-        
 
+from django.views.generic import TemplateView
 
 
-        return render(request, self.get_template_names(), context)
 
 
 
 
 
+class QuestionDetailView(LoginRequiredMixin, MobileTemplateMixin, TemplateView):
 
 
 
+    template_name = 'question_detail.html'
 
 
 
-# API Views for Dynamic Add
+    mobile_template_name = 'mobile/question_detail_mobile.html'
 
 
 
-class CategoryCreateView(LoginRequiredMixin, View):
+    
 
 
 
-    def post(self, request, *args, **kwargs):
+    def get(self, request, pk=None):
 
 
 
-        if getattr(request.user, 'role', '') != 'MASTER':
+        from django.db.models import Q, Count, Max, Prefetch
 
 
 
-             return JsonResponse({'success': False, 'error': 'Only MASTER can create categories.'})
+        import json
+        from intelligence.catalog import get_catalog
+        catalog = get_catalog(request.user)
 
 
 
-        try:
+        
 
 
 
-            data = json.loads(request.body)
+        # Get question if pk provided or from query param
 
 
 
-            name = data.get('name')
+        question_id = pk or request.GET.get('question_id')
 
 
 
-            desc = data.get('description', '')
+        question = None
 
 
 
-            if not name: return JsonResponse({'success': False, 'error': 'Name required'})
+        answer_data = []
 
 
 
-            
+        
 
 
 
-            # Categories are shared by default if created by MASTER? 
+        if question_id:
 
 
 
-            # Looking at init_data.py, they have is_shared=True.
+            try:
 
 
 
-            cat = QuestionCategory.objects.create(user=request.user, name=name, description=desc, is_shared=True)
+                question = catalog.visible_question(question_id)
+                if question is None:
+                    raise Question.DoesNotExist
 
 
 
-            return JsonResponse({'success': True, 'id': cat.id, 'name': cat.name})
+                
 
 
 
-        except Exception as e:
+                # Get latest answer per target with count
 
 
 
-            return JsonResponse({'success': False, 'error': str(e)})
+                answers_qs = TimelineItem.objects.filter(
 
 
 
+                    question=question,
 
 
 
+                    target__user=request.user
 
 
 
+                ).select_related('target').prefetch_related('tags').order_by('target', '-date')
 
 
-class RankCreateView(LoginRequiredMixin, View):
 
+                
 
 
-    def post(self, request, *args, **kwargs):
 
+                # Apply filters
 
 
-        if getattr(request.user, 'role', '') != 'MASTER':
 
+                group_id = request.GET.get('group')
 
 
-             return JsonResponse({'success': False, 'error': 'Only MASTER can create ranks.'})
 
+                if group_id:
 
 
-        try:
 
+                    answers_qs = answers_qs.filter(target__groups__id=group_id)
 
 
-            data = json.loads(request.body)
 
+                
 
 
-            name = data.get('name')
 
+                # Get latest answer per target with count
 
 
-            points = data.get('points', 0)
 
+                from collections import defaultdict
 
 
-            if not name: return JsonResponse({'success': False, 'error': 'Name required'})
 
+                target_answers = defaultdict(list)
 
 
-            
 
+                for answer in answers_qs:
 
 
-            rank = QuestionRank.objects.create(user=request.user, name=name, points=points)
 
+                    target_answers[answer.target].append(answer)
 
 
-            return JsonResponse({'success': True, 'id': rank.id, 'name': rank.name})
 
+                
 
 
-        except Exception as e:
 
+                # Build answer data
 
 
-            return JsonResponse({'success': False, 'error': str(e)})
 
+                for target, answers in target_answers.items():
 
 
 
+                    answer_data.append({
 
 
 
+                        'target': target,
 
 
 
+                        'latest_answer': answers[0],
 
-# --- TIMELINE API ---
 
 
+                        'all_answers': answers,
 
-class TimelineListAPIView(LoginRequiredMixin, View):
 
 
+                        'answer_count': len(answers)
 
-    def get(self, request, *args, **kwargs):
 
 
+                    })
 
-        try:
 
 
+                
 
-            target_id = request.GET.get('target_id')
 
 
+                # Apply sorting
 
-            
 
 
+                sort_by = request.GET.get('sort', 'date')
 
-            # Base Query
 
 
+                if sort_by == 'date':
 
-            if target_id:
 
 
+                    answer_data.sort(key=lambda x: x['latest_answer'].date, reverse=True)
 
-                try:
 
 
+                elif sort_by == 'choice':
 
-                    target = Target.objects.get(pk=target_id, user=request.user)
 
 
+                    answer_data.sort(key=lambda x: x['latest_answer'].question_answer or '')
 
-                    queryset = TimelineItem.objects.filter(target=target).select_related('question')
 
 
+                elif sort_by == 'count':
 
-                except Target.DoesNotExist:
 
 
+                    answer_data.sort(key=lambda x: x['answer_count'], reverse=True)
 
-                     return JsonResponse({'success': False, 'error': 'Target not found'}, status=404)
 
 
+            except Question.DoesNotExist:
 
-            else:
 
 
+                pass
 
-                # Global Feed
 
 
+        
 
-                queryset = TimelineItem.objects.filter(target__user=request.user).select_related('target', 'question')
 
 
+        # Get all questions for dropdown with category info
+        questions = catalog.visible_questions()
 
 
 
+        
 
 
-            # Filtering
 
+        # Prepare questions data for JavaScript
 
 
-            import datetime
 
+        questions_json = json.dumps([{
 
 
-            from django.db.models import Q
 
+            'id': q.id,
 
 
-            
 
+            'title': q.title,
 
 
-            # Group Filter
 
+            'category_id': q.category.id if q.category else None
 
 
-            group_id = request.GET.get('group_id')
 
+        } for q in questions])
 
 
-            if group_id:
 
+        
 
 
-                queryset = queryset.filter(target__groups__id=group_id)
 
+        # Get categories for filter (Owned OR Shared OR MASTER)
+        categories = catalog.visible_categories()
 
 
 
+        
 
 
 
-            # Type
+        # Get groups for filter
 
 
 
-            event_type = request.GET.get('type') # 'EVENT' or 'QUESTION'
+        from intelligence.models import TargetGroup
 
 
 
-            if event_type:
+        groups = TargetGroup.objects.filter(user=request.user)
 
 
 
-                if event_type == 'EVENT':
 
 
 
-                    queryset = queryset.filter(Q(type='Event') | Q(type='Note'))
 
+        # Get all targets for Add Modal
 
 
-                elif event_type == 'QUESTION':
 
+        from intelligence.models import Target
 
 
-                    queryset = queryset.filter(type='Question')
 
+        all_targets = Target.objects.filter(user=request.user).order_by('nickname')
 
 
 
+        
 
 
 
-            # Search Query
+        context = {
 
 
 
-            query = request.GET.get('search')
+            'question': question,
 
 
 
-            if query:
+            'answer_data': answer_data,
 
 
 
-                queryset = queryset.filter(
+            'questions': questions_json,
 
 
 
-                    Q(content__icontains=query) | 
+            'categories': categories,
 
 
 
-                    Q(question__title__icontains=query)
+            'groups': groups,
 
 
 
-                )
+            'all_targets': all_targets,
 
 
 
-            
+            'total_answers': sum(x['answer_count'] for x in answer_data) if answer_data else 0,
 
 
 
-            # Encanto Filter
+            'total_targets': len(answer_data)
 
 
 
-            contact_only = request.GET.get('contact_only') == 'true'
+        }
 
 
 
-            if contact_only:
+        
 
 
 
-                queryset = queryset.filter(contact_made=True)
+        return render(request, self.get_template_names(), context)
 
 
 
@@ -5406,47 +3631,47 @@ class TimelineListAPIView(LoginRequiredMixin, View):
 
 
 
-            # Tags (list of IDs)
 
 
 
-            tags = request.GET.getlist('tags[]')
 
+# API Views for Dynamic Add
 
 
-            if tags:
 
+class CategoryCreateView(LoginRequiredMixin, View):
 
 
-                queryset = queryset.filter(tags__id__in=tags).distinct()
 
+    def post(self, request, *args, **kwargs):
 
 
 
+        if getattr(request.user, 'role', '') != 'MASTER':
 
 
 
-            # Pagination (Cursor) - simple date based for now
+             return JsonResponse({'success': False, 'error': 'Only MASTER can create categories.'})
 
 
 
-            # Note: For Global Feed, simple date based cursor on 'date' field might be ambiguous if many logs same date.
+        try:
 
 
 
-            # But 'created_at' is safer. 
+            data = json.loads(request.body)
 
 
 
-            # Current frontend uses 'date' for sorting? 
+            name = data.get('name')
 
 
 
-            # User wants "Sort by Occurrence Date (Newest) AND Input Date (Newest) default".
+            desc = data.get('description', '')
 
 
 
-            # Order By: `-date`, `-created_at`.
+            if not name: return JsonResponse({'success': False, 'error': 'Name required'})
 
 
 
@@ -5454,147 +3679,292 @@ class TimelineListAPIView(LoginRequiredMixin, View):
 
 
 
-            before_timestamp = request.GET.get('before_timestamp') # Changed from before_date for precision
-
+            # Categories are shared by default if created by MASTER? 
 
 
-            if before_timestamp:
 
+            # Looking at init_data.py, they have is_shared=True.
 
 
-                queryset = queryset.filter(created_at__lt=before_timestamp)
 
+            cat = QuestionCategory.objects.create(user=request.user, name=name, description=desc, is_shared=True)
 
 
-                
 
+            return JsonResponse({'success': True, 'id': cat.id, 'name': cat.name})
 
 
-            # Ordering: Date Desc, Created At Desc
 
+        except Exception as e:
 
 
-            queryset = queryset.order_by('-date', '-created_at')
 
+            return JsonResponse({'success': False, 'error': str(e)})
 
 
 
 
 
 
-            # Limit
 
 
 
-            limit = int(request.GET.get('limit', 20))
 
 
+class RankCreateView(LoginRequiredMixin, View):
 
-            queryset = queryset[:limit]
 
 
+    def post(self, request, *args, **kwargs):
 
-            
 
 
+        if getattr(request.user, 'role', '') != 'MASTER':
 
-            # Serialize
 
 
+             return JsonResponse({'success': False, 'error': 'Only MASTER can create ranks.'})
 
-            data = []
 
 
+        try:
 
-            for item in queryset:
 
 
+            data = json.loads(request.body)
 
-                data.append({
 
 
+            name = data.get('name')
 
-                    'id': item.id,
 
 
+            points = data.get('points', 0)
 
-                    'date': item.date.strftime('%Y-%m-%d'),
 
 
+            if not name: return JsonResponse({'success': False, 'error': 'Name required'})
 
-                    'created_at': item.created_at.strftime('%Y-%m-%d %H:%M:%S') if item.created_at else '',
 
 
+            
 
-                    'type': item.type, 
 
 
+            rank = QuestionRank.objects.create(user=request.user, name=name, points=points)
 
-                    'question_id': item.question.id if item.question else None,
 
 
+            return JsonResponse({'success': True, 'id': rank.id, 'name': rank.name})
 
-                    'description': item.content, # Model has 'content', mapped to 'description' for frontend
 
 
+        except Exception as e:
 
-                    # Safety checks for question relation
 
 
+            return JsonResponse({'success': False, 'error': str(e)})
 
-                    'question_title': (item.question.title if item.question else item.question_text) or '',
 
 
 
-                    'question_category': (item.question.category.name if item.question and item.question.category else item.question_category) or '',
 
 
 
-                    'contact_made': item.contact_made,
 
 
 
-                    'tags': [{'id': t.id, 'name': t.name} for t in item.tags.all()],
 
+# --- TIMELINE API ---
 
 
-                    'target': {
 
+def timeline_limit(value):
+    """Page size from ?limit=: the default when missing or malformed, capped at TIMELINE_MAX_LIMIT."""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return TIMELINE_DEFAULT_LIMIT
+    return min(max(limit, 1), TIMELINE_MAX_LIMIT)
 
 
-                        'id': item.target.id,
+def timeline_per_target(value):
+    """Items per target from ?per_target=: 1 when missing or malformed, capped at TIMELINE_MAX_PER_TARGET."""
+    try:
+        return min(max(int(value), 1), TIMELINE_MAX_PER_TARGET)
+    except (TypeError, ValueError):
+        return 1
 
 
+def timeline_keys(relevance=False):
+    """Keyset of the timeline API: newest first by (date, created_at, id), full-text relevance first if asked."""
+    import datetime
+    from django.utils.dateparse import parse_datetime
+    from core.pagination import Key
+
+    keys = [
+        Key('date', descending=True, parse=datetime.date.fromisoformat, nullable=False),
+        Key('created_at', descending=True, parse=parse_datetime, nullable=False),
+        Key('id', descending=True, nullable=False),
+    ]
+    if relevance:
+        # Question-title matches have no FTS rank
+        keys.insert(0, Key('search_rank', descending=True, nulls_last=True, parse=float))
+    return keys
+
+
+def _target_version_key(request):
+    """Change version key of the ?target_id= target, None if the ID is malformed."""
+    import uuid
+    from intelligence.versions import target_version_key
+    try:
+        return target_version_key(uuid.UUID(request.GET.get('target_id', '')))
+    except ValueError:
+        return None
+
+
+def timeline_version_keys(request):
+    """Change versions a timeline API response depends on (question titles come from the catalog)."""
+    from intelligence.versions import catalog_version_keys, shared_version_key, user_version_key
+    target_key = _target_version_key(request)
+    if target_key and not request.GET.get('group_id'):
+        return [shared_version_key(request.user.pk), target_key, *catalog_version_keys(request.user.pk)]
+    return [user_version_key(request.user.pk), *catalog_version_keys(request.user.pk)]
+
+
+def tag_version_keys(request):
+    from intelligence.versions import user_version_key
+    return [user_version_key(request.user.pk)]
+
+
+def question_version_keys(request):
+    from intelligence.versions import catalog_version_keys, user_version_key
+    return [*catalog_version_keys(request.user.pk), _target_version_key(request) or user_version_key(request.user.pk)]
+
+
+def _timeline_id(model, value, name):
+    """value as a primary key of model. Raises ValueError naming the parameter if it is malformed."""
+    from django.core.exceptions import ValidationError
+    try:
+        return model._meta.pk.to_python(value)
+    except ValidationError:
+        raise ValueError(f'Invalid {name}') from None
+
+
+
+def filter_timeline(request):
+    """
+    (queryset, query, search_match): the user's timeline items filtered by the
+    timeline API parameters (target_id, group_id, type, search, contact_only,
+    tags[]), unordered. Raises Target.DoesNotExist for a target_id of another user
+    and ValueError for a malformed target_id, group_id or tag ID.
+    """
+    from intelligence import fulltext
+    from intelligence.models import Tag
+
+    target_id = request.GET.get('target_id')
+    if target_id:
+        target = Target.objects.get(pk=_timeline_id(Target, target_id, 'target_id'), user=request.user)
+        queryset = TimelineItem.objects.filter(target=target)
+    else:
+        # Global Feed
+        queryset = TimelineItem.objects.filter(target__user=request.user)
 
-                        'nickname': item.target.nickname,
+    # Group Filter
+    group_id = request.GET.get('group_id')
+    if group_id:
+        queryset = queryset.filter(target__groups__id=_timeline_id(TargetGroup, group_id, 'group_id'))
+
+    # Type
+    event_type = request.GET.get('type') # 'EVENT' or 'QUESTION'
+    if event_type == 'EVENT':
+        queryset = queryset.filter(Q(type='Event') | Q(type='Note'))
+    elif event_type == 'QUESTION':
+        queryset = queryset.filter(type='Question')
+
+    # Search Query (FTS5 over content / answer / question text, plus question titles)
+    query = request.GET.get('search')
+    search_match = None
+    if query:
+        search_match = fulltext.match_expression(query)
+        title_matches = Question.objects.filter(title__icontains=query).values('id')
+        queryset = queryset.filter(fulltext.search_filter(query, search_match) | Q(question_id__in=title_matches))
+
+    # Encanto Filter
+    if request.GET.get('contact_only') == 'true':
+        queryset = queryset.filter(contact_made=True)
+
+    # Tags (list of IDs)
+    tags = [_timeline_id(Tag, tag_id, 'tags[]') for tag_id in request.GET.getlist('tags[]')]
+    if tags:
+        # Subquery rather than a join + DISTINCT: one row per item for the window functions of group_by_target
+        queryset = queryset.filter(pk__in=TimelineItem.tags.through.objects.filter(tag_id__in=tags).values('timelineitem_id'))
+    return queryset, query, search_match
 
 
 
-                        'avatar': item.target.avatar.url if item.target.avatar else None,
+class TimelineListAPIView(LoginRequiredMixin, View):
 
 
 
-                        'first_name': item.target.first_name,
+    @method_decorator(versioned_get(timeline_version_keys))
+    def get(self, request, *args, **kwargs):
 
 
 
-                        'last_name': item.target.last_name
+        try:
 
 
 
-                    }
+            try:
+                queryset, query, search_match = filter_timeline(request)
+            except Target.DoesNotExist:
+                return JsonResponse({'success': False, 'error': 'Target not found'}, status=404)
+            except ValueError as e:
+                return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+            from core.pagination import KeysetPaginator
+            from core.timeline import TimelineSerializer, latest_per_target, parse_fields
+            from intelligence import fulltext
+
+            # Only the requested fields (?fields=id,date,...) and the relations they read
+            serializer = TimelineSerializer(parse_fields(request.GET.get('fields')))
+            queryset = serializer.prepare(queryset)
+            limit = timeline_limit(request.GET.get('limit'))
+            cursor = request.GET.get('cursor')
+
+            if request.GET.get('group_by_target') == 'true':
+                # Latest ?per_target= items (default 1) of ?limit= targets, targets ordered by their latest item
+                items, next_cursor = latest_per_target(
+                    queryset, timeline_per_target(request.GET.get('per_target')), limit, cursor
+                )
+            else:
+                # Ordering: Date Desc, Created At Desc, ID Desc (full-text relevance first with sort=relevance)
+                # Pagination: opaque keyset cursor over the ordering (next_cursor of the previous page)
+                relevance = bool(search_match) and request.GET.get('sort') == 'relevance'
+                if relevance:
+                    queryset = queryset.annotate(search_rank=fulltext.rank_expression(search_match))
+                page = KeysetPaginator(
+                    queryset, timeline_keys(relevance), per_page=limit,
+                    namespace='timeline_relevance' if relevance else 'timeline',
+                ).page(cursor)
+                items, next_cursor = list(page), page.next_cursor
 
 
 
-                })
+            
 
 
 
-                
+            # Serialize
+            search_hits = None
+            if query:
+                search_hits = fulltext.snippets([item.id for item in items], search_match) if search_match else {}
+            data = serializer.rows(items, search_hits)
 
 
 
-            return JsonResponse({'success': True, 'data': data})
+            return JsonResponse({'success': True, 'data': data, 'next_cursor': next_cursor})
 
 
 
@@ -5618,10 +3988,39 @@ class TimelineListAPIView(LoginRequiredMixin, View):
 
 
 
+class TimelineStreamView(LoginRequiredMixin, View):
+    """
+    The whole filtered timeline as NDJSON (one entry per line, newest first),
+    for sync and backup jobs. Takes the timeline API filters and ?fields=; every
+    line carries the cursor after it, and ?cursor= resumes from there.
+    """
+
+    def get(self, request, *args, **kwargs):
+        from django.http import StreamingHttpResponse
+        from core.pagination import KeysetPaginator
+        from core.timeline import TimelineSerializer, ndjson_lines, parse_fields
+
+        try:
+            queryset, _, _ = filter_timeline(request)
+        except Target.DoesNotExist:
+            return JsonResponse({'success': False, 'error': 'Target not found'}, status=404)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+        serializer = TimelineSerializer(parse_fields(request.GET.get('fields')))
+        # Same ordering and cursors as the paged timeline API
+        paginator = KeysetPaginator(serializer.prepare(queryset), timeline_keys(), namespace='timeline')
+        lines = ndjson_lines(serializer, paginator, request.GET.get('cursor'), chunk_size=TIMELINE_STREAM_CHUNK_SIZE)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
 class TagListAPIView(LoginRequiredMixin, View):
 
 
 
+    @method_decorator(versioned_get(tag_version_keys))
     def get(self, request, *args, **kwargs):
 
 
@@ -5866,6 +4265,7 @@ class QuestionListAPIView(LoginRequiredMixin, View):
 
 
 
+    @method_decorator(versioned_get(question_version_keys))
     def get(self, request, *args, **kwargs):
 
 
@@ -5914,111 +4314,16 @@ class QuestionListAPIView(LoginRequiredMixin, View):
 
 
 
-            # Fetch all categories
-
-
-
-            # Including 'Uncategorized'? Maybe handling null category questions separately or generic
-
-
-
-            # Fetch Questions first to know which categories are needed
-
-
-
-            questions_qs = Question.objects.filter(
-
-
-
-                Q(is_shared=True) | Q(user=request.user) | Q(user__role='MASTER')
-
-
-
-            ).distinct().select_related('category', 'rank').order_by('category__id', 'order', 'title')
-
-
-
-            
-
-
-
-            # Get IDs of categories used by these questions
-
-
-
-            category_ids = questions_qs.values_list('category_id', flat=True).distinct()
-
-
-
-
-
-
-
-            # Fetch Categories (User's OR Shared OR MASTER OR Used by Questions)
-
-
-
-            categories = QuestionCategory.objects.filter(
-
-
-
-                Q(user=request.user) | Q(is_shared=True) | Q(user__role='MASTER') | Q(id__in=category_ids)
-
-
-
-            ).distinct().order_by('order', 'created_at')
-
-
-
-            
-
-
-
-            # We can't easily annotate a filtered count inside a related manager query for serialization 
-
-
-
-            # without complex Prefetch or annotation.
-
-
-
-            # Simpler approach: Fetch log counts separately or use subquery.
-
-
-
-            
-
-
-
-            # Use annotation with Q filter on TimelineItem
-
-
-
-            # But Question -> TimelineItem (reverse relation name defaults to 'timelineitem_set' or similar?)
-
-
-
-            # TimelineItem has 'question' FK. So 'timelineitem'.
-
-
-
-            
-
-
-
-            questions_qs = questions_qs.annotate(
-
-
-
-                answer_count=Count('timelineitem', filter=Q(timelineitem__target_id=target_id)),
-
-
-
-                latest_answer=Max('timelineitem__date', filter=Q(timelineitem__target_id=target_id))
+            # Questions & Categories from the cached catalog (Owned OR Shared OR MASTER, plus categories used by the questions)
+            from intelligence.catalog import get_catalog
+            catalog = get_catalog(request.user)
+            questions_qs = catalog.visible_questions()
+            categories = catalog.visible_categories(questions_qs)
 
-
-
-            )
+            # Answer count, latest answer date and answered questions per category (pointer tables, see intelligence/answers.py)
+            from intelligence.answers import answer_summary, category_progress
+            answers = answer_summary(target_id)
+            progress = category_progress(target_id)
 
 
 
@@ -6054,6 +4359,10 @@ class QuestionListAPIView(LoginRequiredMixin, View):
 
 
 
+                    'answered_count': progress.get(cat.id, 0),
+
+
+
                     'questions': []
 
 
@@ -6066,7 +4375,7 @@ class QuestionListAPIView(LoginRequiredMixin, View):
 
 
 
-            categorized_data['none'] = {'id': 'none', 'name': 'Uncategorized', 'questions': []}
+            categorized_data['none'] = {'id': 'none', 'name': 'Uncategorized', 'answered_count': progress.get(None, 0), 'questions': []}
 
 
 
@@ -6075,6 +4384,7 @@ class QuestionListAPIView(LoginRequiredMixin, View):
 
 
             for q in questions_qs:
+                answer_count, latest_date = answers.get(q.id, (0, None))
 
 
 
@@ -6110,11 +4420,8 @@ class QuestionListAPIView(LoginRequiredMixin, View):
 
 
 
-                    'count': q.answer_count,
-
-
-
-                    'latest_date': q.latest_answer.strftime('%Y-%m-%d') if q.latest_answer else ''
+                    'count': answer_count,
+                    'latest_date': latest_date.strftime('%Y-%m-%d') if latest_date else ''
 
 
 
@@ -7162,7 +5469,11 @@ class CalendarView(LoginRequiredMixin, MobileTemplateMixin, View):
         ).values('date').annotate(count=Count('id'))
         group_counts = {item['date']: item['count'] for item in group_states}
         
-        custom_anniversaries = CustomAnniversary.objects.filter(target__user=user).select_related('target')
+        # Anniversaries for the whole window in one indexed query
+        from intelligence.anniversaries import occurrences_between
+        anniversaries_by_date = {}
+        for occ in occurrences_between(user, start_date, end_date):
+            anniversaries_by_date.setdefault(occ.date, []).append(occ)
         targets = Target.objects.filter(user=user)
         
         # 4. Organize into Days
@@ -7194,8 +5505,12 @@ class CalendarView(LoginRequiredMixin, MobileTemplateMixin, View):
         # Create Target Dict for O(1) Access
         all_targets_dict = {t.id: t for t in targets}
 
+        # Daily lists of the whole window (stored rosters, missing days computed in one batch)
+        from intelligence.roster import roster_between
+        rosters = roster_between(user, start_date, end_date)
+
         while current <= end_date:
-            daily_target_info = IntelligenceLogView.get_daily_target_ids_logic(user, current)
+            daily_target_info = rosters[current]
 
             day_info = {
                 'date': current,
@@ -7242,29 +5557,20 @@ class CalendarView(LoginRequiredMixin, MobileTemplateMixin, View):
             day_info['group_count'] = group_only_count
             
             # --- Anniversary Logic ---
-            for anniv in custom_anniversaries:
-                if anniv.date.month == current.month and anniv.date.day == current.day:
-                    # Generic Anniversary
-                    # Logic: If anniv date is 2020, and current is 2023, it's 3rd or 4th?
-                    # Usually "3rd Anniversary" = 3 years passed.
+            for occ in anniversaries_by_date.get(current, []):
+                if occ.kind == 'birthday':
+                    age_label = "誕生日"
+                    if occ.origin_year:
+                        age = current.year - occ.origin_year
+                        age_label += f" ({age}歳)"
+                    day_info['anniversaries'].append({'target': occ.target, 'label': age_label, 'type': 'birthday'})
+                else:
                     # Logic: User says "0th is impossible". Start from 1st.
                     # If current.year == anniv.year, it is the 1st time (1回目).
-                    count = current.year - anniv.date.year + 1
-                    label = f"{anniv.label}"
+                    count = current.year - occ.origin_year + 1
+                    label = f"{occ.label}"
                     if count >= 1: label += f" ({count}回目)"
-                    day_info['anniversaries'].append({'target': anniv.target, 'label': label, 'type': 'custom'})
-            
-            for t in targets:
-                # Assuming t has a date property, previous code used t.birth_month/day? 
-                # Checking `Target` model fields from context... usually it's `birthday` (date) field.
-                # Adjusting to use `birthday` field if available or construct from parts.
-                # Actually previous file read shows `if t.birth_month == current.month...`. So it uses parts.
-                if t.birth_month == current.month and t.birth_day == current.day:
-                    age_label = "誕生日"
-                    if t.birth_year:
-                        age = current.year - t.birth_year
-                        age_label += f" ({age}歳)"
-                    day_info['anniversaries'].append({'target': t, 'label': age_label, 'type': 'birthday'})
+                    day_info['anniversaries'].append({'target': occ.target, 'label': label, 'type': 'custom'})
             
             days_data.append(day_info)
             current += datetime.timedelta(days=1)
@@ -0,0 +1,210 @@
+"""
+Anniversary occurrence index.
+
+Birthdays (Target.birth_month/birth_day) and CustomAnniversary dates are
+materialized into AnniversaryOccurrence rows keyed by (user, day_key), where
+day_key is the day-of-year inside a leap year. Any date window therefore
+resolves with a single indexed range query instead of one month/day scan per day.
+
+Feb 29 anniversaries are observed on Mar 1 in non-leap years (same rule as the
+"next anniversary" helper of the Intelligence Log).
+"""
+import datetime
+from collections import namedtuple
+
+from django.db.models import Q
+
+from .models import AnniversaryOccurrence
+
+LEAP_YEAR = 2000
+FEB_29_KEY = 60
+BIRTHDAY_LABEL = "誕生日"
+
+Occurrence = namedtuple('Occurrence', ['date', 'kind', 'label', 'target_id', 'target', 'origin_year', 'anniversary_id'])
+
+
+def day_key(month, day):
+    """Day-of-year of month/day in a leap year, or None for invalid input."""
+    try:
+        return datetime.date(LEAP_YEAR, int(month), int(day)).timetuple().tm_yday
+    except (TypeError, ValueError):
+        return None
+
+
+def occurrence_date(month, day, year):
+    """Concrete date of month/day in `year` (Feb 29 -> Mar 1 in non-leap years)."""
+    try:
+        return datetime.date(year, month, day)
+    except ValueError:
+        return datetime.date(year, 3, 1)
+
+
+def next_occurrence(month, day, reference):
+    """First date on or after `reference` on which month/day is observed."""
+    this_year = occurrence_date(month, day, reference.year)
+    if this_year >= reference:
+        return this_year
+    return occurrence_date(month, day, reference.year + 1)
+
+
+def nearest_anniversaries(targets, reference):
+    """
+    {target_id: (date, label, kind)} with the next birthday or custom
+    anniversary of each target on or after `reference` (birthdays win ties).
+    Custom anniversaries are read from target.customanniversary_set.all(),
+    so prefetch them: the whole roster is then resolved without a query.
+    """
+    candidates = []
+    for target in targets:
+        if target.birth_month and target.birth_day:
+            d = next_occurrence(target.birth_month, target.birth_day, reference)
+            candidates.append(((d, 0, 0), target.pk, BIRTHDAY_LABEL, AnniversaryOccurrence.BIRTHDAY))
+        for anniversary in target.customanniversary_set.all():
+            d = next_occurrence(anniversary.date.month, anniversary.date.day, reference)
+            candidates.append(((d, 1, anniversary.pk), target.pk, anniversary.label, AnniversaryOccurrence.CUSTOM))
+
+    nearest = {}
+    for key, target_id, label, kind in sorted(candidates, key=lambda c: c[0]):
+        if target_id not in nearest:
+            nearest[target_id] = (key[0], label, kind)
+    return nearest
+
+
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def _window_filter(start, end):
+    """Q on day_key covering every calendar date between start and end (inclusive)."""
+    if (end - start).days >= 365:
+        return Q()
+
+    lo = day_key(start.month, start.day)
+    hi = day_key(end.month, end.day)
+    # Feb 29 rows are observed on Mar 1 of non-leap years
+    if start.month == 3 and start.day == 1 and not _is_leap(start.year):
+        lo = FEB_29_KEY
+
+    if lo <= hi:
+        return Q(day_key__gte=lo, day_key__lte=hi)
+    # Window wraps over the year boundary
+    return Q(day_key__gte=lo) | Q(day_key__lte=hi)
+
+
+def occurrences_between(user, start, end, select_target=True):
+    """
+    All anniversary occurrences of `user` between start and end (inclusive),
+    sorted by date (birthdays first on the same day). One query.
+    """
+    if end < start:
+        return []
+
+    qs = AnniversaryOccurrence.objects.filter(_window_filter(start, end), user=user)
+    if select_target:
+        qs = qs.select_related('target')
+
+    results = []
+    for occ in qs:
+        for year in range(start.year, end.year + 1):
+            d = occurrence_date(occ.month, occ.day, year)
+            if start <= d <= end:
+                results.append(Occurrence(
+                    date=d,
+                    kind=occ.kind,
+                    label=occ.label,
+                    target_id=occ.target_id,
+                    target=occ.target if select_target else None,
+                    origin_year=occ.origin_year,
+                    anniversary_id=occ.anniversary_id,
+                ))
+
+    results.sort(key=lambda o: (o.date, o.kind != AnniversaryOccurrence.BIRTHDAY, o.anniversary_id or 0))
+    return results
+
+
+def occurrences_on(user, date, select_target=True):
+    return occurrences_between(user, date, date, select_target=select_target)
+
+
+# --- Maintenance (called from intelligence.signals) ---
+
+def sync_target_birthday(target):
+    key = day_key(target.birth_month, target.birth_day)
+    existing = AnniversaryOccurrence.objects.filter(target=target, kind=AnniversaryOccurrence.BIRTHDAY).first()
+
+    if key is None:
+        if existing:
+            existing.delete()
+        return
+
+    values = {
+        'user_id': target.user_id,
+        'label': BIRTHDAY_LABEL,
+        'month': target.birth_month,
+        'day': target.birth_day,
+        'day_key': key,
+        'origin_year': target.birth_year,
+    }
+    if existing is None:
+        AnniversaryOccurrence.objects.create(target=target, kind=AnniversaryOccurrence.BIRTHDAY, **values)
+    elif any(getattr(existing, k) != v for k, v in values.items()):
+        for k, v in values.items():
+            setattr(existing, k, v)
+        existing.save()
+
+
+def sync_custom_anniversary(anniversary):
+    key = day_key(anniversary.date.month, anniversary.date.day)
+    AnniversaryOccurrence.objects.update_or_create(
+        anniversary=anniversary,
+        defaults={
+            'user_id': anniversary.target.user_id,
+            'target_id': anniversary.target_id,
+            'kind': AnniversaryOccurrence.CUSTOM,
+            'label': anniversary.label,
+            'month': anniversary.date.month,
+            'day': anniversary.date.day,
+            'day_key': key,
+            'origin_year': anniversary.date.year,
+        }
+    )
+
+
+def rebuild_all_occurrences(batch_size=500, user_ids=None):
+    """
+    Recompute the index (after bulk imports, which bypass signals), only for
+    the targets of user_ids if given. Returns the row count.
+    """
+    from django.db import transaction
+    from .models import Target, CustomAnniversary
+
+    targets = Target.objects.filter(birth_month__isnull=False, birth_day__isnull=False)
+    custom = CustomAnniversary.objects.select_related('target')
+    existing = AnniversaryOccurrence.objects.all()
+    if user_ids is not None:
+        targets = targets.filter(user_id__in=user_ids)
+        custom = custom.filter(target__user_id__in=user_ids)
+        existing = existing.filter(user_id__in=user_ids)
+
+    rows = []
+    for target in targets.iterator():
+        key = day_key(target.birth_month, target.birth_day)
+        if key is None:
+            continue
+        rows.append(AnniversaryOccurrence(
+            user_id=target.user_id, target_id=target.pk, kind=AnniversaryOccurrence.BIRTHDAY,
+            label=BIRTHDAY_LABEL, month=target.birth_month, day=target.birth_day,
+            day_key=key, origin_year=target.birth_year,
+        ))
+    for anniversary in custom.iterator():
+        d = anniversary.date
+        rows.append(AnniversaryOccurrence(
+            user_id=anniversary.target.user_id, target_id=anniversary.target_id, anniversary_id=anniversary.pk,
+            kind=AnniversaryOccurrence.CUSTOM, label=anniversary.label, month=d.month, day=d.day,
+            day_key=day_key(d.month, d.day), origin_year=d.year,
+        ))
+
+    with transaction.atomic():
+        existing.delete()
+        AnniversaryOccurrence.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
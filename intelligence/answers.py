@@ -0,0 +1,190 @@
+"""
+Question answers of a target.
+
+An answer is a TimelineItem of type 'Question' linked to a Question; a
+question can be answered several times and the latest answer (by date, then
+created_at) is the current one.
+
+TargetQuestionAnswer points at the current answer of every answered
+(target, question) pair, with the answer count, and TargetCategoryProgress
+counts the answered questions per (target, category). Both are maintained
+from intelligence.signals: answer create / update / delete, questions moving
+between categories, question and category deletes. rebuild_answer_index()
+recomputes everything (see the rebuild_answer_index management command).
+"""
+from django.db import transaction
+from django.db.models import Q, F, Count, Case, When, Value, Window
+from django.db.models.functions import RowNumber
+
+from .models import TimelineItem, Question, TargetQuestionAnswer, TargetCategoryProgress
+
+
+def _answers(item_model=TimelineItem):
+    return item_model.objects.filter(type='Question', question__isnull=False)
+
+
+def _latest_first():
+    return [F('date').desc(), F('created_at').desc(), F('id').desc()]
+
+
+# --- Reads ---
+
+def current_answers(target):
+    """{question_id: TimelineItem} of the current answers of target (indexed pointer lookup)."""
+    pointers = TargetQuestionAnswer.objects.filter(target=target, item__isnull=False).select_related('item')
+    return {pointer.question_id: pointer.item for pointer in pointers}
+
+
+def answer_summary(target_id):
+    """{question_id: (answer_count, latest_date)} for target."""
+    return {
+        row[0]: (row[1], row[2])
+        for row in TargetQuestionAnswer.objects.filter(target_id=target_id).values_list('question_id', 'answer_count', 'date')
+    }
+
+
+def category_progress(target_id):
+    """{category_id: answered question count} for target (None = uncategorized)."""
+    return dict(
+        TargetCategoryProgress.objects.filter(target_id=target_id).values_list('category_id', 'answered_count')
+    )
+
+
+# --- Maintenance (called from intelligence.signals) ---
+
+def _progress(target_id, category_id):
+    rows = TargetCategoryProgress.objects.filter(target_id=target_id)
+    if category_id is None:
+        return rows.filter(category__isnull=True)
+    return rows.filter(category_id=category_id)
+
+
+def _adjust_progress(target_id, category_id, delta):
+    if _progress(target_id, category_id).update(answered_count=F('answered_count') + delta) or delta < 0:
+        return
+    TargetCategoryProgress.objects.create(target_id=target_id, category_id=category_id, answered_count=delta)
+
+
+def _category_id(question_id):
+    return Question.objects.filter(pk=question_id).values_list('category_id', flat=True).first()
+
+
+def _when(condition, value, field_name):
+    field = TargetQuestionAnswer._meta.get_field(field_name)
+    return Case(When(condition, then=Value(value, output_field=field)), default=F(field_name), output_field=field)
+
+
+def answer_created(item):
+    """A new answer is always the latest one unless it is dated before the current answer."""
+    newer = Q(date__lte=item.date)
+    updated = TargetQuestionAnswer.objects.filter(target_id=item.target_id, question_id=item.question_id).update(
+        answer_count=F('answer_count') + 1,
+        item=_when(newer, item.pk, 'item'),
+        # Kept last: MySQL evaluates SET clauses left to right
+        date=_when(newer, item.date, 'date'),
+    )
+    if updated:
+        return
+    category_id = _category_id(item.question_id)
+    TargetQuestionAnswer.objects.create(
+        target_id=item.target_id, question_id=item.question_id, category_id=category_id, item_id=item.pk, date=item.date,
+    )
+    _adjust_progress(item.target_id, category_id, 1)
+
+
+def refresh_answer(target_id, question_id):
+    """Re-derive the pointer of one (target, question) pair after an answer changed or went away."""
+    answers = _answers().filter(target_id=target_id, question_id=question_id)
+    latest = answers.order_by(*_latest_first()).values('pk', 'date', 'question__category_id').first()
+    pointer = TargetQuestionAnswer.objects.filter(target_id=target_id, question_id=question_id)
+    current = pointer.values('pk', 'category_id').first()
+
+    if latest is None:
+        if current is not None:
+            pointer.delete()
+            _adjust_progress(target_id, current['category_id'], -1)
+        return
+
+    values = {
+        'item_id': latest['pk'],
+        'date': latest['date'],
+        'answer_count': answers.count(),
+        'category_id': latest['question__category_id'],
+    }
+    if current is None:
+        TargetQuestionAnswer.objects.create(target_id=target_id, question_id=question_id, **values)
+        _adjust_progress(target_id, values['category_id'], 1)
+        return
+    pointer.update(**values)
+    if current['category_id'] != values['category_id']:
+        _adjust_progress(target_id, current['category_id'], -1)
+        _adjust_progress(target_id, values['category_id'], 1)
+
+
+def question_moved(question):
+    """question.category changed: move its pointers and recount the affected targets."""
+    pointers = TargetQuestionAnswer.objects.filter(question_id=question.pk)
+    target_ids = set(pointers.values_list('target_id', flat=True))
+    pointers.update(category_id=question.category_id)
+    recount_progress(target_ids)
+
+
+def recount_progress(target_ids, batch_size=500):
+    """Recompute the category counters of target_ids from their pointers."""
+    target_ids = list(target_ids)
+    if not target_ids:
+        return
+    rows = (
+        TargetQuestionAnswer.objects.filter(target_id__in=target_ids)
+        .order_by().values('target_id', 'category_id').annotate(answered=Count('pk'))
+    )
+    with transaction.atomic():
+        TargetCategoryProgress.objects.filter(target_id__in=target_ids).delete()
+        TargetCategoryProgress.objects.bulk_create([
+            TargetCategoryProgress(target_id=row['target_id'], category_id=row['category_id'], answered_count=row['answered'])
+            for row in rows
+        ], batch_size=batch_size)
+
+
+def build_answer_index(item_model, answer_model, progress_model, batch_size=500, user_ids=None):
+    """
+    Fill the (empty) pointer and counter tables from the timeline in one
+    window-function query (works on historical models too), only for the
+    targets of user_ids if given. Returns the number of pointers written.
+    """
+    answers = _answers(item_model)
+    if user_ids is not None:
+        answers = answers.filter(target__user_id__in=user_ids)
+    answers = answers.annotate(
+        answer_rank=Window(RowNumber(), partition_by=[F('target_id'), F('question_id')], order_by=_latest_first()),
+        total=Window(Count('id'), partition_by=[F('target_id'), F('question_id')]),
+    ).filter(answer_rank=1).values('pk', 'target_id', 'question_id', 'question__category_id', 'date', 'total')
+
+    pointers, counts = [], {}
+    for row in answers.iterator():
+        key = (row['target_id'], row['question__category_id'])
+        counts[key] = counts.get(key, 0) + 1
+        pointers.append(answer_model(
+            target_id=row['target_id'], question_id=row['question_id'], category_id=row['question__category_id'],
+            item_id=row['pk'], date=row['date'], answer_count=row['total'],
+        ))
+    answer_model.objects.bulk_create(pointers, batch_size=batch_size)
+    progress_model.objects.bulk_create([
+        progress_model(target_id=target_id, category_id=category_id, answered_count=count)
+        for (target_id, category_id), count in counts.items()
+    ], batch_size=batch_size)
+    return len(pointers)
+
+
+def rebuild_answer_index(batch_size=500, user_ids=None):
+    """Rebuild every pointer and counter (only those of user_ids' targets if given). Returns the number of pointers written."""
+    progress, pointers = TargetCategoryProgress.objects.all(), TargetQuestionAnswer.objects.all()
+    if user_ids is not None:
+        progress = progress.filter(target__user_id__in=user_ids)
+        pointers = pointers.filter(target__user_id__in=user_ids)
+    with transaction.atomic():
+        progress.delete()
+        pointers.delete()
+        return build_answer_index(
+            TimelineItem, TargetQuestionAnswer, TargetCategoryProgress, batch_size=batch_size, user_ids=user_ids
+        )
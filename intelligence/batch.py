@@ -0,0 +1,250 @@
+"""
+Batched Intelligence Log writes.
+
+apply_operations() takes a list of the create / update / delete operations
+IntelligenceLogView.post handles one at a time, validates all of them first
+and applies them in one transaction: new TimelineItems, tag links and images
+are bulk inserted, tags are resolved for the whole batch at once, and the data
+the per-row signals would maintain (TargetStats, current answers, the user's
+change version) is refreshed once per affected target / question.
+
+bulk_create must return primary keys (SQLite >= 3.35, PostgreSQL, MariaDB >= 10.5).
+"""
+import datetime
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import answers, stats
+from .catalog import get_catalog
+from .models import Target, TimelineItem, TimelineImage
+from .tags import attach_tags, hashtags, resolve_tags, user_tags
+from .versions import bump_target_version, bump_user_version
+
+MAX_OPERATIONS = 100
+MAX_IMAGES = 4
+ACTIONS = ('create', 'update', 'delete')
+
+
+class Operation:
+    def __init__(self, index, action, data):
+        self.index = index
+        self.action = action
+        self.data = data
+        self.item = None
+        self.target = None
+        self.question = None
+        self.images = []
+        self.tags = []
+        self.error = None
+
+    def result(self, has_entry_today=None):
+        if self.error:
+            return {'index': self.index, 'action': self.action, 'success': False, 'error': self.error}
+        return {
+            'index': self.index,
+            'action': self.action,
+            'success': True,
+            'item_id': self.item.pk,
+            'target_id': self.target.pk,
+            'has_entry_today': has_entry_today,
+        }
+
+
+def _flag(value):
+    # FormData sends booleans as strings
+    return value == 'true' if isinstance(value, str) else bool(value)
+
+
+def _date(value, default):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return default
+
+
+def _uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _content(data):
+    content = data.get('description', '') or data.get('content', '')
+    return '' if content in ['null', 'undefined', 'None'] else content
+
+
+def _tag_ids(data):
+    tag_ids = data.get('tags') or []
+    return tag_ids if isinstance(tag_ids, list) else []
+
+
+def _load(user, operations):
+    """One query each for the targets, items and explicit tags referenced by the batch."""
+    target_ids = {_uuid(op.data.get('target_id')) for op in operations if op.action == 'create'} - {None}
+    item_ids = {_int(op.data.get('item_id')) for op in operations if op.action != 'create'} - {None}
+    tag_ids = [tag_id for op in operations for tag_id in _tag_ids(op.data)]
+
+    targets = {t.pk: t for t in Target.objects.filter(user=user, pk__in=target_ids)} if target_ids else {}
+    items = {
+        item.pk: item
+        for item in TimelineItem.objects.filter(target__user=user, pk__in=item_ids).select_related('target')
+    } if item_ids else {}
+    return targets, items, user_tags(user, tag_ids)
+
+
+def validate(user, raw_operations, files=None):
+    """Operation objects for raw_operations, with .error set on the invalid ones."""
+    operations = []
+    for index, data in enumerate(raw_operations):
+        if not isinstance(data, dict):
+            data = {}
+        operation = Operation(index, data.get('action', 'create'), data)
+        if operation.action not in ACTIONS:
+            operation.error = 'Unknown action'
+        operations.append(operation)
+
+    targets, items, tags = _load(user, [op for op in operations if not op.error])
+    catalog = get_catalog(user)
+    seen_items = set()
+    for op in operations:
+        if op.error:
+            continue
+        op.tags = [tags[tag_id] for tag_id in map(_int, _tag_ids(op.data)) if tag_id in tags]
+
+        if op.action == 'create':
+            if not op.data.get('target_id'):
+                op.error = 'No target specified'
+                continue
+            op.target = targets.get(_uuid(op.data['target_id']))
+            if op.target is None:
+                op.error = 'Target not found'
+                continue
+            if op.data.get('event_type', 'NOTE') == 'QUESTION' and op.data.get('question_id'):
+                op.question = catalog.visible_question(op.data['question_id'])
+                if op.question is None:
+                    op.error = 'Question not found'
+                    continue
+            if files is not None:
+                op.images = files.getlist(f'images_{op.index}')[:MAX_IMAGES]
+            continue
+
+        if not op.data.get('item_id'):
+            op.error = 'Item ID required'
+            continue
+        item_id = _int(op.data['item_id'])
+        op.item = items.get(item_id)
+        if op.item is None:
+            op.error = 'Item not found'
+        elif item_id in seen_items:
+            op.error = 'Item appears in several operations'
+        else:
+            seen_items.add(item_id)
+            op.target = op.item.target
+    return operations
+
+
+def _new_item(op):
+    data = op.data
+    content = _content(data)
+    is_question = data.get('event_type', 'NOTE') == 'QUESTION'
+    item = TimelineItem(
+        target=op.target,
+        date=_date(data.get('date'), datetime.date.today()),
+        contact_made=_flag(data.get('contact_made')),
+        type='Question' if is_question else ('Event' if not op.images else 'Note'),
+        content=content,
+    )
+    if is_question:
+        if op.question is not None:
+            item.question = op.question
+            item.question_text = op.question.title
+            item.question_category = op.question.category.name if op.question.category else ''
+        item.question_answer = content
+    return item
+
+
+def _answer_key(item):
+    if item.type == 'Question' and item.question_id:
+        return (item.target_id, item.question_id)
+    return None
+
+
+def apply_operations(user, raw_operations, files=None):
+    """
+    Validate and apply a batch. Returns (success, results): nothing is written
+    unless every operation is valid, and results has one entry per operation.
+    """
+    operations = validate(user, raw_operations, files)
+    if any(op.error for op in operations):
+        return False, [
+            op.result() if op.error else {'index': op.index, 'action': op.action, 'success': False, 'error': 'Not applied'}
+            for op in operations
+        ]
+
+    creates = [op for op in operations if op.action == 'create']
+    updates = [op for op in operations if op.action == 'update']
+    deletes = [op for op in operations if op.action == 'delete']
+    touched_targets, answer_keys, contact_targets = set(), set(), set()
+
+    with transaction.atomic():
+        # Deletes go through the ORM so the per-row receivers maintain the derived data
+        if deletes:
+            TimelineItem.objects.filter(pk__in=[op.item.pk for op in deletes]).delete()
+
+        for op in updates:
+            item, data = op.item, op.data
+            answer_keys.add(_answer_key(item))
+            if 'description' in data: item.content = data.get('description')
+            if data.get('date'): item.date = _date(data['date'], item.date)
+            if 'contact_made' in data: item.contact_made = _flag(data.get('contact_made'))
+        if updates:
+            TimelineItem.objects.bulk_update([op.item for op in updates], ['content', 'date', 'contact_made'])
+            # Tags are re-applied from the new content and tag IDs
+            TimelineItem.tags.through.objects.filter(timelineitem_id__in=[op.item.pk for op in updates]).delete()
+
+        for op in creates:
+            op.item = _new_item(op)
+        TimelineItem.objects.bulk_create([op.item for op in creates])
+
+        written = creates + updates
+        resolved = resolve_tags(user, [name for op in written for name in hashtags(op.item.content)])
+        links = set()
+        for op in written:
+            tags = [resolved[name] for name in hashtags(op.item.content)] + op.tags
+            links.update((op.item.pk, tag.pk) for tag in tags)
+        attach_tags(user.pk, links)
+
+        TimelineImage.objects.bulk_create([TimelineImage(item=op.item, image=image) for op in creates for image in op.images])
+
+        for op in written:
+            touched_targets.add(op.item.target_id)
+            answer_keys.add(_answer_key(op.item))
+            if op.item.contact_made:
+                contact_targets.add(op.item.target_id)
+        if contact_targets:
+            Target.objects.filter(pk__in=contact_targets).update(last_contact=timezone.now())
+
+        # bulk_create / bulk_update skip the signal receivers
+        stats.recalculate_targets(touched_targets)
+        for key in answer_keys - {None}:
+            answers.refresh_answer(*key)
+        bump_user_version(user.pk)
+        for target_id in touched_targets:
+            bump_target_version(target_id)
+
+    # Which (target, date) pairs still have entries, in one query
+    pairs = {(op.target.pk, op.item.date) for op in operations}
+    remaining = set(TimelineItem.objects.filter(
+        target_id__in={target_id for target_id, _ in pairs}, date__in={date for _, date in pairs}
+    ).values_list('target_id', 'date').distinct())
+    return True, [op.result(has_entry_today=(op.target.pk, op.item.date) in remaining) for op in operations]
@@ -0,0 +1,191 @@
+"""
+Question catalog service.
+
+Visibility rule: a user sees their own questions, shared questions and every
+question owned by a MASTER (categories follow the same rule). Evaluating that
+rule in SQL needs an OR over a join on the user table plus DISTINCT, on every
+page that lists questions.
+
+Instead the catalog is loaded in two parts, each cached per change version
+(intelligence.versions) and merged in Python by get_catalog(user):
+
+* the shared part: shared and MASTER-owned questions and categories, per
+  shared catalog version (kept per process as well);
+* the own part of a user: their questions, categories and ranks, per user
+  catalog version.
+
+Both parts also hold the categories and ranks their questions use. A question
+edit bumps its owner's catalog version, and the shared one only when the
+question is (or was) shared or MASTER-owned (intelligence.signals), so it
+rebuilds one user's part. Catalog objects are shared between requests: treat
+them as read-only and copy an instance before setting attributes on it.
+
+Unless versions_shared(), nothing is cached and every get_catalog() reads the
+database: another worker could have bumped a version this process cannot see.
+"""
+import heapq
+import random
+
+from django.db.models import Q
+
+from .models import Question, QuestionCategory, QuestionRank
+from .versions import get_catalog_versions, version_cache, versions_shared
+
+CATALOG_TIMEOUT = 60 * 60 * 24
+MASTER_ROLE = 'MASTER'
+
+# Per-process copy of the current shared part: (version, CatalogPart)
+_local = {'shared': (None, None)}
+
+
+def _category_sort_key(category):
+    return (category.order, category.created_at)
+
+
+def _question_sort_key(question):
+    # Same as order_by('category__order', 'category__created_at', 'order', 'title'), NULL category first
+    category = question.category
+    if category is None:
+        return (0, 0, None, question.order, question.title)
+    return (1, category.order, category.created_at, question.order, question.title)
+
+
+class CatalogPart:
+    """Questions (sorted, category and rank resolved), categories (sorted) and ranks of one part."""
+
+    def __init__(self, questions, categories, ranks, master_ids=()):
+        self.master_ids = frozenset(master_ids)
+        self.categories = sorted(categories, key=_category_sort_key)
+        self.ranks = list(ranks)
+        categories_by_id = {c.id: c for c in self.categories}
+        ranks_by_id = {r.id: r for r in self.ranks}
+        for q in questions:
+            # Share one instance per category / rank instead of one per question
+            q.category = categories_by_id.get(q.category_id)
+            q.rank = ranks_by_id.get(q.rank_id)
+        self.questions = sorted(questions, key=_question_sort_key)
+
+
+class Catalog:
+    """The questions, categories and ranks one user sees: the shared part merged with the user's own."""
+
+    def __init__(self, user_id, shared, own):
+        self.user_id = user_id
+        self.master_ids = shared.master_ids
+        shared_ids = {q.id for q in shared.questions}
+        self.questions = list(heapq.merge(
+            shared.questions, [q for q in own.questions if q.id not in shared_ids], key=_question_sort_key,
+        ))
+        self.questions_by_id = {q.id: q for q in self.questions}
+        shared_category_ids = {c.id for c in shared.categories}
+        self.categories = list(heapq.merge(
+            shared.categories, [c for c in own.categories if c.id not in shared_category_ids], key=_category_sort_key,
+        ))
+        self.categories_by_id = {c.id: c for c in self.categories}
+        self.ranks_by_id = {r.id: r for part in (shared, own) for r in part.ranks}
+        self.ranks = [r for r in own.ranks if r.user_id == user_id]
+
+    def _visible(self, obj):
+        return obj.user_id == self.user_id or obj.is_shared or obj.user_id in self.master_ids
+
+    def visible_questions(self):
+        return list(self.questions)
+
+    def visible_question(self, question_id):
+        """Visible question by id, or None."""
+        try:
+            return self.questions_by_id.get(int(question_id))
+        except (TypeError, ValueError):
+            return None
+
+    def visible_categories(self, questions=None):
+        """
+        Categories owned by the user, shared or owned by a MASTER, ordered by
+        (order, created_at). With `questions`, categories used by them are included too.
+        """
+        used = {q.category_id for q in questions} if questions is not None else set()
+        return [c for c in self.categories if self._visible(c) or c.id in used]
+
+    def private_categories(self):
+        """Categories only the user can see (not shared, not MASTER-owned), oldest first."""
+        private = [c for c in self.categories if c.user_id == self.user_id and not c.is_shared and c.user_id not in self.master_ids]
+        return sorted(private, key=lambda c: c.created_at)
+
+    def shared_categories(self):
+        return [c for c in self.categories if c.is_shared or c.user_id in self.master_ids]
+
+    def user_ranks(self):
+        return list(self.ranks)
+
+
+def _build_shared():
+    from accounts.models import CustomUser
+    master_ids = list(CustomUser.objects.filter(role=MASTER_ROLE).values_list('id', flat=True))
+    in_shared = Q(is_shared=True) | Q(user_id__in=master_ids)
+    questions = Question.objects.filter(in_shared)
+    return CatalogPart(
+        questions=list(questions),
+        categories=QuestionCategory.objects.filter(in_shared | Q(pk__in=questions.values('category_id'))),
+        ranks=QuestionRank.objects.filter(pk__in=questions.values('rank_id')).order_by('pk'),
+        master_ids=master_ids,
+    )
+
+
+def _build_own(user_id):
+    questions = Question.objects.filter(user_id=user_id)
+    return CatalogPart(
+        questions=list(questions),
+        categories=QuestionCategory.objects.filter(Q(user_id=user_id) | Q(pk__in=questions.values('category_id'))),
+        ranks=QuestionRank.objects.filter(Q(user_id=user_id) | Q(pk__in=questions.values('rank_id'))).order_by('pk'),
+    )
+
+
+def _shared_part(version):
+    """Shared part for version (process memory, then shared cache, then database)."""
+    local_version, part = _local['shared']
+    if local_version == version:
+        return part
+
+    cache = version_cache()
+    key = f'catalog:shared:v{version}'
+    part = cache.get(key)
+    if part is None:
+        part = _build_shared()
+        cache.set(key, part, CATALOG_TIMEOUT)
+
+    _local['shared'] = (version, part)
+    return part
+
+
+def get_catalog(user):
+    """Catalog of user: the cached shared part plus the user's cached own part."""
+    if not versions_shared():
+        return Catalog(user.pk, _build_shared(), _build_own(user.pk))
+
+    shared_version, own_version = get_catalog_versions(user.pk)
+    cache = version_cache()
+    # Own questions can use categories and ranks of the shared part: the key carries both versions
+    key = f'catalog:user:{user.pk}:v{shared_version}:{own_version}'
+    own = cache.get(key)
+    if own is None:
+        own = _build_own(user.pk)
+        cache.set(key, own, CATALOG_TIMEOUT)
+    return Catalog(user.pk, _shared_part(shared_version), own)
+
+
+def visible_question_ids(user):
+    """Sorted list of the question IDs visible to user."""
+    return sorted(q.id for q in get_catalog(user).visible_questions())
+
+
+def question_of_the_day(user, date):
+    """
+    "Today's Topic": a visible question picked with a (user, date) seed, so the
+    pick is stable for the whole day and needs no query once the catalog is cached.
+    """
+    catalog = get_catalog(user)
+    ids = sorted(q.id for q in catalog.visible_questions())
+    if not ids:
+        return None
+    rng = random.Random(f'{user.pk}:{date.isoformat()}')
+    return catalog.questions_by_id[ids[rng.randrange(len(ids))]]
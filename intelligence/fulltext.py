@@ -0,0 +1,168 @@
+"""
+Full-text search over TimelineItem (SQLite FTS5).
+
+intelligence_timelineitem_fts is an external-content FTS5 table over the
+content, question_answer and question_text columns, kept in sync by triggers on
+intelligence_timelineitem (so bulk inserts and raw updates are covered too).
+The trigram tokenizer is used because Japanese text has no word boundaries;
+it needs at least 3 characters per term, so shorter terms are matched with icontains.
+Trigram needs SQLite 3.34+, so supported() probes for it rather than for FTS5
+alone; without it the table is never created and every term uses icontains.
+
+Note: SQLite migrations that rebuild intelligence_timelineitem drop its
+triggers. Run the rebuild_timeline_fts command after such a migration.
+"""
+import html
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'intelligence_timelineitem_fts'
+TOKENIZER = 'trigram'
+MIN_TERM_LENGTH = 3 # trigram tokenizer
+
+# Snippet markers (private use characters), replaced by <mark> after escaping
+_MARK_START = '\ue000'
+_MARK_END = '\ue001'
+
+CREATE_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content, question_answer, question_text,
+        content='intelligence_timelineitem', content_rowid='id', tokenize='{TOKENIZER}'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON intelligence_timelineitem BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content, question_answer, question_text)
+        VALUES (new.id, new.content, new.question_answer, new.question_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON intelligence_timelineitem BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, question_answer, question_text)
+        VALUES ('delete', old.id, old.content, old.question_answer, old.question_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content, question_answer, question_text ON intelligence_timelineitem BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, question_answer, question_text)
+        VALUES ('delete', old.id, old.content, old.question_answer, old.question_text);
+        INSERT INTO {FTS_TABLE}(rowid, content, question_answer, question_text)
+        VALUES (new.id, new.content, new.question_answer, new.question_text);
+    END""",
+]
+
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def supported(conn=connection):
+    """Whether conn can hold the index: SQLite with FTS5 and the trigram tokenizer, tried on a temp table."""
+    if conn.vendor != 'sqlite':
+        return False
+    try:
+        # Savepoint: a failed probe must not spoil the caller's transaction (migrations run in one)
+        with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+            cursor.execute(f"CREATE VIRTUAL TABLE temp.{FTS_TABLE}_probe USING fts5(x, tokenize='{TOKENIZER}')")
+            cursor.execute(f"DROP TABLE temp.{FTS_TABLE}_probe")
+    except DatabaseError:
+        return False
+    return True
+
+
+def install(conn=connection, rebuild=True):
+    """Create the FTS table and triggers (idempotent) and optionally re-index everything."""
+    if not supported(conn):
+        return False
+    with conn.cursor() as cursor:
+        for statement in CREATE_SQL:
+            cursor.execute(statement)
+        if rebuild:
+            cursor.execute(REBUILD_SQL)
+    return True
+
+
+def uninstall(conn=connection):
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for statement in DROP_SQL:
+            cursor.execute(statement)
+
+
+def is_installed():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _terms(query):
+    return [term for term in (query or '').split() if term]
+
+
+def _indexable(term):
+    return len(term) >= MIN_TERM_LENGTH
+
+
+def match_expression(query):
+    """
+    FTS5 MATCH string for the terms of `query` the index can answer (AND of
+    quoted phrases), or None if there are none or the index is not installed.
+    """
+    terms = [term for term in _terms(query) if _indexable(term)]
+    if not terms or not is_installed():
+        return None
+    return ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def search_filter(query, match):
+    """
+    Q matching TimelineItems containing every term of `query`: FTS5 for the
+    terms covered by `match`, icontains on the same columns for the rest
+    (short terms, non-SQLite databases).
+    """
+    condition = Q()
+    if match is not None:
+        condition &= Q(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]))
+
+    for term in _terms(query):
+        if match is not None and _indexable(term):
+            continue
+        condition &= (
+            Q(content__icontains=term) |
+            Q(question_answer__icontains=term) |
+            Q(question_text__icontains=term)
+        )
+    return condition
+
+
+def rank_expression(match):
+    """Relevance for ordering (higher is better)."""
+    return RawSQL(
+        f"(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = intelligence_timelineitem.id)",
+        [match]
+    )
+
+
+def _highlight(text):
+    escaped = html.escape(text or '')
+    return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def snippets(item_ids, match, tokens=12):
+    """{item_id: (rank, snippet_html)} for the given items; snippet HTML is escaped apart from <mark>."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(item_ids))
+    sql = (
+        f"SELECT rowid, -bm25({FTS_TABLE}), snippet({FTS_TABLE}, -1, %s, %s, %s, %s) "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_MARK_START, _MARK_END, '…', tokens, match, *item_ids])
+        return {row[0]: (row[1], _highlight(row[2])) for row in cursor.fetchall()}
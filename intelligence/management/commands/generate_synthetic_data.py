@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from intelligence.synthetic import SyntheticConfig, generate
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, targets, groups, anniversaries, questions, timeline items, tags and images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--targets', type=int, default=50, help='Targets per user')
+        parser.add_argument('--groups', type=int, default=5, help='Groups per user')
+        parser.add_argument('--anniversaries', type=int, default=1, help='Custom anniversaries per target')
+        parser.add_argument('--questions', type=int, default=30, help='Size of the shared question catalog')
+        parser.add_argument('--items', type=int, default=20, help='Timeline items per target')
+        parser.add_argument('--tags', type=int, default=20, help='Tags per user')
+        parser.add_argument('--image-ratio', type=float, default=0.1, help='Share of event items with an image')
+        parser.add_argument('--days', type=int, default=365, help='Spread items over the last N days')
+        parser.add_argument('--prefix', default='synthetic', help='Username prefix')
+        parser.add_argument('--start', type=int, default=0, help='First user number (to add users to an existing run)')
+        parser.add_argument('--role', default='AGENT', choices=['AGENT', 'ELITE_AGENT', 'MASTER'])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        config = SyntheticConfig(
+            users=options['users'], targets=options['targets'], groups=options['groups'],
+            anniversaries=options['anniversaries'], questions=options['questions'], items=options['items'],
+            tags=options['tags'], image_ratio=options['image_ratio'], days=options['days'],
+            prefix=options['prefix'], role=options['role'], seed=options['seed'],
+        )
+        users = generate(config, start_index=options['start'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users with {config.targets} targets and {config.targets * config.items} items each '
+            f'({", ".join(u.username for u in users)}).'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from intelligence.answers import rebuild_answer_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the current answer per target and question and the per-category answered counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_answer_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} current answers.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from intelligence.stats import rebuild_all_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every TargetStats row from the timeline (log count, points, latest message, last contact).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_all_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {count} targets.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from intelligence import fulltext
+
+
+class Command(BaseCommand):
+    help = 'Recreate the SQLite FTS5 timeline search table and its triggers, then re-index every TimelineItem.'
+
+    def handle(self, *args, **options):
+        if not fulltext.install(rebuild=True):
+            self.stdout.write(self.style.WARNING('Full-text search needs SQLite 3.34+ with FTS5 (trigram tokenizer); timeline search falls back to icontains.'))
+            return
+        self.stdout.write(self.style.SUCCESS('Timeline full-text index rebuilt.'))
@@ -0,0 +1,182 @@
+import datetime
+import json
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+
+from intelligence.synthetic import SyntheticConfig, generate
+
+
+def _endpoints(target, today):
+    """(name, method, path, payload) for every benchmarked endpoint."""
+    return [
+        ('dashboard', 'get', '/dashboard/', None),
+        ('target_list', 'get', '/targets/', None),
+        ('target_detail', 'get', f'/targets/detail/?target_id={target.pk}', None),
+        ('dossier_profile', 'get', f'/targets/{target.pk}/dossier/profile/', None),
+        ('dossier_qa', 'get', f'/targets/{target.pk}/dossier/qa/', None),
+        ('dossier_events', 'get', f'/targets/{target.pk}/dossier/events/', None),
+        ('dossier_tags', 'get', f'/targets/{target.pk}/dossier/tags/', None),
+        ('intelligence_log', 'get', '/', None),
+        ('candidates', 'get', '/api/candidates/', None),
+        ('candidates_search', 'get', '/api/candidates/?q=たなか', None),
+        ('intelligence_log_post', 'post', '/intelligence/log/', {
+            'target_id': str(target.pk), 'date': today.isoformat(), 'event_type': 'NOTE',
+            'description': 'benchmark #bench',
+        }),
+        ('intelligence_log_batch', 'post', '/intelligence/log/batch/', {'operations': [
+            {'target_id': str(target.pk), 'date': today.isoformat(), 'description': f'benchmark {i} #bench'}
+            for i in range(5)
+        ]}),
+        ('timeline_api', 'get', '/api/timeline/', None),
+        ('timeline_api_target', 'get', f'/api/timeline/?target_id={target.pk}', None),
+        ('timeline_api_search', 'get', '/api/timeline/?search=カフェで近況', None),
+        ('timeline_api_grouped', 'get', '/api/timeline/?limit=10&group_by_target=true', None),
+        ('timeline_stream', 'get', '/api/timeline/stream/', None),
+        ('calendar', 'get', '/calendar/', None),
+        ('target_export_csv', 'get', f'/targets/{target.pk}/export_csv/', None),
+    ]
+
+
+# Endpoints restricted to MASTER users (run as the synthetic catalog owner)
+MASTER_ENDPOINTS = [
+    ('question_export', 'get', '/questions/export/', None),
+]
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the main pages and APIs against synthetic data at several scales '
+        '(in a throwaway test database) and write a JSON report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='10,100,1000', help='Comma-separated targets per user')
+        parser.add_argument('--items', type=int, default=20, help='Timeline items per target')
+        parser.add_argument('--repeat', type=int, default=5, help='Warm runs per endpoint')
+        parser.add_argument('--only', default='', help='Comma-separated endpoint names to run')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark.json')
+
+    def handle(self, *args, **options):
+        from core.testing import reset_caches
+
+        scales = [int(s) for s in options['scales'].split(',') if s.strip()]
+        only = {s.strip() for s in options['only'].split(',') if s.strip()}
+        repeat = max(1, options['repeat'])
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Synthetic images and uploads go to a throwaway MEDIA_ROOT, like the data to a throwaway database.
+        # Every request is served by this process, so the version-keyed caches are measured too.
+        media_root = tempfile.mkdtemp(prefix='dossier-bench-media-')
+        media = override_settings(MEDIA_ROOT=media_root, DOSSIER_SINGLE_PROCESS=True)
+        media.enable()
+        try:
+            results = []
+            for index, scale in enumerate(scales):
+                # ELITE_AGENT can use the CSV export
+                config = SyntheticConfig(
+                    targets=scale, items=options['items'], prefix='bench', role='ELITE_AGENT', seed=options['seed'],
+                )
+                started = time.perf_counter()
+                user = generate(config, start_index=index)[0]
+                self.stdout.write(f'{scale} targets: data generated in {time.perf_counter() - started:.1f}s')
+
+                client = Client()
+                client.force_login(user)
+                master_client = Client()
+                master_client.force_login(get_user_model().objects.get(username='bench_master'))
+                target = user.target_set.order_by('nickname').first()
+                endpoints = [(client, *e) for e in _endpoints(target, datetime.date.today())]
+                endpoints += [(master_client, *e) for e in MASTER_ENDPOINTS]
+                for client_, name, method, path, payload in endpoints:
+                    if only and name not in only:
+                        continue
+                    result = self._measure(client_, method, path, payload, repeat, reset_caches)
+                    result.update({'scale': scale, 'endpoint': name, 'path': path})
+                    results.append(result)
+                    self.stdout.write(
+                        f'  {name:<22} cold {result["cold_ms"]:8.1f}ms  warm {result["median_ms"]:8.1f}ms  '
+                        f'{result["queries"]:4d} queries  [{result["status"]}]'
+                    )
+        finally:
+            media.disable()
+            shutil.rmtree(media_root, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'git_revision': _git_revision(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'database': connection.vendor,
+                'items_per_target': options['items'],
+                'repeat': repeat,
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+
+    def _request(self, client, method, path, payload):
+        if method == 'post':
+            response = client.post(path, json.dumps(payload), content_type='application/json')
+        else:
+            response = client.get(path)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        return response
+
+    def _measure(self, client, method, path, payload, repeat, reset_caches):
+        # Cold: empty caches (catalog, read models, stats snapshots)
+        reset_caches()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = self._request(client, method, path, payload)
+            cold_ms = (time.perf_counter() - started) * 1000
+        cold_queries = len(ctx.captured_queries)
+
+        timings, queries = [], 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = self._request(client, method, path, payload)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = len(ctx.captured_queries)
+
+        return {
+            'method': method.upper(),
+            'status': response.status_code,
+            'cold_ms': round(cold_ms, 2),
+            'cold_queries': cold_queries,
+            'median_ms': round(statistics.median(timings), 2),
+            'min_ms': round(min(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': queries,
+        }
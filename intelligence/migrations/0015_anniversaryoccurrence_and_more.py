@@ -0,0 +1,67 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_occurrences(apps, schema_editor):
+    import datetime
+    Target = apps.get_model('intelligence', 'Target')
+    CustomAnniversary = apps.get_model('intelligence', 'CustomAnniversary')
+    AnniversaryOccurrence = apps.get_model('intelligence', 'AnniversaryOccurrence')
+
+    def day_key(month, day):
+        try:
+            return datetime.date(2000, int(month), int(day)).timetuple().tm_yday
+        except (TypeError, ValueError):
+            return None
+
+    rows = []
+    for t in Target.objects.exclude(birth_month=None).exclude(birth_day=None).iterator():
+        key = day_key(t.birth_month, t.birth_day)
+        if key is None: continue
+        rows.append(AnniversaryOccurrence(
+            user_id=t.user_id, target_id=t.id, kind='birthday', label='誕生日',
+            month=t.birth_month, day=t.birth_day, day_key=key, origin_year=t.birth_year
+        ))
+    for ca in CustomAnniversary.objects.select_related('target').iterator():
+        rows.append(AnniversaryOccurrence(
+            user_id=ca.target.user_id, target_id=ca.target_id, anniversary_id=ca.id, kind='custom', label=ca.label,
+            month=ca.date.month, day=ca.date.day, day_key=day_key(ca.date.month, ca.date.day), origin_year=ca.date.year
+        ))
+    AnniversaryOccurrence.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0014_questioncategory_is_shared_questioncategory_order'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnniversaryOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('birthday', 'Birthday'), ('custom', 'Custom')], max_length=20)),
+                ('label', models.CharField(max_length=100)),
+                ('month', models.PositiveSmallIntegerField()),
+                ('day', models.PositiveSmallIntegerField()),
+                ('day_key', models.PositiveSmallIntegerField()),
+                ('origin_year', models.IntegerField(blank=True, null=True)),
+                ('anniversary', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='intelligence.customanniversary')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='intelligence.target')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day_key'], name='anniv_occ_user_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='anniversaryoccurrence',
+            constraint=models.UniqueConstraint(condition=models.Q(('kind', 'birthday')), fields=('target',), name='unique_target_birthday_occurrence'),
+        ),
+        migrations.RunPython(backfill_occurrences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_stats(apps, schema_editor):
+    from django.db.models import Q, Count, Sum, Max, OuterRef, Subquery
+    Target = apps.get_model('intelligence', 'Target')
+    TimelineItem = apps.get_model('intelligence', 'TimelineItem')
+    TargetStats = apps.get_model('intelligence', 'TargetStats')
+
+    aggregates = {}
+    for row in TimelineItem.objects.order_by().values('target_id').annotate(
+        log_count=Count('id'),
+        contact_count=Count('id', filter=Q(contact_made=True)),
+        total_points=Sum('question__rank__points', filter=Q(type='Question')),
+        answered_question_count=Count('question', filter=Q(type='Question'), distinct=True),
+        real_last_contact=Max('date', filter=Q(contact_made=True)),
+    ):
+        aggregates[row['target_id']] = row
+
+    latest = TimelineItem.objects.filter(target=OuterRef('pk')).order_by('-date', '-created_at')
+    rows = []
+    for t in Target.objects.annotate(
+        latest_message=Subquery(latest.values('content')[:1]),
+        latest_item_date=Subquery(latest.values('date')[:1]),
+        latest_item_created_at=Subquery(latest.values('created_at')[:1]),
+    ).values('pk', 'latest_message', 'latest_item_date', 'latest_item_created_at').iterator():
+        agg = aggregates.get(t['pk'], {})
+        rows.append(TargetStats(
+            target_id=t['pk'],
+            log_count=agg.get('log_count', 0),
+            contact_count=agg.get('contact_count', 0),
+            total_points=agg.get('total_points') or 0,
+            answered_question_count=agg.get('answered_question_count', 0),
+            real_last_contact=agg.get('real_last_contact'),
+            latest_message=t['latest_message'] or '',
+            latest_item_date=t['latest_item_date'],
+            latest_item_created_at=t['latest_item_created_at'],
+        ))
+    TargetStats.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0015_anniversaryoccurrence_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetStats',
+            fields=[
+                ('target', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='intelligence.target')),
+                ('log_count', models.PositiveIntegerField(default=0)),
+                ('contact_count', models.PositiveIntegerField(default=0)),
+                ('total_points', models.IntegerField(default=0)),
+                ('answered_question_count', models.PositiveIntegerField(default=0)),
+                ('latest_message', models.TextField(blank=True, default='')),
+                ('latest_item_date', models.DateField(blank=True, null=True)),
+                ('latest_item_created_at', models.DateTimeField(blank=True, null=True)),
+                ('real_last_contact', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
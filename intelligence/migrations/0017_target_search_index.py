@@ -0,0 +1,94 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:35
+
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copies of intelligence.search as of this migration: later changes to that module must not change it
+
+# Katakana (ァ..ヶ, ヽ, ヾ) -> Hiragana
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+KATAKANA_TO_HIRAGANA.update({0x30FD: 0x309D, 0x30FE: 0x309E})
+
+
+def normalize(value):
+    value = unicodedata.normalize('NFKC', value or '')
+    value = value.translate(KATAKANA_TO_HIRAGANA).casefold()
+    return ''.join(value.split())
+
+
+def index_text(target):
+    lines = []
+    for value in [
+        target.nickname,
+        f"{target.last_name}{target.first_name}",
+        f"{target.last_name_kana}{target.first_name_kana}",
+    ]:
+        value = normalize(value)
+        if value and value not in lines:
+            lines.append(value)
+    return '\n'.join(lines)
+
+
+def text_grams(text):
+    grams = set()
+    for line in text.split('\n'):
+        grams.update(line)
+        grams.update(line[i:i + 2] for i in range(len(line) - 1))
+    return grams
+
+
+def backfill_search_index(apps, schema_editor):
+    Target = apps.get_model('intelligence', 'Target')
+    TargetSearchIndex = apps.get_model('intelligence', 'TargetSearchIndex')
+    TargetSearchGram = apps.get_model('intelligence', 'TargetSearchGram')
+
+    indexes, grams = [], []
+    for target in Target.objects.iterator():
+        text = index_text(target)
+        indexes.append(TargetSearchIndex(target_id=target.pk, user_id=target.user_id, text=text))
+        grams.extend(
+            TargetSearchGram(user_id=target.user_id, target_id=target.pk, gram=gram)
+            for gram in text_grams(text)
+        )
+    TargetSearchIndex.objects.bulk_create(indexes, batch_size=500)
+    TargetSearchGram.objects.bulk_create(grams, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0016_targetstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetSearchIndex',
+            fields=[
+                ('target', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='intelligence.target')),
+                ('text', models.TextField(blank=True, default='')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TargetSearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=2)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_grams', to='intelligence.target')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'gram', 'target'], name='target_gram_user_gram_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='targetsearchgram',
+            constraint=models.UniqueConstraint(fields=('target', 'gram'), name='unique_target_search_gram'),
+        ),
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.0.7 on 2026-10-17 21:04
+
+from django.db import DatabaseError, migrations, transaction
+
+# Frozen copy of intelligence.fulltext as of this migration: later changes to that module must not change it
+
+FTS_TABLE = 'intelligence_timelineitem_fts'
+
+CREATE_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content, question_answer, question_text,
+        content='intelligence_timelineitem', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON intelligence_timelineitem BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content, question_answer, question_text)
+        VALUES (new.id, new.content, new.question_answer, new.question_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON intelligence_timelineitem BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, question_answer, question_text)
+        VALUES ('delete', old.id, old.content, old.question_answer, old.question_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content, question_answer, question_text ON intelligence_timelineitem BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, question_answer, question_text)
+        VALUES ('delete', old.id, old.content, old.question_answer, old.question_text);
+        INSERT INTO {FTS_TABLE}(rowid, content, question_answer, question_text)
+        VALUES (new.id, new.content, new.question_answer, new.question_text);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def trigram_supported(connection):
+    # FTS5 alone is not enough: the trigram tokenizer needs SQLite 3.34+
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"CREATE VIRTUAL TABLE temp.{FTS_TABLE}_probe USING fts5(x, tokenize='trigram')")
+            cursor.execute(f"DROP TABLE temp.{FTS_TABLE}_probe")
+    except DatabaseError:
+        return False
+    return True
+
+
+def create_fts(apps, schema_editor):
+    # Without trigram support timeline search stays on icontains (intelligence.fulltext)
+    if not trigram_supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in CREATE_SQL:
+            cursor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_SQL:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0017_target_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
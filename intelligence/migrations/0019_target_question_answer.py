@@ -0,0 +1,78 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+
+def backfill_answer_index(apps, schema_editor):
+    # Frozen copy of intelligence.answers.build_answer_index as of this migration
+    TimelineItem = apps.get_model('intelligence', 'TimelineItem')
+    TargetQuestionAnswer = apps.get_model('intelligence', 'TargetQuestionAnswer')
+    TargetCategoryProgress = apps.get_model('intelligence', 'TargetCategoryProgress')
+
+    # The latest answer (date, created_at, id) of every (target, question), with the answer count
+    partition = [F('target_id'), F('question_id')]
+    answers = TimelineItem.objects.filter(type='Question', question__isnull=False).annotate(
+        answer_rank=Window(RowNumber(), partition_by=partition, order_by=[F('date').desc(), F('created_at').desc(), F('id').desc()]),
+        total=Window(Count('id'), partition_by=partition),
+    ).filter(answer_rank=1).values('pk', 'target_id', 'question_id', 'question__category_id', 'date', 'total')
+
+    pointers, counts = [], {}
+    for row in answers.iterator():
+        key = (row['target_id'], row['question__category_id'])
+        counts[key] = counts.get(key, 0) + 1
+        pointers.append(TargetQuestionAnswer(
+            target_id=row['target_id'], question_id=row['question_id'], category_id=row['question__category_id'],
+            item_id=row['pk'], date=row['date'], answer_count=row['total'],
+        ))
+    TargetQuestionAnswer.objects.bulk_create(pointers, batch_size=500)
+    TargetCategoryProgress.objects.bulk_create([
+        TargetCategoryProgress(target_id=target_id, category_id=category_id, answered_count=count)
+        for (target_id, category_id), count in counts.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0018_timelineitem_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetCategoryProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answered_count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='intelligence.questioncategory')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_progress', to='intelligence.target')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TargetQuestionAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('answer_count', models.PositiveIntegerField(default=1)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='intelligence.questioncategory')),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='intelligence.timelineitem')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='intelligence.question')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_answers', to='intelligence.target')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='targetcategoryprogress',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('target', 'category'), name='unique_target_category_progress'),
+        ),
+        migrations.AddConstraint(
+            model_name='targetcategoryprogress',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('target',), name='unique_target_uncategorized_progress'),
+        ),
+        migrations.AddConstraint(
+            model_name='targetquestionanswer',
+            constraint=models.UniqueConstraint(fields=('target', 'question'), name='unique_target_question_answer'),
+        ),
+        migrations.RunPython(backfill_answer_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, IntegerField, Value, When
+
+WEEKDAY_FIELDS = ['is_mon', 'is_tue', 'is_wed', 'is_thu', 'is_fri', 'is_sat', 'is_sun']
+
+
+def backfill_weekday_mask(apps, schema_editor):
+    TargetGroup = apps.get_model('intelligence', 'TargetGroup')
+    mask = Value(0)
+    for weekday, field in enumerate(WEEKDAY_FIELDS):
+        mask = mask + Case(When(**{field: True}, then=Value(1 << weekday)), default=Value(0), output_field=IntegerField())
+    TargetGroup.objects.update(weekday_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0020_daily_roster'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='targetgroup',
+            name='weekday_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='targetgroup',
+            index=models.Index(fields=['user', 'weekday_mask'], name='group_user_weekday_mask_idx'),
+        ),
+        migrations.RunPython(backfill_weekday_mask, migrations.RunPython.noop),
+    ]
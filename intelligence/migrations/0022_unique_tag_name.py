@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """Keep the oldest tag of each (user, name) and move the links of the others onto it."""
+    Tag = apps.get_model('intelligence', 'Tag')
+    ItemTag = apps.get_model('intelligence', 'TimelineItem').tags.through
+
+    duplicates = Tag.objects.values('user_id', 'name').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    for row in duplicates:
+        extra_ids = list(Tag.objects.filter(user_id=row['user_id'], name=row['name']).exclude(pk=row['keep']).values_list('pk', flat=True))
+        linked = set(ItemTag.objects.filter(tag_id=row['keep']).values_list('timelineitem_id', flat=True))
+        moved = set(ItemTag.objects.filter(tag_id__in=extra_ids).values_list('timelineitem_id', flat=True)) - linked
+        ItemTag.objects.bulk_create([ItemTag(timelineitem_id=item_id, tag_id=row['keep']) for item_id in moved])
+        ItemTag.objects.filter(tag_id__in=extra_ids).delete()
+        Tag.objects.filter(pk__in=extra_ids).delete()
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0021_target_group_weekday_mask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_user_tag_name'),
+        ),
+    ]
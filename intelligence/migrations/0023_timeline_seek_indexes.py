@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intelligence', '0022_unique_tag_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timelineitem',
+            index=models.Index(fields=['target', '-date', '-created_at', '-id'], name='timeline_target_seek_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineitem',
+            index=models.Index(fields=['-date', '-created_at', '-id'], name='timeline_seek_idx'),
+        ),
+    ]
@@ -7,6 +7,11 @@ class Tag(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1)
     name = models.CharField(max_length=50)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='unique_user_tag_name')
+        ]
+
     def __str__(self):
         return self.name
 
@@ -22,11 +27,30 @@ class TargetGroup(models.Model):
     is_fri = models.BooleanField(default=False, verbose_name="金")
     is_sat = models.BooleanField(default=False, verbose_name="土")
     is_sun = models.BooleanField(default=False, verbose_name="日")
+    # Bit n set = contact on weekday n (Monday = bit 0), kept in sync with the is_* flags on save
+    weekday_mask = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    WEEKDAY_FIELDS = ['is_mon', 'is_tue', 'is_wed', 'is_thu', 'is_fri', 'is_sat', 'is_sun']
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'weekday_mask'], name='group_user_weekday_mask_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def compute_weekday_mask(self):
+        return sum(1 << weekday for weekday, field in enumerate(self.WEEKDAY_FIELDS) if getattr(self, field))
+
+    def save(self, *args, **kwargs):
+        self.weekday_mask = self.compute_weekday_mask()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(self.WEEKDAY_FIELDS):
+            kwargs['update_fields'] = {*update_fields, 'weekday_mask'}
+        super().save(*args, **kwargs)
+
 class Target(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1)
@@ -116,6 +140,36 @@ class CustomAnniversary(models.Model):
     def __str__(self):
         return f"{self.label} ({self.date})"
 
+class AnniversaryOccurrence(models.Model):
+    # Materialized index of birthdays & custom anniversaries (see intelligence/anniversaries.py)
+    BIRTHDAY = 'birthday'
+    CUSTOM = 'custom'
+    KIND_CHOICES = [
+        (BIRTHDAY, 'Birthday'),
+        (CUSTOM, 'Custom'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    target = models.ForeignKey(Target, on_delete=models.CASCADE)
+    anniversary = models.OneToOneField(CustomAnniversary, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    label = models.CharField(max_length=100)
+    month = models.PositiveSmallIntegerField()
+    day = models.PositiveSmallIntegerField()
+    day_key = models.PositiveSmallIntegerField() # Day-of-year in a leap year (Feb 29 = 60)
+    origin_year = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'day_key'], name='anniv_occ_user_day_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['target'], condition=models.Q(kind='birthday'), name='unique_target_birthday_occurrence')
+        ]
+
+    def __str__(self):
+        return f"{self.target} - {self.label} ({self.month}/{self.day})"
+
 class TimelineItem(models.Model):
     TYPE_CHOICES = [
         ('Contact', 'Contact'),
@@ -147,9 +201,107 @@ class TimelineItem(models.Model):
     question_answer = models.TextField(blank=True, default='')
     question = models.ForeignKey('Question', on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Timeline keyset: newest first by (date, created_at, id), per target and overall
+            models.Index(fields=['target', '-date', '-created_at', '-id'], name='timeline_target_seek_idx'),
+            models.Index(fields=['-date', '-created_at', '-id'], name='timeline_seek_idx'),
+        ]
+
     def __str__(self):
         return f"{self.target} - {self.type} ({self.date.strftime('%Y-%m-%d')})"
 
+class TargetStats(models.Model):
+    # Denormalized per-target aggregates (maintained by intelligence/stats.py)
+    target = models.OneToOneField(Target, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    log_count = models.PositiveIntegerField(default=0)
+    contact_count = models.PositiveIntegerField(default=0)
+    total_points = models.IntegerField(default=0)
+    answered_question_count = models.PositiveIntegerField(default=0)
+
+    # Latest item by (date, created_at)
+    latest_message = models.TextField(blank=True, default='')
+    latest_item_date = models.DateField(null=True, blank=True)
+    latest_item_created_at = models.DateTimeField(null=True, blank=True)
+
+    real_last_contact = models.DateField(null=True, blank=True) # Max(date) of contact_made items
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.target}"
+
+class TargetQuestionAnswer(models.Model):
+    # Current (latest) answer per target and question (maintained by intelligence/answers.py)
+    target = models.ForeignKey(Target, on_delete=models.CASCADE, related_name='current_answers')
+    question = models.ForeignKey('Question', on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey('QuestionCategory', on_delete=models.SET_NULL, null=True, blank=True, related_name='+') # question.category
+    item = models.ForeignKey(TimelineItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='+') # NULL only while the item is being deleted
+    date = models.DateField()
+    answer_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['target', 'question'], name='unique_target_question_answer')
+        ]
+
+    def __str__(self):
+        return f"{self.target}: {self.question_id} ({self.date})"
+
+class TargetCategoryProgress(models.Model):
+    # Answered questions per target and category (NULL = uncategorized), derived from TargetQuestionAnswer
+    target = models.ForeignKey(Target, on_delete=models.CASCADE, related_name='category_progress')
+    category = models.ForeignKey('QuestionCategory', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    answered_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['target', 'category'], condition=models.Q(category__isnull=False), name='unique_target_category_progress'),
+            models.UniqueConstraint(fields=['target'], condition=models.Q(category__isnull=True), name='unique_target_uncategorized_progress'),
+        ]
+
+    def __str__(self):
+        return f"{self.target} - {self.category_id}: {self.answered_count}"
+
+class TargetSearchIndex(models.Model):
+    # Normalized name fields of a target, one per line (maintained by intelligence/search.py)
+    target = models.OneToOneField(Target, on_delete=models.CASCADE, primary_key=True, related_name='search_index')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    text = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Search index for {self.target}"
+
+class TargetSearchGram(models.Model):
+    # Distinct 1- and 2-character grams of TargetSearchIndex.text
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    target = models.ForeignKey(Target, on_delete=models.CASCADE, related_name='search_grams')
+    gram = models.CharField(max_length=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'gram', 'target'], name='target_gram_user_gram_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['target', 'gram'], name='unique_target_search_gram')
+        ]
+
+    def __str__(self):
+        return f"{self.target}: {self.gram}"
+
+class DailyRoster(models.Model):
+    # Materialized daily list of a user (computed lazily and invalidated by intelligence/roster.py)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    date = models.DateField()
+    entries = models.JSONField(default=dict) # {target_id: {'sources': [...], 'anniv_label': str}}
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_user_daily_roster')
+        ]
+
+    def __str__(self):
+        return f"Roster of {self.user_id} on {self.date}"
+
 class TimelineImage(models.Model):
     item = models.ForeignKey(TimelineItem, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='timeline_images/')
@@ -0,0 +1,166 @@
+"""
+Daily roster store.
+
+The daily list of a user combines group membership (TargetGroup.weekday_mask),
+anniversaries falling on the date (AnniversaryOccurrence) and manual
+DailyTargetState additions, minus the targets hidden that day. DailyRoster
+keeps the result per (user, date): roster_between() computes the dates of a
+range that are not stored yet in one batch (a fixed number of queries however
+long the range) and stores them.
+
+The receivers in intelligence.signals delete only the dates a change can
+affect: the user's dates on the changed weekdays (group flags, memberships),
+on the month/day of a birthday or custom anniversary, the single date of a
+DailyTargetState, and the dates listing a deleted target.
+"""
+import datetime
+import uuid
+
+from django.db.models import F, Q
+
+from .anniversaries import occurrences_between
+from .models import DailyRoster, DailyTargetState, Target
+
+ALL_WEEKDAYS = 0b1111111
+
+
+def _dates(start, end):
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def weekday_bits(start, end):
+    """TargetGroup.weekday_mask bits of the weekdays between start and end."""
+    if (end - start).days >= 6:
+        return ALL_WEEKDAYS
+    return sum({1 << date.weekday() for date in _dates(start, end)})
+
+
+def mask_weekdays(mask):
+    """Weekdays (0 = Monday) set in a weekday mask."""
+    return {weekday for weekday in range(7) if mask >> weekday & 1}
+
+
+def group_schedule(user, start, end):
+    """
+    [{target_id: None}, ...] indexed by weekday: members of the user's groups
+    scheduled on that weekday, for the weekdays between start and end
+    (one query, bitwise test on the (user, weekday_mask) index).
+    """
+    bits = weekday_bits(start, end)
+    by_weekday = [{} for _ in range(7)] # Ordered sets of target ids
+    memberships = Target.groups.through.objects.filter(
+        targetgroup__user=user, target__user=user,
+    ).annotate(
+        scheduled=F('targetgroup__weekday_mask').bitand(bits)
+    ).filter(scheduled__gt=0).values_list('target_id', 'scheduled')
+    for target_id, scheduled in memberships:
+        for weekday in mask_weekdays(scheduled):
+            by_weekday[weekday][target_id] = None
+    return by_weekday
+
+
+def _add(entries, target_id, source):
+    entry = entries.setdefault(str(target_id), {'sources': []})
+    if source not in entry['sources']:
+        entry['sources'].append(source)
+    return entry
+
+
+def _compute(user, start, end):
+    """{date: entries} for every date between start and end (3 queries)."""
+    by_weekday = group_schedule(user, start, end)
+
+    anniversaries = {}
+    for occ in occurrences_between(user, start, end, select_target=False):
+        anniversaries.setdefault(occ.date, []).append(occ)
+
+    manual, hidden = {}, {}
+    states = DailyTargetState.objects.filter(target__user=user, date__range=(start, end)).filter(
+        Q(is_manual_add=True) | Q(is_hidden=True)
+    ).values_list('date', 'target_id', 'is_manual_add', 'is_hidden')
+    for date, target_id, is_manual_add, is_hidden in states:
+        if is_manual_add:
+            manual.setdefault(date, []).append(target_id)
+        if is_hidden:
+            hidden.setdefault(date, set()).add(str(target_id))
+
+    rosters = {}
+    for date in _dates(start, end):
+        entries = {}
+        for target_id in by_weekday[date.weekday()]:
+            _add(entries, target_id, 'group')
+        for occ in anniversaries.get(date, ()):
+            _add(entries, occ.target_id, 'anniversary')['anniv_label'] = occ.label
+        for target_id in manual.get(date, ()):
+            _add(entries, target_id, 'manual')
+        rosters[date] = {key: entry for key, entry in entries.items() if key not in hidden.get(date, ())}
+    return rosters
+
+
+def _decode(entries):
+    return {
+        uuid.UUID(key): dict(entry, sources=set(entry['sources']))
+        for key, entry in entries.items()
+    }
+
+
+def roster_between(user, start, end):
+    """
+    {date: {target_id: {'sources': set, 'anniv_label': str}}} for every date
+    between start and end. Sources are 'group', 'anniversary' and 'manual';
+    anniv_label is only set for anniversaries. Missing dates are computed and stored.
+    """
+    stored = {
+        row.date: row.entries
+        for row in DailyRoster.objects.filter(user=user, date__range=(start, end))
+    }
+    missing = [date for date in _dates(start, end) if date not in stored]
+    if missing:
+        computed = _compute(user, missing[0], missing[-1])
+        DailyRoster.objects.bulk_create([
+            DailyRoster(user=user, date=date, entries=computed[date]) for date in missing
+        ], ignore_conflicts=True)
+        stored.update((date, computed[date]) for date in missing)
+    return {date: _decode(stored[date]) for date in _dates(start, end)}
+
+
+def roster_on(user, date):
+    return roster_between(user, date, date)[date]
+
+
+# --- Invalidation (called from intelligence.signals) ---
+
+def member_user_ids(group_ids):
+    return set(Target.objects.filter(groups__in=group_ids).values_list('user_id', flat=True).distinct())
+
+
+def invalidate_weekdays(user_ids, weekdays):
+    if not user_ids or not weekdays: return
+    # __week_day counts from Sunday = 1
+    DailyRoster.objects.filter(
+        user_id__in=user_ids, date__week_day__in=[(weekday + 1) % 7 + 1 for weekday in weekdays]
+    ).delete()
+
+
+def invalidate_day(user_id, month, day):
+    """Every stored date of user_id on month/day (Feb 29 is observed on Mar 1 in non-leap years)."""
+    condition = Q(date__month=month, date__day=day)
+    if (month, day) == (2, 29):
+        condition |= Q(date__month=3, date__day=1)
+    DailyRoster.objects.filter(condition, user_id=user_id).delete()
+
+
+def invalidate_date(user_id, date):
+    DailyRoster.objects.filter(user_id=user_id, date=date).delete()
+
+
+def invalidate_target(target):
+    DailyRoster.objects.filter(user_id=target.user_id, entries__has_key=str(target.pk)).delete()
+
+
+def clear(user_ids=None):
+    """Drop every stored roster, or those of user_ids (after bulk writes, which bypass signals)."""
+    rosters = DailyRoster.objects.all()
+    if user_ids is not None:
+        rosters = rosters.filter(user_id__in=user_ids)
+    rosters.delete()
@@ -0,0 +1,132 @@
+"""
+Target name search index.
+
+Names are normalized before indexing and searching: NFKC folds full/half-width
+variants, katakana is folded to hiragana, case is folded and whitespace removed.
+So "ﾔﾏﾀﾞ", "ヤマダ" and "やまだ" all find the same target.
+
+TargetSearchIndex keeps the normalized name fields of a target (one per line)
+and TargetSearchGram their distinct 1- and 2-character grams, indexed by
+(user, gram). A search narrows the candidates through the gram index and then
+confirms the contiguous match on the short normalized text, without scanning
+the Target table.
+"""
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Target, TargetSearchIndex, TargetSearchGram
+
+# Katakana (ァ..ヶ, ヽ, ヾ) -> Hiragana
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+_KATAKANA_TO_HIRAGANA.update({0x30FD: 0x309D, 0x30FE: 0x309E})
+
+
+def normalize(value):
+    value = unicodedata.normalize('NFKC', value or '')
+    value = value.translate(_KATAKANA_TO_HIRAGANA).casefold()
+    return ''.join(value.split())
+
+
+def index_text(target):
+    """Normalized name fields of target, one per line."""
+    fields = [
+        target.nickname,
+        f"{target.last_name}{target.first_name}",
+        f"{target.last_name_kana}{target.first_name_kana}",
+    ]
+    lines = []
+    for value in fields:
+        value = normalize(value)
+        if value and value not in lines:
+            lines.append(value)
+    return '\n'.join(lines)
+
+
+def text_grams(text):
+    grams = set()
+    for line in text.split('\n'):
+        grams.update(line)
+        grams.update(line[i:i + 2] for i in range(len(line) - 1))
+    return grams
+
+
+def _query_grams(needle):
+    if len(needle) == 1:
+        return {needle}
+    return {needle[i:i + 2] for i in range(len(needle) - 1)}
+
+
+def matching_target_ids(user, query, prefix=False):
+    """
+    Subquery of target ids whose names contain `query` (normalized), or None
+    if the query is blank after normalization. With prefix=True a name must
+    start with it.
+    """
+    needle = normalize(query)
+    if not needle:
+        return None
+
+    grams = _query_grams(needle)
+    candidates = TargetSearchGram.objects.filter(user=user, gram__in=grams).values('target_id').annotate(
+        matched=Count('gram')
+    ).filter(matched=len(grams)).values('target_id')
+    # Grams only prove the characters are there; confirm they are contiguous
+    if prefix:
+        # One name per line: match at the start of the text or of a line
+        confirm = Q(text__startswith=needle) | Q(text__contains='\n' + needle)
+    else:
+        confirm = Q(text__contains=needle)
+    return TargetSearchIndex.objects.filter(confirm, target_id__in=candidates).values('target_id')
+
+
+# --- Maintenance (called from intelligence.signals) ---
+
+def index_target(target):
+    text = index_text(target)
+    current = TargetSearchIndex.objects.filter(target_id=target.pk).values_list('user_id', 'text').first()
+    if current == (target.user_id, text):
+        return
+
+    with transaction.atomic():
+        TargetSearchIndex.objects.update_or_create(target_id=target.pk, defaults={'user_id': target.user_id, 'text': text})
+        wanted = text_grams(text)
+        existing = TargetSearchGram.objects.filter(target_id=target.pk)
+        if current is not None and current[0] != target.user_id:
+            existing.delete()
+            have = set()
+        else:
+            have = set(existing.values_list('gram', flat=True))
+        if have - wanted:
+            existing.filter(gram__in=have - wanted).delete()
+        TargetSearchGram.objects.bulk_create([
+            TargetSearchGram(user_id=target.user_id, target_id=target.pk, gram=gram)
+            for gram in wanted - have
+        ])
+
+
+def rebuild_search_index(batch_size=500, user_ids=None):
+    """Rebuild the name index (only for the targets of user_ids if given). Returns the number of targets indexed."""
+    targets, index_rows, gram_rows = Target.objects.all(), TargetSearchIndex.objects.all(), TargetSearchGram.objects.all()
+    if user_ids is not None:
+        targets = targets.filter(user_id__in=user_ids)
+        index_rows = index_rows.filter(user_id__in=user_ids)
+        gram_rows = gram_rows.filter(user_id__in=user_ids)
+    indexes, grams = [], []
+    for target in targets.only(
+        'pk', 'user_id', 'nickname', 'first_name', 'last_name', 'first_name_kana', 'last_name_kana'
+    ).iterator():
+        text = index_text(target)
+        indexes.append(TargetSearchIndex(target_id=target.pk, user_id=target.user_id, text=text))
+        grams.extend(
+            TargetSearchGram(user_id=target.user_id, target_id=target.pk, gram=gram)
+            for gram in text_grams(text)
+        )
+
+    with transaction.atomic():
+        gram_rows.delete()
+        index_rows.delete()
+        TargetSearchIndex.objects.bulk_create(indexes, batch_size=batch_size)
+        TargetSearchGram.objects.bulk_create(grams, batch_size=batch_size)
+    return len(indexes)
@@ -0,0 +1,355 @@
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Target, CustomAnniversary, TimelineItem, TimelineImage, Tag, TargetGroup, Question, QuestionCategory, QuestionRank, TargetStats, TargetCategoryProgress, AnniversaryOccurrence, DailyTargetState
+from . import anniversaries, answers, roster, search, stats
+from .catalog import MASTER_ROLE
+from .versions import bump_user_version, bump_target_version, bump_shared_version, bump_catalog_version, bump_user_catalog_version
+
+
+def _target_user_id(target_id):
+    return Target.objects.filter(pk=target_id).values_list('user_id', flat=True).first()
+
+
+def _item_user_id(item):
+    # Avoid a query when the target is already loaded (the usual case in views)
+    target = item._state.fields_cache.get('target')
+    if target is not None:
+        return target.user_id
+    return _target_user_id(item.target_id)
+
+
+# --- Anniversary Index ---
+
+@receiver(post_save, sender=Target)
+def sync_target_birthday(sender, instance, raw=False, **kwargs):
+    if raw: return
+    anniversaries.sync_target_birthday(instance)
+
+
+@receiver(post_save, sender=CustomAnniversary)
+def sync_custom_anniversary(sender, instance, raw=False, **kwargs):
+    if raw: return
+    anniversaries.sync_custom_anniversary(instance)
+
+
+# --- Name Search Index ---
+
+@receiver(post_save, sender=Target)
+def index_target_names(sender, instance, raw=False, **kwargs):
+    if raw: return
+    search.index_target(instance)
+
+
+# --- Target Stats ---
+
+@receiver(post_save, sender=Target)
+def create_target_stats(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        TargetStats.objects.get_or_create(target=instance)
+
+
+@receiver(post_save, sender=TimelineItem)
+def update_stats_on_item_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw: return
+    if created:
+        stats.item_created(instance)
+    else:
+        stats.recalculate_target_stats(instance.target_id)
+
+
+@receiver(post_delete, sender=TimelineItem)
+def update_stats_on_item_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Target): return # Stats row is deleted with the target
+    stats.item_deleted(instance)
+
+
+@receiver(pre_save, sender=Question)
+def track_question_changes(sender, instance, raw=False, **kwargs):
+    instance._rank_changed = instance._category_changed = False
+    if raw or not instance.pk: return
+    previous = Question.objects.filter(pk=instance.pk).values_list('rank_id', 'category_id').first()
+    if previous is None: return
+    instance._rank_changed = previous[0] != instance.rank_id
+    instance._category_changed = previous[1] != instance.category_id
+
+
+@receiver(post_save, sender=Question)
+def update_stats_on_rank_change(sender, instance, **kwargs):
+    if getattr(instance, '_rank_changed', False):
+        stats.recalculate_targets(stats.answering_targets(instance.pk))
+
+
+@receiver(pre_delete, sender=Question)
+def collect_answering_targets(sender, instance, **kwargs):
+    instance._answering_targets = stats.answering_targets(instance.pk)
+
+
+@receiver(post_delete, sender=Question)
+def update_stats_on_question_delete(sender, instance, **kwargs):
+    stats.recalculate_targets(getattr(instance, '_answering_targets', ()))
+
+
+@receiver(pre_delete, sender=QuestionRank)
+def collect_rank_targets(sender, instance, **kwargs):
+    instance._answering_targets = set(
+        TimelineItem.objects.filter(question__rank=instance).values_list('target_id', flat=True).distinct()
+    )
+
+
+@receiver(post_save, sender=QuestionRank)
+@receiver(post_delete, sender=QuestionRank)
+def update_stats_on_rank(sender, instance, created=False, **kwargs):
+    if created: return
+    target_ids = getattr(instance, '_answering_targets', None)
+    if target_ids is None:
+        target_ids = TimelineItem.objects.filter(question__rank=instance).values_list('target_id', flat=True).distinct()
+    stats.recalculate_targets(target_ids)
+
+
+# --- Current Answers & Category Progress ---
+
+def _answer_key(item):
+    if item.type == 'Question' and item.question_id:
+        return (item.target_id, item.question_id)
+    return None
+
+
+@receiver(pre_save, sender=TimelineItem)
+def track_answer_key(sender, instance, raw=False, **kwargs):
+    instance._previous_answer_key = None
+    if raw or instance._state.adding: return
+    previous = TimelineItem.objects.filter(pk=instance.pk).values_list('type', 'target_id', 'question_id').first()
+    if previous is not None and previous[0] == 'Question' and previous[2]:
+        instance._previous_answer_key = (previous[1], previous[2])
+
+
+@receiver(post_save, sender=TimelineItem)
+def update_answers_on_item_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw: return
+    key = _answer_key(instance)
+    if created:
+        if key: answers.answer_created(instance)
+        return
+    for changed in {key, getattr(instance, '_previous_answer_key', None)} - {None}:
+        answers.refresh_answer(*changed)
+
+
+@receiver(post_delete, sender=TimelineItem)
+def update_answers_on_item_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Target): return # Pointers are deleted with the target
+    key = _answer_key(instance)
+    if key: answers.refresh_answer(*key)
+
+
+@receiver(post_save, sender=Question)
+def update_answers_on_category_change(sender, instance, **kwargs):
+    if getattr(instance, '_category_changed', False):
+        answers.question_moved(instance)
+
+
+@receiver(post_delete, sender=Question)
+def update_progress_on_question_delete(sender, instance, **kwargs):
+    # Pointers are deleted with the question; targets collected in collect_answering_targets
+    answers.recount_progress(getattr(instance, '_answering_targets', ()))
+
+
+@receiver(pre_delete, sender=QuestionCategory)
+def collect_category_targets(sender, instance, **kwargs):
+    instance._progress_targets = set(
+        TargetCategoryProgress.objects.filter(category=instance).values_list('target_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=QuestionCategory)
+def update_progress_on_category_delete(sender, instance, **kwargs):
+    # Its questions (and their pointers) are now uncategorized
+    answers.recount_progress(getattr(instance, '_progress_targets', ()))
+
+
+# --- Daily Roster ---
+
+@receiver(pre_save, sender=TargetGroup)
+def track_group_weekday_mask(sender, instance, raw=False, **kwargs):
+    instance._previous_weekday_mask = None
+    if raw or instance._state.adding: return
+    instance._previous_weekday_mask = TargetGroup.objects.filter(pk=instance.pk).values_list('weekday_mask', flat=True).first()
+
+
+@receiver(post_save, sender=TargetGroup)
+def invalidate_roster_on_group_change(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_weekday_mask', None)
+    if raw or previous is None: return
+    changed = previous ^ instance.weekday_mask
+    if changed:
+        roster.invalidate_weekdays(roster.member_user_ids([instance.pk]), roster.mask_weekdays(changed))
+
+
+@receiver(pre_delete, sender=TargetGroup)
+def invalidate_roster_on_group_delete(sender, instance, **kwargs):
+    roster.invalidate_weekdays(roster.member_user_ids([instance.pk]), roster.mask_weekdays(instance.weekday_mask))
+
+
+@receiver(m2m_changed, sender=Target.groups.through)
+def invalidate_roster_on_membership(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'): return
+    if isinstance(instance, Target):
+        groups = instance.groups.all() if pk_set is None else TargetGroup.objects.filter(pk__in=pk_set)
+        mask = 0
+        for group_mask in groups.values_list('weekday_mask', flat=True):
+            mask |= group_mask
+        roster.invalidate_weekdays({instance.user_id}, roster.mask_weekdays(mask))
+    else:
+        targets = instance.target_set.all() if pk_set is None else Target.objects.filter(pk__in=pk_set)
+        user_ids = set(targets.values_list('user_id', flat=True))
+        roster.invalidate_weekdays(user_ids, roster.mask_weekdays(instance.weekday_mask))
+
+
+@receiver(pre_save, sender=AnniversaryOccurrence)
+def track_occurrence_day(sender, instance, raw=False, **kwargs):
+    instance._previous_day = None
+    if raw or instance._state.adding: return
+    instance._previous_day = AnniversaryOccurrence.objects.filter(pk=instance.pk).values_list('user_id', 'month', 'day').first()
+
+
+@receiver(post_save, sender=AnniversaryOccurrence)
+def invalidate_roster_on_occurrence_save(sender, instance, raw=False, **kwargs):
+    if raw: return
+    current = (instance.user_id, instance.month, instance.day)
+    for changed in {current, getattr(instance, '_previous_day', None)} - {None}:
+        roster.invalidate_day(*changed)
+
+
+@receiver(post_delete, sender=AnniversaryOccurrence)
+def invalidate_roster_on_occurrence_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Target): return # invalidate_roster_on_target_delete covers it
+    roster.invalidate_day(instance.user_id, instance.month, instance.day)
+
+
+@receiver([post_save, post_delete], sender=DailyTargetState)
+def invalidate_roster_on_state(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or isinstance(origin, Target): return
+    roster.invalidate_date(_item_user_id(instance), instance.date)
+
+
+@receiver(post_delete, sender=Target)
+def invalidate_roster_on_target_delete(sender, instance, **kwargs):
+    roster.invalidate_target(instance)
+
+
+# --- User Change Versions (cache invalidation) ---
+
+@receiver([post_save, post_delete], sender=Target)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=TargetGroup)
+def bump_version_for_owned(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Target)
+def bump_target_version_for_target(sender, instance, **kwargs):
+    bump_target_version(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_shared_version_for_tag(sender, instance, **kwargs):
+    # Tag names appear in the timelines of every target
+    bump_shared_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Target.groups.through)
+def bump_version_for_membership(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'): return
+    bump_user_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=TimelineItem)
+def bump_version_for_item(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Target): return # Cascade: the Target's own signal covers it
+    bump_user_version(_item_user_id(instance))
+    bump_target_version(instance.target_id)
+
+
+@receiver([post_save, post_delete], sender=CustomAnniversary)
+def bump_version_for_anniversary(sender, instance, **kwargs):
+    bump_user_version(_target_user_id(instance.target_id))
+
+
+@receiver([post_save, post_delete], sender=TimelineImage)
+def bump_version_for_image(sender, instance, **kwargs):
+    item = instance._state.fields_cache.get('item')
+    if item is not None:
+        bump_user_version(_item_user_id(item))
+        bump_target_version(item.target_id)
+    else:
+        target_id, user_id = TimelineItem.objects.filter(pk=instance.item_id).values_list(
+            'target_id', 'target__user_id'
+        ).first() or (None, None)
+        bump_user_version(user_id)
+        bump_target_version(target_id)
+
+
+@receiver(m2m_changed, sender=TimelineItem.tags.through)
+def bump_version_for_item_tags(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'): return
+    if isinstance(instance, TimelineItem):
+        bump_user_version(_item_user_id(instance))
+        bump_target_version(instance.target_id)
+    else:
+        bump_user_version(instance.user_id)
+        bump_shared_version(instance.user_id) # Items of any target
+
+
+# --- Question Catalog Versions ---
+
+def _in_shared_catalog(instance):
+    """
+    Whether a question, category or rank shows in other users' catalogs:
+    shared, MASTER-owned, or (categories and ranks) used by a shared question
+    or a question of another user.
+    """
+    if getattr(instance, 'is_shared', False) or instance.user.role == MASTER_ROLE:
+        return True
+    if isinstance(instance, Question):
+        return False
+    field = 'category' if isinstance(instance, QuestionCategory) else 'rank'
+    return Question.objects.filter(Q(is_shared=True) | ~Q(user_id=instance.user_id), **{field: instance}).exists()
+
+
+@receiver(pre_save, sender=Question)
+@receiver(pre_save, sender=QuestionCategory)
+def remember_catalog_sharing(sender, instance, **kwargs):
+    # Unsharing takes the row out of every other catalog: that needs the stored flag
+    instance._was_shared = (
+        not instance._state.adding and not instance.is_shared
+        and sender.objects.filter(pk=instance.pk, is_shared=True).exists()
+    )
+
+
+# Deletes bump before the rows go: SET_NULL clears the questions' category / rank before post_delete
+@receiver([post_save, pre_delete], sender=Question)
+@receiver([post_save, pre_delete], sender=QuestionCategory)
+@receiver([post_save, pre_delete], sender=QuestionRank)
+def bump_catalog_for_question(sender, instance, **kwargs):
+    bump_user_catalog_version(instance.user_id)
+    if getattr(instance, '_was_shared', False) or _in_shared_catalog(instance):
+        bump_catalog_version()
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_master_role(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and 'role' not in update_fields):
+        instance._was_master = None
+        return
+    instance._was_master = sender.objects.filter(pk=instance.pk, role=MASTER_ROLE).exists()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def bump_catalog_for_role(sender, instance, created=False, **kwargs):
+    # MASTER questions are visible to everyone, so becoming or ceasing to be a MASTER alters visibility
+    was_master = getattr(instance, '_was_master', None)
+    if created or was_master is None: return
+    if was_master != (instance.role == MASTER_ROLE):
+        bump_catalog_version()
@@ -0,0 +1,181 @@
+"""
+Per-target statistics (TargetStats).
+
+Creating a TimelineItem is applied as a single conditional UPDATE of the target's
+stats row; updates and deletes re-derive only the fields they can affect for
+that one target. rebuild_all_stats() recomputes every row from scratch
+(see the rebuild_target_stats management command).
+"""
+from django.db import transaction
+from django.db.models import Q, F, Count, Sum, Max, Case, When, Value, OuterRef, Subquery
+
+from .models import Target, TargetStats, TimelineItem
+
+
+def item_points(item):
+    if item.type != 'Question' or not item.question_id:
+        return 0
+    question = item.question
+    if question is None or question.rank_id is None:
+        return 0
+    return question.rank.points or 0
+
+
+def _is_answer(item):
+    return item.type == 'Question' and item.question_id is not None
+
+
+def _other_answers_exist(item):
+    return TimelineItem.objects.filter(
+        target_id=item.target_id, type='Question', question_id=item.question_id
+    ).exclude(pk=item.pk).exists()
+
+
+def _when(condition, value, field_name):
+    """SET field = value if condition else field (single UPDATE, no read-modify-write)."""
+    field = TargetStats._meta.get_field(field_name)
+    return Case(When(condition, then=Value(value, output_field=field)), default=F(field_name), output_field=field)
+
+
+def ensure_stats(target):
+    """Stats row for target, rebuilding it if missing."""
+    try:
+        return target.stats
+    except TargetStats.DoesNotExist:
+        return recalculate_target_stats(target.pk)
+
+
+def item_created(item):
+    newer = (
+        Q(latest_item_date__isnull=True) |
+        Q(latest_item_date__lt=item.date) |
+        Q(latest_item_date=item.date, latest_item_created_at__lte=item.created_at)
+    )
+    changes = {
+        'log_count': F('log_count') + 1,
+        'latest_message': _when(newer, item.content or '', 'latest_message'),
+        'latest_item_created_at': _when(newer, item.created_at, 'latest_item_created_at'),
+        # Kept last: MySQL evaluates SET clauses left to right
+        'latest_item_date': _when(newer, item.date, 'latest_item_date'),
+    }
+    if item.contact_made:
+        changes['contact_count'] = F('contact_count') + 1
+        later_contact = Q(real_last_contact__isnull=True) | Q(real_last_contact__lt=item.date)
+        changes['real_last_contact'] = _when(later_contact, item.date, 'real_last_contact')
+    points = item_points(item)
+    if points:
+        changes['total_points'] = F('total_points') + points
+    if _is_answer(item) and not _other_answers_exist(item):
+        changes['answered_question_count'] = F('answered_question_count') + 1
+
+    if not TargetStats.objects.filter(target_id=item.target_id).update(**changes):
+        recalculate_target_stats(item.target_id)
+
+
+def item_deleted(item):
+    changes = {'log_count': F('log_count') - 1}
+    if item.contact_made:
+        changes['contact_count'] = F('contact_count') - 1
+    points = item_points(item)
+    if points:
+        changes['total_points'] = F('total_points') - points
+    if _is_answer(item) and not _other_answers_exist(item):
+        changes['answered_question_count'] = F('answered_question_count') - 1
+
+    stats = TargetStats.objects.filter(target_id=item.target_id)
+    # Never (re)create rows here: deletes also run while the target itself is going away
+    if not stats.update(**changes):
+        return
+
+    row = stats.values('latest_item_date', 'latest_item_created_at', 'real_last_contact').first()
+    if row is None:
+        return
+    if row['latest_item_date'] == item.date and row['latest_item_created_at'] == item.created_at:
+        stats.update(**_latest_fields(item.target_id))
+    if item.contact_made and row['real_last_contact'] == item.date:
+        stats.update(real_last_contact=_items(item.target_id).filter(contact_made=True).aggregate(d=Max('date'))['d'])
+
+
+def _items(target_id):
+    return TimelineItem.objects.filter(target_id=target_id)
+
+
+def _latest_fields(target_id):
+    latest = _items(target_id).order_by('-date', '-created_at').values('content', 'date', 'created_at').first()
+    if latest is None:
+        return {'latest_message': '', 'latest_item_date': None, 'latest_item_created_at': None}
+    return {
+        'latest_message': latest['content'] or '',
+        'latest_item_date': latest['date'],
+        'latest_item_created_at': latest['created_at'],
+    }
+
+
+def _aggregates():
+    return {
+        'log_count': Count('id'),
+        'contact_count': Count('id', filter=Q(contact_made=True)),
+        'total_points': Sum('question__rank__points', filter=Q(type='Question')),
+        'answered_question_count': Count('question', filter=Q(type='Question'), distinct=True),
+        'real_last_contact': Max('date', filter=Q(contact_made=True)),
+    }
+
+
+def recalculate_target_stats(target_id):
+    values = _items(target_id).aggregate(**_aggregates())
+    values['total_points'] = values['total_points'] or 0
+    values.update(_latest_fields(target_id))
+    stats, _ = TargetStats.objects.update_or_create(target_id=target_id, defaults=values)
+    return stats
+
+
+def rebuild_all_stats(batch_size=500, user_ids=None):
+    """
+    Recompute every TargetStats row (only those of the targets of user_ids if
+    given) from TimelineItems. Returns the number of rows written.
+    """
+    items, targets, existing = TimelineItem.objects.all(), Target.objects.all(), TargetStats.objects.all()
+    if user_ids is not None:
+        items = items.filter(target__user_id__in=user_ids)
+        targets = targets.filter(user_id__in=user_ids)
+        existing = existing.filter(target__user_id__in=user_ids)
+    aggregates = {
+        row.pop('target_id'): row
+        for row in items.order_by().values('target_id').annotate(**_aggregates())
+    }
+
+    latest = TimelineItem.objects.filter(target=OuterRef('pk')).order_by('-date', '-created_at')
+    targets = targets.annotate(
+        latest_message=Subquery(latest.values('content')[:1]),
+        latest_item_date=Subquery(latest.values('date')[:1]),
+        latest_item_created_at=Subquery(latest.values('created_at')[:1]),
+    ).values('pk', 'latest_message', 'latest_item_date', 'latest_item_created_at')
+
+    rows = []
+    for t in targets.iterator():
+        agg = aggregates.get(t['pk'], {})
+        rows.append(TargetStats(
+            target_id=t['pk'],
+            log_count=agg.get('log_count', 0),
+            contact_count=agg.get('contact_count', 0),
+            total_points=agg.get('total_points') or 0,
+            answered_question_count=agg.get('answered_question_count', 0),
+            real_last_contact=agg.get('real_last_contact'),
+            latest_message=t['latest_message'] or '',
+            latest_item_date=t['latest_item_date'],
+            latest_item_created_at=t['latest_item_created_at'],
+        ))
+
+    with transaction.atomic():
+        existing.delete()
+        TargetStats.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def answering_targets(question_id):
+    return set(TimelineItem.objects.filter(question_id=question_id).values_list('target_id', flat=True).distinct())
+
+
+def recalculate_targets(target_ids):
+    for target_id in target_ids:
+        recalculate_target_stats(target_id)
@@ -0,0 +1,241 @@
+"""
+Synthetic data for load testing and benchmarks (see the generate_synthetic_data
+and run_benchmarks management commands).
+
+Rows are written with bulk_create, which bypasses the signal receivers, so the
+derived tables (anniversary index, TargetStats, current answers, name search index) of the
+generated users are rebuilt, their stored daily rosters dropped and their cache versions bumped at the end. The FTS index is maintained by
+database triggers and needs nothing extra.
+"""
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Target, TargetGroup, CustomAnniversary, TimelineItem, TimelineImage,
+    Question, QuestionCategory, QuestionRank,
+)
+from .tags import resolve_tags
+from .versions import bump_user_catalog_version
+
+LAST_NAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤']
+LAST_NAMES_KANA = ['さとう', 'すずき', 'たかはし', 'たなか', 'いとう', 'わたなべ', 'やまもと', 'なかむら', 'こばやし', 'かとう']
+FIRST_NAMES = ['陽菜', '結衣', '葵', '蓮', '湊', '大翔', '美咲', '翔太', '凛', '悠真']
+FIRST_NAMES_KANA = ['ひな', 'ゆい', 'あおい', 'れん', 'みなと', 'ひろと', 'みさき', 'しょうた', 'りん', 'ゆうま']
+PHRASES = [
+    '駅前のカフェで近況を聞いた', '週末は映画を見に行くらしい', '新しい仕事の話で盛り上がった',
+    '誕生日プレゼントの候補を確認', '最近ランニングを始めたとのこと', '家族旅行の写真を見せてもらった',
+    'お気に入りのラーメン屋を教えてもらった', '来月の予定を共有した',
+]
+
+# 1x1 transparent PNG shared by every synthetic TimelineImage
+PIXEL_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6300010000050001a5f645400000000049454e44ae426082'
+)
+IMAGE_NAME = 'timeline_images/synthetic.png'
+
+
+class SyntheticConfig:
+    def __init__(self, users=1, targets=50, groups=5, anniversaries=1, questions=30,
+                 items=20, tags=20, image_ratio=0.1, days=365, prefix='synthetic', role='AGENT', seed=0):
+        self.users = users
+        self.targets = targets               # per user
+        self.groups = groups                 # per user
+        self.anniversaries = anniversaries   # per target
+        self.questions = questions           # catalog size (owned by a MASTER)
+        self.items = items                   # per target
+        self.tags = tags                     # per user
+        self.image_ratio = image_ratio       # share of Event items with one image
+        self.days = days                     # items are spread over the last N days
+        self.prefix = prefix
+        self.role = role                     # role of the generated users
+        self.seed = seed
+
+
+def _image_name():
+    if not default_storage.exists(IMAGE_NAME):
+        return default_storage.save(IMAGE_NAME, ContentFile(PIXEL_PNG))
+    return IMAGE_NAME
+
+
+def _master(config):
+    User = get_user_model()
+    master, created = User.objects.get_or_create(username=f'{config.prefix}_master', defaults={'role': 'MASTER'})
+    if created:
+        master.set_unusable_password()
+        master.save()
+    return master
+
+
+def _catalog(config, rng, master):
+    """(questions, created): questions owned by the synthetic MASTER (visible to every user)."""
+    questions = list(Question.objects.filter(user=master))
+    if len(questions) >= config.questions:
+        return questions, False
+
+    categories = [
+        QuestionCategory.objects.get_or_create(user=master, name=name, defaults={'is_shared': True, 'order': i})[0]
+        for i, name in enumerate(['基本情報', 'パーソナリティ', '人間関係', 'ライフスタイル'])
+    ]
+    ranks = [
+        QuestionRank.objects.get_or_create(user=master, name=name, defaults={'points': points})[0]
+        for name, points in [('C', 1), ('B', 3), ('A', 5), ('S', 10)]
+    ]
+    Question.objects.bulk_create([
+        Question(
+            user=master, category=rng.choice(categories), rank=rng.choice(ranks),
+            title=f'質問{i + 1}', description='synthetic', is_shared=True, order=i,
+        )
+        for i in range(len(questions), config.questions)
+    ])
+    # bulk_create skips the catalog receivers (the shared version is bumped by rebuild_derived_data)
+    bump_user_catalog_version(master.pk)
+    return list(Question.objects.filter(user=master).select_related('category')), True
+
+
+def _user(config, index):
+    User = get_user_model()
+    user, created = User.objects.get_or_create(username=f'{config.prefix}_{index}', defaults={'role': config.role})
+    if created:
+        user.set_unusable_password()
+        user.save()
+    return user
+
+
+def _populate_user(config, rng, user, questions, image_name, today):
+    groups = [
+        TargetGroup(user=user, name=f'Group {i + 1}', **{day: rng.random() < 0.3 for day in TargetGroup.WEEKDAY_FIELDS})
+        for i in range(config.groups)
+    ]
+    for group in groups:
+        group.weekday_mask = group.compute_weekday_mask() # bulk_create skips save()
+    TargetGroup.objects.bulk_create(groups)
+    # Tags are unique per user: a second run for the same user reuses them
+    tags = list(resolve_tags(user, [f'tag{i + 1}' for i in range(config.tags)]).values())
+
+    targets = []
+    for i in range(config.targets):
+        last, first = rng.randrange(len(LAST_NAMES)), rng.randrange(len(FIRST_NAMES))
+        has_birthday = rng.random() < 0.8
+        targets.append(Target(
+            user=user,
+            nickname=f'{FIRST_NAMES[first]}{i + 1}',
+            last_name=LAST_NAMES[last], first_name=FIRST_NAMES[first],
+            last_name_kana=LAST_NAMES_KANA[last], first_name_kana=FIRST_NAMES_KANA[first],
+            birth_year=rng.randint(1960, 2005) if has_birthday else None,
+            birth_month=rng.randint(1, 12) if has_birthday else None,
+            birth_day=rng.randint(1, 28) if has_birthday else None,
+            gender=rng.choice(['Male', 'Female', 'Other']),
+            blood_type=rng.choice(['A', 'B', 'O', 'AB']),
+        ))
+    Target.objects.bulk_create(targets)
+
+    Membership = Target.groups.through
+    memberships = []
+    for target in targets:
+        for group in rng.sample(groups, k=min(len(groups), rng.randint(0, 2))):
+            memberships.append(Membership(target_id=target.pk, targetgroup_id=group.pk))
+    Membership.objects.bulk_create(memberships, batch_size=1000)
+
+    CustomAnniversary.objects.bulk_create([
+        CustomAnniversary(target=target, label='記念日', date=today - datetime.timedelta(days=rng.randint(30, 3650)))
+        for target in targets
+        for _ in range(config.anniversaries)
+    ], batch_size=1000)
+
+    items = []
+    for target in targets:
+        for _ in range(config.items):
+            date = today - datetime.timedelta(days=rng.randint(0, config.days))
+            if questions and rng.random() < 0.3:
+                question = rng.choice(questions)
+                items.append(TimelineItem(
+                    target=target, date=date, type='Question', question=question,
+                    question_text=question.title,
+                    question_category=question.category.name if question.category else '',
+                    question_answer=rng.choice(PHRASES), content=rng.choice(PHRASES),
+                ))
+            else:
+                items.append(TimelineItem(
+                    target=target, date=date, type=rng.choice(['Event', 'Event', 'Note']),
+                    content=rng.choice(PHRASES), contact_made=rng.random() < 0.5,
+                ))
+    TimelineItem.objects.bulk_create(items, batch_size=1000)
+
+    # bulk_create only returns primary keys on some backends (SQLite >= 3.35, PostgreSQL)
+    item_ids = [item.pk for item in items if item.pk is not None] or list(
+        TimelineItem.objects.filter(target__user=user).values_list('pk', flat=True)
+    )
+    ItemTag = TimelineItem.tags.through
+    item_tags = []
+    for item_id in item_ids:
+        for tag in rng.sample(tags, k=min(len(tags), rng.randint(0, 2))):
+            item_tags.append(ItemTag(timelineitem_id=item_id, tag_id=tag.pk))
+    ItemTag.objects.bulk_create(item_tags, batch_size=1000)
+
+    event_ids = [item.pk for item in items if item.pk is not None and item.type != 'Question']
+    TimelineImage.objects.bulk_create([
+        TimelineImage(item_id=item_id, image=image_name)
+        for item_id in event_ids if rng.random() < config.image_ratio
+    ], batch_size=1000)
+
+    # Last contact as the views maintain it
+    last_contact = {}
+    for item in items:
+        if item.contact_made and (item.target_id not in last_contact or item.date > last_contact[item.target_id]):
+            last_contact[item.target_id] = item.date
+    for target in targets:
+        if target.pk in last_contact:
+            target.last_contact = timezone.make_aware(datetime.datetime.combine(last_contact[target.pk], datetime.time(12, 0)))
+    Target.objects.bulk_update(targets, ['last_contact'], batch_size=1000)
+    return len(targets), len(items)
+
+
+def rebuild_derived_data(user_ids=None, catalog_changed=True):
+    """
+    Rebuild everything normally maintained by signals, for the data of
+    user_ids only if given (all users otherwise).
+    """
+    from .anniversaries import rebuild_all_occurrences
+    from .answers import rebuild_answer_index
+    from .roster import clear as clear_rosters
+    from .search import rebuild_search_index
+    from .stats import rebuild_all_stats
+    from .versions import bump_catalog_version, bump_shared_version, bump_user_version
+
+    rebuild_all_occurrences(user_ids=user_ids)
+    rebuild_all_stats(user_ids=user_ids)
+    rebuild_answer_index(user_ids=user_ids)
+    rebuild_search_index(user_ids=user_ids)
+    clear_rosters(user_ids)
+    if catalog_changed:
+        bump_catalog_version()
+    if user_ids is None:
+        user_ids = Target.objects.order_by().values_list('user_id', flat=True).distinct()
+    for user_id in user_ids:
+        bump_user_version(user_id)
+        bump_shared_version(user_id) # Covers the versions of the user's targets
+
+
+def generate(config, start_index=0):
+    """Create config.users users (numbered from start_index) with their data. Returns the users."""
+    rng = random.Random(config.seed + start_index)
+    today = datetime.date.today()
+    image_name = _image_name() if config.image_ratio else None
+
+    users = []
+    with transaction.atomic():
+        master = _master(config)
+        questions, catalog_changed = _catalog(config, rng, master)
+        for index in range(start_index, start_index + config.users):
+            user = _user(config, index)
+            _populate_user(config, rng, user, questions, image_name, today)
+            users.append(user)
+        rebuild_derived_data([user.pk for user in users], catalog_changed)
+    return users
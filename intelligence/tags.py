@@ -0,0 +1,66 @@
+"""
+Tag resolution.
+
+Tags are unique per (user, name). Instead of one get_or_create per hashtag and
+one get + add per explicit tag ID, a log write resolves all of its tags in bulk:
+resolve_tags() reads the existing tags in one query and inserts the missing
+ones with bulk_create(ignore_conflicts=True) (a concurrent insert of the same
+name is simply re-read), and attach_tags() links them with a single insert
+into the TimelineItem.tags through table.
+"""
+import re
+
+from .models import Tag, TimelineItem
+from .versions import bump_target_version, bump_user_version
+
+HASHTAG_RE = re.compile(r'#(\w+)')
+
+
+def hashtags(text):
+    """Distinct #hashtag names in text, in order of appearance."""
+    return list(dict.fromkeys(HASHTAG_RE.findall(text or '')))
+
+
+def resolve_tags(user, names):
+    """{name: Tag} for every name, creating the missing tags of user."""
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    resolved = {tag.name: tag for tag in Tag.objects.filter(user=user, name__in=names)}
+    missing = [name for name in names if name not in resolved]
+    if missing:
+        Tag.objects.bulk_create([Tag(user=user, name=name) for name in missing], ignore_conflicts=True)
+        # ignore_conflicts does not return primary keys
+        resolved.update((tag.name, tag) for tag in Tag.objects.filter(user=user, name__in=missing))
+    return resolved
+
+
+def user_tags(user, tag_ids):
+    """{id: Tag} for the tag IDs that exist and belong to user (malformed IDs are skipped)."""
+    ids = set()
+    for tag_id in tag_ids or ():
+        try:
+            ids.add(int(tag_id))
+        except (TypeError, ValueError):
+            continue
+    if not ids:
+        return {}
+    return {tag.pk: tag for tag in Tag.objects.filter(user=user, pk__in=ids)}
+
+
+def attach_tags(user_id, links, target_ids=()):
+    """
+    Link (item_id, tag_id) pairs in one insert (existing links are skipped).
+    target_ids are the targets of the items, whose change versions are bumped.
+    """
+    links = set(links)
+    if not links:
+        return
+    ItemTag = TimelineItem.tags.through
+    ItemTag.objects.bulk_create(
+        [ItemTag(timelineitem_id=item_id, tag_id=tag_id) for item_id, tag_id in links], ignore_conflicts=True
+    )
+    # The through-table insert skips m2m_changed
+    bump_user_version(user_id)
+    for target_id in set(target_ids):
+        bump_target_version(target_id)
@@ -1,3 +1,590 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from accounts.models import CustomUser
+from intelligence.answers import current_answers, category_progress, answer_summary, rebuild_answer_index
+from intelligence.models import (
+    Target, TimelineItem, Question, QuestionCategory, TargetQuestionAnswer, TargetCategoryProgress,
+    TargetGroup, CustomAnniversary, DailyTargetState, DailyRoster, Tag, QuestionRank,
+)
+from intelligence import roster
+from intelligence.catalog import get_catalog
+from intelligence.tags import attach_tags, resolve_tags, user_tags
+
+
+class AnswerIndexTests(TestCase):
+    """Incrementally maintained pointers and counters must match a full rebuild."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.target = Target.objects.create(user=self.user, nickname='t')
+        self.cat_a = QuestionCategory.objects.create(user=self.user, name='A')
+        self.cat_b = QuestionCategory.objects.create(user=self.user, name='B')
+        self.q1 = Question.objects.create(user=self.user, title='q1', category=self.cat_a)
+        self.q2 = Question.objects.create(user=self.user, title='q2', category=self.cat_a)
+        self.q3 = Question.objects.create(user=self.user, title='q3', category=self.cat_b)
+
+    def answer(self, question, days_ago, content='a'):
+        return TimelineItem.objects.create(
+            target=self.target, type='Question', question=question, content=content,
+            date=datetime.date.today() - datetime.timedelta(days=days_ago),
+        )
+
+    def snapshot(self):
+        pointers = sorted(TargetQuestionAnswer.objects.values_list('target_id', 'question_id', 'category_id', 'item_id', 'date', 'answer_count'))
+        progress = sorted(
+            TargetCategoryProgress.objects.filter(answered_count__gt=0).values_list('target_id', 'category_id', 'answered_count'),
+            key=str,
+        )
+        return pointers, progress
+
+    def assertMatchesRebuild(self):
+        maintained = self.snapshot()
+        rebuild_answer_index()
+        self.assertEqual(maintained, self.snapshot())
+
+    def test_same_day_tie(self):
+        self.answer(self.q2, 0, 'first')
+        second = self.answer(self.q2, 0, 'second')
+        self.assertEqual(current_answers(self.target)[self.q2.pk].pk, second.pk)
+        self.assertMatchesRebuild()
+
+    def test_create_update_delete(self):
+        self.answer(self.q1, 3, 'old')
+        newest = self.answer(self.q1, 1, 'new')
+        self.answer(self.q1, 2, 'backdated')
+        self.answer(self.q3, 0)
+        self.assertEqual(current_answers(self.target)[self.q1.pk].pk, newest.pk)
+        self.assertEqual(answer_summary(self.target.pk)[self.q1.pk][0], 3)
+        self.assertEqual(category_progress(self.target.pk), {self.cat_a.pk: 1, self.cat_b.pk: 1})
+        self.assertMatchesRebuild()
+
+        newest.date = datetime.date.today() - datetime.timedelta(days=10)
+        newest.save()
+        self.assertEqual(current_answers(self.target)[self.q1.pk].content, 'backdated')
+        self.assertMatchesRebuild()
+
+        newest.question = self.q2
+        newest.save()
+        self.assertEqual(category_progress(self.target.pk)[self.cat_a.pk], 2)
+        self.assertMatchesRebuild()
+
+        newest.delete()
+        TimelineItem.objects.filter(question=self.q3).delete()
+        self.assertEqual(set(current_answers(self.target)), {self.q1.pk})
+        self.assertMatchesRebuild()
+
+    def test_question_moves_and_deletes(self):
+        self.answer(self.q1, 0)
+        self.answer(self.q2, 0)
+        self.answer(self.q3, 0)
+
+        self.q1.category = self.cat_b
+        self.q1.save()
+        self.assertEqual(category_progress(self.target.pk), {self.cat_a.pk: 1, self.cat_b.pk: 2})
+        self.assertMatchesRebuild()
+
+        self.cat_b.delete()
+        self.assertEqual(category_progress(self.target.pk), {self.cat_a.pk: 1, None: 2})
+        self.assertMatchesRebuild()
+
+        self.q2.delete()
+        self.assertEqual(category_progress(self.target.pk).get(self.cat_a.pk, 0), 0)
+        self.assertMatchesRebuild()
+
+
+class DailyRosterTests(TestCase):
+    """Stored rosters must match a fresh computation, and changes only drop the dates they affect."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.start = datetime.date(2024, 2, 19) # Monday, window covers Feb 29
+        self.end = self.start + datetime.timedelta(days=20)
+        self.group = TargetGroup.objects.create(user=self.user, name='G', is_mon=True)
+        self.a = Target.objects.create(user=self.user, nickname='a', birth_month=2, birth_day=29)
+        self.b = Target.objects.create(user=self.user, nickname='b')
+        self.a.groups.add(self.group)
+
+    def day(self, offset):
+        return self.start + datetime.timedelta(days=offset)
+
+    def assertMatchesFresh(self):
+        stored = roster.roster_between(self.user, self.start, self.end)
+        roster.clear()
+        self.assertEqual(stored, roster.roster_between(self.user, self.start, self.end))
+
+    def stored_dates(self):
+        return set(DailyRoster.objects.filter(user=self.user).values_list('date', flat=True))
+
+    def test_sources(self):
+        DailyTargetState.objects.create(target=self.b, date=self.day(0), is_manual_add=True)
+        DailyTargetState.objects.create(target=self.a, date=self.day(7), is_hidden=True)
+        rosters = roster.roster_between(self.user, self.start, self.end)
+
+        self.assertEqual(rosters[self.day(0)], {self.a.pk: {'sources': {'group'}}, self.b.pk: {'sources': {'manual'}}})
+        self.assertEqual(rosters[self.day(10)], {self.a.pk: {'sources': {'anniversary'}, 'anniv_label': '誕生日'}})
+        self.assertNotIn(self.a.pk, rosters[self.day(7)])
+        self.assertEqual(rosters[self.day(1)], {})
+        self.assertEqual(len(self.stored_dates()), 21)
+
+    def test_weekday_mask(self):
+        self.assertEqual(self.group.weekday_mask, 0b0000001)
+        self.group.is_sun = True
+        self.group.save(update_fields=['is_sun'])
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.weekday_mask, 0b1000001)
+
+        # Only the user's own groups count
+        other = CustomUser.objects.create_user(username='other', password='pw')
+        foreign = TargetGroup.objects.create(user=other, name='F', is_tue=True)
+        self.b.groups.add(foreign)
+        with self.assertNumQueries(1):
+            schedule = roster.group_schedule(self.user, self.day(0), self.day(1))
+        self.assertEqual(schedule[0], {self.a.pk: None})
+        self.assertEqual(schedule[1], {})
+        self.assertEqual(schedule[6], {}) # Sunday is outside the range
+
+    def test_targeted_invalidation(self):
+        roster.roster_between(self.user, self.start, self.end)
+        all_dates = self.stored_dates()
+
+        DailyTargetState.objects.create(target=self.b, date=self.day(3), is_manual_add=True)
+        self.assertEqual(all_dates - self.stored_dates(), {self.day(3)})
+        self.assertMatchesFresh()
+
+        self.group.is_wed = True
+        self.group.save()
+        self.assertEqual(all_dates - self.stored_dates(), {self.day(2), self.day(9), self.day(16)})
+        self.assertMatchesFresh()
+
+        CustomAnniversary.objects.create(target=self.b, label='x', date=datetime.date(2020, 2, 25))
+        self.assertEqual(all_dates - self.stored_dates(), {self.day(6)})
+        self.assertMatchesFresh()
+
+        self.b.groups.add(self.group)
+        self.assertMatchesFresh()
+        self.group.target_set.remove(self.a)
+        self.assertMatchesFresh()
+
+        self.a.birth_month, self.a.birth_day = 3, 4
+        self.a.save()
+        self.assertMatchesFresh()
+
+        self.b.delete()
+        self.assertMatchesFresh()
+        self.group.delete()
+        self.assertMatchesFresh()
+
+
+class TagResolutionTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.food = Tag.objects.create(user=self.user, name='food')
+
+    def test_resolve_creates_missing_once(self):
+        other = CustomUser.objects.create_user(username='other', password='pw')
+        Tag.objects.create(user=other, name='late')
+        with self.assertNumQueries(3):
+            tags = resolve_tags(self.user, ['food', 'late', 'food'])
+        self.assertEqual(tags['food'], self.food)
+        self.assertEqual(tags['late'].user, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_tags(self.user, ['late', 'food']), tags)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_attach_in_one_insert(self):
+        target = Target.objects.create(user=self.user, nickname='a')
+        items = [TimelineItem.objects.create(target=target, date=datetime.date(2024, 1, i), content='x') for i in (1, 2)]
+        late = Tag.objects.create(user=CustomUser.objects.create_user(username='other'), name='late')
+        self.assertEqual(user_tags(self.user, [self.food.pk, late.pk, 'bad']), {self.food.pk: self.food})
+        items[0].tags.add(self.food)
+        with self.assertNumQueries(1):
+            attach_tags(self.user.pk, [(item.pk, self.food.pk) for item in items])
+        self.assertEqual(self.food.timelineitem_set.count(), 2)
+
+
+class SyntheticDataTests(TestCase):
+
+    def config(self, **kwargs):
+        from intelligence.synthetic import SyntheticConfig
+        return SyntheticConfig(**{'targets': 3, 'items': 4, 'questions': 5, 'tags': 3, 'image_ratio': 0, **kwargs})
+
+    def test_rebuild_is_scoped_to_generated_users(self):
+        from intelligence.models import AnniversaryOccurrence, TargetStats
+        from intelligence.stats import rebuild_all_stats
+        from intelligence.synthetic import generate
+
+        user = CustomUser.objects.create_user(username='agent', password='pw')
+        target = Target.objects.create(user=user, nickname='a', birth_month=5, birth_day=1)
+        TimelineItem.objects.create(target=target, date=datetime.date(2024, 5, 1), type='Note', content='x')
+        occurrence = AnniversaryOccurrence.objects.get(target=target)
+        stats_updated = TargetStats.objects.get(target=target).updated_at
+
+        synthetic = generate(self.config())[0]
+        self.assertTrue(AnniversaryOccurrence.objects.filter(pk=occurrence.pk).exists())
+        self.assertEqual(TargetStats.objects.get(target=target).updated_at, stats_updated)
+
+        stats = lambda: list(TargetStats.objects.filter(target__user=synthetic).order_by('target_id').values_list(
+            'target_id', 'log_count', 'contact_count', 'total_points', 'latest_item_date', 'real_last_contact',
+        ))
+        generated = stats()
+        self.assertEqual(len(generated), 3)
+        rebuild_all_stats()
+        self.assertEqual(generated, stats())
+
+    def test_generate_twice(self):
+        from intelligence.synthetic import generate
+
+        config = self.config()
+        user = generate(config)[0]
+        self.assertEqual(generate(config), [user])
+        self.assertEqual(Tag.objects.filter(user=user).count(), 3)
+        self.assertEqual(Target.objects.filter(user=user).count(), 6)
+        self.assertEqual(TimelineItem.objects.filter(target__user=user).count(), 24)
+
+
+@override_settings(DOSSIER_SINGLE_PROCESS=True)
+class CatalogTests(TestCase):
+
+    def setUp(self):
+        from core.testing import reset_caches
+        reset_caches()
+        self.agent = CustomUser.objects.create_user(username='agent', password='pw')
+        self.other = CustomUser.objects.create_user(username='other', password='pw')
+        self.master = CustomUser.objects.create_user(username='master', password='pw', role='MASTER')
+        self.private_category = QuestionCategory.objects.create(user=self.other, name='private')
+        self.own = Question.objects.create(user=self.agent, title='own')
+        self.private = Question.objects.create(user=self.other, title='private', category=self.private_category)
+        self.shared = Question.objects.create(user=self.other, title='shared', is_shared=True)
+        self.mastered = Question.objects.create(user=self.master, title='master')
+
+    def titles(self, user):
+        return {q.title for q in get_catalog(user).visible_questions()}
+
+    def test_visibility_by_role(self):
+        self.assertEqual(self.titles(self.agent), {'own', 'shared', 'master'})
+        self.assertEqual(self.titles(self.other), {'private', 'shared', 'master'})
+        self.assertIsNone(get_catalog(self.agent).visible_question(self.private.pk))
+        self.assertEqual([c.name for c in get_catalog(self.other).private_categories()], ['private'])
+        self.assertEqual(get_catalog(self.agent).visible_categories(), [])
+
+        self.master.role = 'AGENT'
+        self.master.save()
+        self.assertEqual(self.titles(self.agent), {'own', 'shared'})
+        self.other.role = 'MASTER'
+        self.other.save(update_fields=['role'])
+        self.assertEqual(self.titles(self.agent), {'own', 'shared', 'private'})
+        self.assertEqual([c.name for c in get_catalog(self.agent).shared_categories()], ['private'])
+        self.assertEqual(get_catalog(self.other).private_categories(), [])
+
+    def test_own_edit_rebuilds_only_its_owner(self):
+        for user in (self.agent, self.other):
+            get_catalog(user)
+        self.own.title = 'edited'
+        self.own.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(self.other), {'private', 'shared', 'master'})
+        self.assertEqual(self.titles(self.agent), {'edited', 'shared', 'master'})
+        rank = QuestionRank.objects.create(user=self.agent, name='S', points=10)
+        self.assertEqual([r.name for r in get_catalog(self.agent).user_ranks()], ['S'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog(self.other).user_ranks(), [])
+        rank.delete()
+        self.assertEqual(get_catalog(self.agent).user_ranks(), [])
+
+    def test_shared_edits_reach_everyone(self):
+        self.shared.title = 'renamed'
+        self.shared.save()
+        self.assertEqual(self.titles(self.agent), {'own', 'renamed', 'master'})
+        self.shared.is_shared = False
+        self.shared.save()
+        self.assertEqual(self.titles(self.agent), {'own', 'master'})
+        self.mastered.delete()
+        self.assertEqual(self.titles(self.agent), {'own'})
+
+        # A private category used by another user's question is in that user's catalog too
+        self.own.category = self.private_category
+        self.own.save()
+        self.private_category.name = 'renamed'
+        self.private_category.save()
+        self.assertEqual(get_catalog(self.agent).questions_by_id[self.own.pk].category.name, 'renamed')
+        self.private_category.delete()
+        self.assertIsNone(get_catalog(self.agent).questions_by_id[self.own.pk].category)
+
+    @override_settings(DOSSIER_SINGLE_PROCESS=False)
+    def test_process_local_versions_read_the_database(self):
+        get_catalog(self.agent)
+        Question.objects.filter(pk=self.own.pk).update(title='unsignalled')
+        self.assertEqual(self.titles(self.agent), {'unsignalled', 'shared', 'master'})
+
+
+class FullTextTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.target = Target.objects.create(user=self.user, nickname='t')
+        self.date = datetime.date(2024, 5, 1)
+
+    def item(self, **fields):
+        return TimelineItem.objects.create(target=self.target, date=self.date, type='Note', **fields)
+
+    def search(self, query, match):
+        from intelligence import fulltext
+        return set(TimelineItem.objects.filter(fulltext.search_filter(query, match)).values_list('content', flat=True))
+
+    def test_search_filter(self):
+        from intelligence import fulltext
+        self.item(content='駅前のカフェでランチ AB')
+        self.item(content='カフェ')
+        self.item(content='ランチ ab')
+        self.item(content='x', question_answer='カフェラテ')
+        self.assertEqual(fulltext.match_expression('カフェ 駅 ab'), '"カフェ"')
+        self.assertEqual(fulltext.match_expression('say "hi" there'), '"say" AND """hi""" AND "there"')
+        self.assertIsNone(fulltext.match_expression('駅 ab'))
+
+        # Terms under three characters (the trigram minimum) are matched with icontains
+        for query, expected in [
+            ('カフェ', {'駅前のカフェでランチ AB', 'カフェ', 'x'}),
+            ('カフェ ランチ', {'駅前のカフェでランチ AB'}),
+            ('ランチ ab', {'駅前のカフェでランチ AB', 'ランチ ab'}),
+        ]:
+            self.assertEqual(self.search(query, fulltext.match_expression(query)), expected)
+            # Same rows through icontains alone (no usable index)
+            self.assertEqual(self.search(query, None), expected)
+
+    def test_snippets_escape_markup(self):
+        from intelligence import fulltext
+        item = self.item(content='<b>カフェ</b> & ランチ')
+        other = self.item(content='ランチ')
+        hits = fulltext.snippets([item.pk, other.pk], fulltext.match_expression('カフェ'))
+        self.assertEqual(set(hits), {item.pk})
+        rank, snippet = hits[item.pk]
+        self.assertGreater(rank, 0)
+        self.assertTrue(snippet.startswith('&lt;b&gt;<mark>カフェ</mark>&lt;/b&gt; &amp; '))
+        self.assertEqual(fulltext.snippets([], '"カフェ"'), {})
+
+    def test_unsupported_tokenizer(self):
+        from intelligence import fulltext
+        self.assertTrue(fulltext.supported())
+        with mock.patch.object(fulltext, 'TOKENIZER', 'no_such_tokenizer'):
+            self.assertFalse(fulltext.supported())
+        # The failed probe left the surrounding transaction usable
+        self.item(content='カフェ')
+        self.assertEqual(self.search('カフェ', fulltext.match_expression('カフェ')), {'カフェ'})
+
+
+class NameSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.yamada = Target.objects.create(
+            user=self.user, nickname='Yamada Taro', last_name='山田', first_name='太郎',
+            last_name_kana='ヤマダ', first_name_kana='タロウ',
+        )
+        self.tanaka = Target.objects.create(user=self.user, nickname='タナカ', last_name_kana='ﾀﾅｶ')
+        self.otanaka = Target.objects.create(user=self.user, nickname='おたなか')
+        # Another user's target never matches
+        Target.objects.create(user=CustomUser.objects.create_user(username='other'), nickname='やまだ')
+
+    def find(self, query, prefix=False):
+        from intelligence.search import matching_target_ids
+        ids = matching_target_ids(self.user, query, prefix=prefix)
+        return None if ids is None else set(Target.objects.filter(pk__in=ids).values_list('nickname', flat=True))
+
+    def test_normalize(self):
+        from intelligence.search import normalize
+        self.assertEqual(normalize('ヤマダ'), 'やまだ')
+        self.assertEqual(normalize('ﾔﾏﾀﾞ'), 'やまだ')
+        self.assertEqual(normalize('ＹＡＭＡＤＡ　Ｔａｒｏ'), 'yamadataro')
+        self.assertEqual(normalize(' ヽヾ\n'), 'ゝゞ')
+        self.assertEqual(normalize(None), '')
+
+    def test_kana_and_width_variants(self):
+        for query in ['やまだ', 'ヤマダ', 'ﾔﾏﾀﾞ', 'たろう']:
+            self.assertEqual(self.find(query), {'Yamada Taro'}, query)
+        self.assertEqual(self.find('ｔａｎａｋａ'), set())
+        self.assertEqual(self.find('たなか'), {'タナカ', 'おたなか'})
+        self.assertEqual(self.find('ﾀﾅｶ'), {'タナカ', 'おたなか'})
+
+    def test_case_and_whitespace(self):
+        self.assertEqual(self.find('YAMADA TARO'), {'Yamada Taro'})
+        self.assertEqual(self.find('ada ta'), {'Yamada Taro'})
+        self.assertEqual(self.find('山田 太郎'), {'Yamada Taro'})
+        self.assertEqual(self.find('田太'), {'Yamada Taro'})
+        self.assertEqual(self.find('山'), {'Yamada Taro'})
+        # Every gram present, but not contiguous
+        self.assertEqual(self.find('だや'), set())
+        self.assertIsNone(self.find(' 　'))
+
+    def test_prefix(self):
+        self.assertEqual(self.find('たなか', prefix=True), {'タナカ'})
+        self.assertEqual(self.find('おた', prefix=True), {'おたなか'})
+        # Any name field can match at its start
+        self.assertEqual(self.find('たろ', prefix=True), set())
+        self.assertEqual(self.find('やまだ', prefix=True), {'Yamada Taro'})
+        self.assertEqual(self.find('yama', prefix=True), {'Yamada Taro'})
+
+    def test_index_follows_renames(self):
+        self.tanaka.nickname = 'スズキ'
+        self.tanaka.last_name_kana = ''
+        self.tanaka.save()
+        self.assertEqual(self.find('たなか'), {'おたなか'})
+        self.assertEqual(self.find('すずき'), {'スズキ'})
+        self.otanaka.delete()
+        self.assertEqual(self.find('たなか'), set())
+
+
+class AnniversaryTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        for nickname, month, day in [('dec', 12, 31), ('jan', 1, 1), ('leap', 2, 29), ('mar', 3, 1)]:
+            Target.objects.create(user=self.user, nickname=nickname, birth_year=2000, birth_month=month, birth_day=day)
+        self.jan = Target.objects.get(nickname='jan')
+        self.wedding = CustomAnniversary.objects.create(target=self.jan, label='wedding', date=datetime.date(2010, 1, 3))
+        # Another user's birthdays never show up
+        Target.objects.create(user=CustomUser.objects.create_user(username='other'), nickname='x', birth_month=1, birth_day=1)
+
+    def between(self, start, end):
+        from intelligence.anniversaries import occurrences_between
+        return [(o.date.isoformat(), o.label if o.anniversary_id else o.target.nickname) for o in occurrences_between(self.user, start, end)]
+
+    def on(self, date):
+        from intelligence.anniversaries import occurrences_on
+        return sorted(o.target.nickname for o in occurrences_on(self.user, date))
+
+    def test_window_wraps_year_end(self):
+        with self.assertNumQueries(1):
+            occurrences = self.between(datetime.date(2023, 12, 30), datetime.date(2024, 1, 3))
+        self.assertEqual(occurrences, [('2023-12-31', 'dec'), ('2024-01-01', 'jan'), ('2024-01-03', 'wedding')])
+        self.assertEqual(self.between(datetime.date(2023, 12, 31), datetime.date(2023, 12, 31)), [('2023-12-31', 'dec')])
+        self.assertEqual(self.between(datetime.date(2024, 1, 2), datetime.date(2023, 12, 30)), [])
+
+    def test_feb_29_in_non_leap_years(self):
+        # Observed on Mar 1 in non-leap years, on Feb 29 otherwise
+        self.assertEqual(self.on(datetime.date(2023, 2, 28)), [])
+        self.assertEqual(self.on(datetime.date(2023, 3, 1)), ['leap', 'mar'])
+        self.assertEqual(self.on(datetime.date(2024, 2, 29)), ['leap'])
+        self.assertEqual(self.on(datetime.date(2024, 3, 1)), ['mar'])
+        self.assertEqual(self.on(datetime.date(2100, 3, 1)), ['leap', 'mar'])
+        self.assertCountEqual(
+            self.between(datetime.date(2023, 3, 1), datetime.date(2023, 3, 5)), [('2023-03-01', 'leap'), ('2023-03-01', 'mar')],
+        )
+        self.assertEqual(self.between(datetime.date(2023, 2, 20), datetime.date(2023, 2, 28)), [])
+        self.assertEqual(self.between(datetime.date(2024, 3, 1), datetime.date(2024, 3, 5)), [('2024-03-01', 'mar')])
+        self.assertEqual(self.between(datetime.date(2023, 3, 2), datetime.date(2024, 2, 28))[-1], ('2024-01-03', 'wedding'))
+
+    def test_long_windows(self):
+        # A year or more: every row matches, once per year the window covers
+        year = self.between(datetime.date(2023, 1, 1), datetime.date(2024, 1, 1))
+        self.assertEqual(year[:2], [('2023-01-01', 'jan'), ('2023-01-03', 'wedding')])
+        self.assertCountEqual(year[2:4], [('2023-03-01', 'leap'), ('2023-03-01', 'mar')])
+        self.assertEqual(year[4:], [('2023-12-31', 'dec'), ('2024-01-01', 'jan')])
+        two_years = self.between(datetime.date(2023, 6, 1), datetime.date(2025, 5, 31))
+        self.assertEqual(len(two_years), 10)
+        self.assertIn(('2024-02-29', 'leap'), two_years)
+        self.assertIn(('2025-03-01', 'leap'), two_years)
+
+    def test_sync_on_birthday_changes(self):
+        from intelligence.models import AnniversaryOccurrence
+        dec = Target.objects.get(nickname='dec')
+        dec.birth_month, dec.birth_day = 7, 4
+        dec.save()
+        self.assertEqual(self.on(datetime.date(2023, 12, 31)), [])
+        self.assertEqual(self.on(datetime.date(2023, 7, 4)), ['dec'])
+
+        dec.birth_day = None
+        dec.save()
+        self.assertEqual(self.on(datetime.date(2023, 7, 4)), [])
+        self.assertFalse(AnniversaryOccurrence.objects.filter(target=dec).exists())
+        dec.birth_day = 5
+        dec.save()
+        self.assertEqual(self.on(datetime.date(2023, 7, 5)), ['dec'])
+
+        self.wedding.date = datetime.date(2010, 6, 30)
+        self.wedding.label = 'anniversary'
+        self.wedding.save()
+        self.assertEqual(self.between(datetime.date(2023, 6, 30), datetime.date(2023, 6, 30)), [('2023-06-30', 'anniversary')])
+        self.assertEqual(self.between(datetime.date(2024, 1, 3), datetime.date(2024, 1, 3)), [])
+        self.wedding.delete()
+        self.assertEqual(self.between(datetime.date(2023, 6, 30), datetime.date(2023, 6, 30)), [])
+
+
+class TargetStatsTests(TestCase):
+    """The incremental create / edit / delete path ends where recalculate_target_stats() does."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='agent', password='pw')
+        self.target = Target.objects.create(user=self.user, nickname='t')
+        rank = QuestionRank.objects.create(user=self.user, name='A', points=5)
+        self.question = Question.objects.create(user=self.user, title='q', rank=rank)
+
+    def item(self, day, **fields):
+        return TimelineItem.objects.create(target=self.target, date=datetime.date(2024, 5, day), **{'type': 'Note', **fields})
+
+    def answer(self, day, content='yes'):
+        return self.item(day, type='Question', question=self.question, content=content)
+
+    def assertMaintained(self, **expected):
+        from intelligence.models import TargetStats
+        from intelligence.stats import recalculate_target_stats
+        fields = [
+            'log_count', 'contact_count', 'total_points', 'answered_question_count',
+            'latest_message', 'latest_item_date', 'latest_item_created_at', 'real_last_contact',
+        ]
+        maintained = TargetStats.objects.filter(target=self.target).values(*fields).get()
+        recalculate_target_stats(self.target.pk)
+        self.assertEqual(maintained, TargetStats.objects.filter(target=self.target).values(*fields).get())
+        for name, value in expected.items():
+            self.assertEqual(maintained[name], value, name)
+
+    def test_latest_item_tie_on_the_same_date(self):
+        first = self.item(3, content='first')
+        self.assertMaintained(latest_message='first', log_count=1)
+        second = self.item(3, content='second')
+        self.assertMaintained(latest_message='second', log_count=2)
+        self.item(1, content='older')
+        self.assertMaintained(latest_message='second', log_count=3)
+        second.delete()
+        self.assertMaintained(latest_message='first', latest_item_date=datetime.date(2024, 5, 3))
+        first.content = 'edited'
+        first.save()
+        self.assertMaintained(latest_message='edited')
+        first.delete()
+        self.assertMaintained(latest_message='older', latest_item_date=datetime.date(2024, 5, 1), log_count=1)
+
+    def test_deleting_the_latest_contact(self):
+        early = self.item(1, contact_made=True)
+        late = self.item(4, contact_made=True)
+        self.item(6)
+        self.assertMaintained(contact_count=2, real_last_contact=datetime.date(2024, 5, 4))
+        late.delete()
+        self.assertMaintained(contact_count=1, real_last_contact=datetime.date(2024, 5, 1))
+        early.contact_made = False
+        early.save()
+        self.assertMaintained(contact_count=0, real_last_contact=None)
+        early.contact_made = True
+        early.date = datetime.date(2024, 5, 9)
+        early.save()
+        self.assertMaintained(contact_count=1, real_last_contact=datetime.date(2024, 5, 9))
+        early.delete()
+        self.assertMaintained(contact_count=0, real_last_contact=None, log_count=1)
+
+    def test_answered_question_count(self):
+        first = self.answer(1)
+        self.assertMaintained(answered_question_count=1, total_points=5)
+        second = self.answer(2, content='again')
+        self.assertMaintained(answered_question_count=1, total_points=10, latest_message='again')
+        other = Question.objects.create(user=self.user, title='other')
+        self.item(3, type='Question', question=other)
+        self.assertMaintained(answered_question_count=2, total_points=10)
+        first.delete()
+        self.assertMaintained(answered_question_count=2, total_points=5)
+        second.type = 'Note'
+        second.save()
+        self.assertMaintained(answered_question_count=1, total_points=0)
+        second.delete()
+        self.assertMaintained(answered_question_count=1, log_count=1)
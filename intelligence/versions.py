@@ -0,0 +1,155 @@
+"""
+Change versions.
+
+Monotonically increasing counters stored in the shared cache and bumped (via
+intelligence.signals) whenever the data they cover changes:
+
+* one counter per user, for that user's intelligence data
+* one counter per target, for the target and its timeline (items, images,
+  tag links, answers)
+* one "shared" counter per user, for data shown under every target of the
+  user (tag names): a target's version is only meaningful together with it
+* one global counter for the shared question catalog (shared and MASTER-owned
+  questions and categories, visible to everyone)
+* one catalog counter per user, for the user's own questions, categories and
+  ranks: the catalog a user sees depends on it and on the shared counter
+
+Cached read models embed the relevant version in their key, so a bump
+invalidates them without having to enumerate or delete entries. The time of
+the last bump of every counter is kept next to it (Last-Modified headers).
+
+All of that only holds when every process reads the same counters: with a
+process-local backend a bump is invisible to the other workers, so callers
+check versions_shared() and skip their caches otherwise.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = 'dossier:catalog:version'
+
+
+def version_cache():
+    return caches[getattr(settings, 'DOSSIER_CACHE_ALIAS', 'default')]
+
+
+def versions_shared():
+    """
+    Whether the counters are the same for every process serving requests: a
+    shared backend, or a process-local one when settings.DOSSIER_SINGLE_PROCESS
+    declares a single process. DummyCache keeps no counters at all.
+    """
+    cache = version_cache()
+    if isinstance(cache, DummyCache):
+        return False
+    return getattr(settings, 'DOSSIER_SINGLE_PROCESS', False) or not isinstance(cache, LocMemCache)
+
+
+def user_version_key(user_id):
+    return f'dossier:user:{user_id}:version'
+
+
+def target_version_key(target_id):
+    return f'dossier:target:{target_id}:version'
+
+
+def shared_version_key(user_id):
+    return f'dossier:user:{user_id}:shared:version'
+
+
+def user_catalog_version_key(user_id):
+    return f'dossier:user:{user_id}:catalog:version'
+
+
+def catalog_version_keys(user_id):
+    """Counters of the question catalog user_id sees (intelligence.catalog)."""
+    return [CATALOG_VERSION_KEY, user_catalog_version_key(user_id)]
+
+
+def _modified_key(key):
+    return f'{key}:modified'
+
+
+def _seed():
+    # Time based seed: a counter lost to eviction never restarts at a value used before
+    return int(time.time() * 1000)
+
+
+def _get(key):
+    cache = version_cache()
+    version = cache.get(key)
+    if version is None:
+        # Unknown counter: anything may have changed, so it counts as modified now
+        cache.add(_modified_key(key), time.time(), timeout=None)
+        cache.add(key, _seed(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _incr(key):
+    cache = version_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _seed(), timeout=None)
+    cache.set(_modified_key(key), time.time(), timeout=None)
+
+
+def _bump(key):
+    _incr(key)
+    if transaction.get_connection().in_atomic_block:
+        # Until the commit, readers can pair the new version with the old data: bump again once it is visible
+        transaction.on_commit(lambda: _incr(key))
+
+
+def get_versions(keys):
+    """[version, ...] of several counters, in one cache read when they are all known."""
+    known = version_cache().get_many(keys)
+    return [known[key] if key in known else _get(key) for key in keys]
+
+
+def get_last_modified(keys):
+    """Time (epoch seconds) of the latest bump among the counters, None if unknown."""
+    stamps = version_cache().get_many([_modified_key(key) for key in keys]).values()
+    return max(stamps, default=None)
+
+
+def get_user_version(user_id):
+    return _get(user_version_key(user_id))
+
+
+def bump_user_version(user_id):
+    if user_id is None: return
+    _bump(user_version_key(user_id))
+
+
+def bump_target_version(target_id):
+    if target_id is None: return
+    _bump(target_version_key(target_id))
+
+
+def bump_shared_version(user_id):
+    if user_id is None: return
+    _bump(shared_version_key(user_id))
+
+
+def get_catalog_version():
+    return _get(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump(CATALOG_VERSION_KEY)
+
+
+def get_catalog_versions(user_id):
+    """[shared catalog version, user catalog version]"""
+    return get_versions(catalog_version_keys(user_id))
+
+
+def bump_user_catalog_version(user_id):
+    if user_id is None: return
+    _bump(user_catalog_version_key(user_id))